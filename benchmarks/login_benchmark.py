@@ -0,0 +1,82 @@
+"""
+Measure login throughput of a running PhotoShare server under concurrency, together with
+the latency of a cheap endpoint requested at the same time. While bcrypt ran on the event
+loop that latency grew with every concurrent login. With the hashing pool it stays flat.
+
+The account must exist and be confirmed:
+
+    uvicorn main:app --workers 1
+    python -m benchmarks.login_benchmark --base-url http://localhost:8000 \\
+        --email user@example.com --password secret --concurrency 32 --requests 256
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def login_worker(client: httpx.AsyncClient, form: dict, jobs: asyncio.Queue, timings: list, errors: list):
+    while True:
+        try:
+            jobs.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        started = time.perf_counter()
+        response = await client.post("/api/auth/login", data=form)
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 202:
+            errors.append(response.status_code)
+
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event, timings: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get("/api/healthchecker")
+        timings.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.05)
+
+
+async def main(base_url: str, email: str, password: str, concurrency: int, requests: int) -> None:
+    form = {"username": email, "password": password}
+    jobs = asyncio.Queue()
+    for number in range(requests):
+        jobs.put_nowait(number)
+    login_ms, probe_ms, errors = [], [], []
+    stop = asyncio.Event()
+
+    limits = httpx.Limits(max_connections=concurrency + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        probe_task = asyncio.create_task(probe(client, stop, probe_ms))
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(login_worker(client, form, jobs, login_ms, errors) for _ in range(concurrency))
+        )
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe_task
+
+    print(f"{requests} logins, concurrency {concurrency}, {elapsed:.2f} s")
+    print(f"throughput       {requests / elapsed:>8.1f} logins/s")
+    print(f"login latency    p50 {statistics.median(login_ms):>8.1f} ms   p95 {percentile(login_ms, 0.95):>8.1f} ms")
+    if probe_ms:
+        print(f"probe latency    p50 {statistics.median(probe_ms):>8.1f} ms   p95 {percentile(probe_ms, 0.95):>8.1f} ms")
+    if errors:
+        print(f"failed logins    {len(errors)} (status codes {sorted(set(errors))})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", required=True, help="URL of the running server")
+    parser.add_argument("--email", required=True, help="email of a confirmed account")
+    parser.add_argument("--password", required=True, help="password of the account")
+    parser.add_argument("--concurrency", type=int, default=32, help="logins in flight at once")
+    parser.add_argument("--requests", type=int, default=256, help="total number of logins")
+    args = parser.parse_args()
+    asyncio.run(main(args.base_url, args.email, args.password, args.concurrency, args.requests))
@@ -8,16 +8,23 @@ from fastapi.staticfiles import StaticFiles
 from fastapi_limiter import FastAPILimiter
 from fastapi.templating import Jinja2Templates
 
-import redis.asyncio as redis
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.middleware.cors import CORSMiddleware
 
-from src.database.db import get_db
+from src.database.db import STICKY_COOKIE, client_key, get_db, sessionmanager
 from src.utils import messages
 
 from src.conf.config import config
-from src.routes import comment_routes, auth_routes, photo_routes, user_routes, tags_routes
+from src.conf.messages import LENGTH_REQUIRED, UPLOAD_TOO_LARGE
+from src.services import jobs  # noqa: F401, registers the background tasks
+from src.services.comment_stream import comment_hub
+from src.services.password_service import password_hasher
+from src.services.tag_dictionary import tag_dictionary
+from src.services.redis_service import redis_client
+from src.services.upload_service import request_size_limit
+from src.services.transform_service import transform_engine
+from src.routes import comment_routes, auth_routes, photo_routes, user_routes, tags_routes, metrics_routes, jobs_routes
 
 app = FastAPI()
 origins = ["*"]
@@ -47,8 +54,37 @@ async def user_agent_ban_middleware(request: Request, call_next: Callable):
     except Exception as exc:
         return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"detail": "Internal Server Error"})
 
+
+@app.middleware("http")
+async def read_your_writes_middleware(request: Request, call_next: Callable):
+    response = await call_next(request)
+    if (
+        sessionmanager.has_replicas
+        and request.method not in ("GET", "HEAD", "OPTIONS")
+        and response.status_code < 400
+    ):
+        key = client_key(request)
+        if key:
+            sessionmanager.stick_to_primary(key)
+        response.set_cookie(STICKY_COOKIE, "1", max_age=int(config.DB_STICKY_SECONDS) or 1, httponly=True)
+    return response
+
+
+@app.middleware("http")
+async def upload_size_middleware(request: Request, call_next: Callable):
+    limit = request_size_limit(request.url.path)
+    content_length = request.headers.get("content-length")
+    if limit and not (content_length and content_length.isdigit()):
+        return JSONResponse(status_code=status.HTTP_411_LENGTH_REQUIRED, content={"detail": LENGTH_REQUIRED})
+    if limit and int(content_length) > limit:
+        return JSONResponse(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, content={"detail": UPLOAD_TOO_LARGE})
+    return await call_next(request)
+
 BASE_DIR = Path(__file__).parent
 directory = BASE_DIR.joinpath("src").joinpath("static")
+if config.STORAGE_BACKEND == "local":
+    Path(config.LOCAL_STORAGE_DIR).mkdir(parents=True, exist_ok=True)
+    app.mount(config.LOCAL_STORAGE_URL, StaticFiles(directory=config.LOCAL_STORAGE_DIR), name="media")
 app.mount("/static", StaticFiles(directory=directory), name="static")
 
 app.include_router(auth_routes.router, prefix="/api")
@@ -56,21 +92,25 @@ app.include_router(user_routes.router, prefix="/api")
 app.include_router(photo_routes.router, prefix='/api')
 app.include_router(comment_routes.router, prefix='/api')
 app.include_router(tags_routes.router, prefix='/api')
+app.include_router(metrics_routes.router, prefix='/api')
+app.include_router(jobs_routes.router, prefix='/api')
 
 
 @app.on_event("startup")
 async def startup():
     try:
-        r = await redis.Redis(
-            host=config.REDIS_DOMAIN,
-            port=config.REDIS_PORT,
-            db=0,
-            password=config.REDIS_PASSWORD
-        )
-        await FastAPILimiter.init(r)
+        await FastAPILimiter.init(redis_client)
     except Exception as e:
         print("Error during startup:", e)
 
+@app.on_event("shutdown")
+async def shutdown():
+    await comment_hub.close()
+    await tag_dictionary.close()
+    transform_engine.shutdown()
+    password_hasher.shutdown()
+
+
 templates = Jinja2Templates(directory=BASE_DIR / 'src' / 'templates')
 
 
@@ -0,0 +1,152 @@
+"""Image full-text search vector
+
+Revision ID: 3c9f1d2a7b41
+Revises: ad36b2005ba8
+Create Date: 2026-10-17 10:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9f1d2a7b41'
+down_revision: Union[str, None] = 'ad36b2005ba8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# images.search_vector holds the description (weight A), the tag names (B) and the
+# comment texts (C) of an image. It is recomputed by triggers whenever one of them changes.
+SEARCH_DOCUMENT_FUNCTION = """
+CREATE OR REPLACE FUNCTION images_search_document(target_id integer, target_description text)
+RETURNS tsvector AS $$
+    SELECT
+        setweight(to_tsvector('simple', coalesce(target_description, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce((
+            SELECT string_agg(tags.tag_name, ' ')
+            FROM image_m2m_tag JOIN tags ON tags.id = image_m2m_tag.tag_id
+            WHERE image_m2m_tag.image_id = target_id
+        ), '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce((
+            SELECT string_agg(comments.comment, ' ')
+            FROM comments
+            WHERE comments.image_id = target_id
+        ), '')), 'C')
+$$ LANGUAGE sql STABLE;
+"""
+
+REFRESH_FUNCTION = """
+CREATE OR REPLACE FUNCTION images_search_vector_refresh(target_id integer) RETURNS void AS $$
+    UPDATE images
+    SET search_vector = images_search_document(images.id, images.description)
+    WHERE images.id = target_id;
+$$ LANGUAGE sql;
+"""
+
+IMAGES_TRIGGER = (
+"""
+CREATE OR REPLACE FUNCTION images_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := images_search_document(NEW.id, NEW.description);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+""",
+"""
+CREATE TRIGGER images_search_vector_update
+BEFORE INSERT OR UPDATE OF description ON images
+FOR EACH ROW EXECUTE FUNCTION images_search_vector_trigger();
+""",
+)
+
+IMAGE_TAGS_TRIGGER = (
+"""
+CREATE OR REPLACE FUNCTION image_m2m_tag_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM images_search_vector_refresh(NEW.image_id);
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        PERFORM images_search_vector_refresh(OLD.image_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+""",
+"""
+CREATE TRIGGER image_m2m_tag_search_vector_update
+AFTER INSERT OR UPDATE OR DELETE ON image_m2m_tag
+FOR EACH ROW EXECUTE FUNCTION image_m2m_tag_search_vector_trigger();
+""",
+)
+
+COMMENTS_TRIGGER = (
+"""
+CREATE OR REPLACE FUNCTION comments_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM images_search_vector_refresh(NEW.image_id);
+    END IF;
+    IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.image_id IS DISTINCT FROM NEW.image_id) THEN
+        PERFORM images_search_vector_refresh(OLD.image_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+""",
+"""
+CREATE TRIGGER comments_search_vector_update
+AFTER INSERT OR UPDATE OF comment, image_id OR DELETE ON comments
+FOR EACH ROW EXECUTE FUNCTION comments_search_vector_trigger();
+""",
+)
+
+TAGS_TRIGGER = (
+"""
+CREATE OR REPLACE FUNCTION tags_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    PERFORM images_search_vector_refresh(image_m2m_tag.image_id)
+    FROM image_m2m_tag
+    WHERE image_m2m_tag.tag_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+""",
+"""
+CREATE TRIGGER tags_search_vector_update
+AFTER UPDATE OF tag_name ON tags
+FOR EACH ROW EXECUTE FUNCTION tags_search_vector_trigger();
+""",
+)
+
+
+def upgrade() -> None:
+    op.add_column('images', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.execute(SEARCH_DOCUMENT_FUNCTION)
+    op.execute(REFRESH_FUNCTION)
+    for trigger in (IMAGES_TRIGGER, IMAGE_TAGS_TRIGGER, COMMENTS_TRIGGER, TAGS_TRIGGER):
+        for statement in trigger:
+            op.execute(statement)
+    op.execute("UPDATE images SET search_vector = images_search_document(id, description)")
+    op.create_index(
+        'ix_images_search_vector', 'images', ['search_vector'], postgresql_using='gin'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_images_search_vector', table_name='images', postgresql_using='gin')
+    op.execute("DROP TRIGGER IF EXISTS tags_search_vector_update ON tags")
+    op.execute("DROP TRIGGER IF EXISTS comments_search_vector_update ON comments")
+    op.execute("DROP TRIGGER IF EXISTS image_m2m_tag_search_vector_update ON image_m2m_tag")
+    op.execute("DROP TRIGGER IF EXISTS images_search_vector_update ON images")
+    op.execute("DROP FUNCTION IF EXISTS tags_search_vector_trigger()")
+    op.execute("DROP FUNCTION IF EXISTS comments_search_vector_trigger()")
+    op.execute("DROP FUNCTION IF EXISTS image_m2m_tag_search_vector_trigger()")
+    op.execute("DROP FUNCTION IF EXISTS images_search_vector_trigger()")
+    op.execute("DROP FUNCTION IF EXISTS images_search_vector_refresh(integer)")
+    op.execute("DROP FUNCTION IF EXISTS images_search_document(integer, text)")
+    op.drop_column('images', 'search_vector')
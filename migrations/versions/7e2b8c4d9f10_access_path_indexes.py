@@ -0,0 +1,67 @@
+"""Indexes for foreign keys and access paths
+
+Revision ID: 7e2b8c4d9f10
+Revises: 3c9f1d2a7b41
+Create Date: 2026-10-17 11:03:52.540917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e2b8c4d9f10'
+down_revision: Union[str, None] = '3c9f1d2a7b41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The unique index below would fail on tags attached twice to the same image.
+    op.execute(
+        """
+        DELETE FROM image_m2m_tag a
+        USING image_m2m_tag b
+        WHERE a.image_id = b.image_id AND a.tag_id = b.tag_id AND a.id > b.id
+        """
+    )
+    # CONCURRENTLY keeps the tables writable while the indexes are built,
+    # but it cannot run inside the migration transaction.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_images_user_id_created_at', 'images',
+            ['user_id', sa.text('created_at DESC')],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_images_created_at_id', 'images', ['created_at', 'id'],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_comments_image_id_created_at', 'comments', ['image_id', 'created_at'],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_comments_user_id', 'comments', ['user_id'],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_image_m2m_tag_image_id_tag_id', 'image_m2m_tag', ['image_id', 'tag_id'],
+            unique=True, postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_image_m2m_tag_tag_id', 'image_m2m_tag', ['tag_id'],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_image_m2m_tag_tag_id', table_name='image_m2m_tag', postgresql_concurrently=True)
+        op.drop_index('ix_image_m2m_tag_image_id_tag_id', table_name='image_m2m_tag', postgresql_concurrently=True)
+        op.drop_index('ix_comments_user_id', table_name='comments', postgresql_concurrently=True)
+        op.drop_index('ix_comments_image_id_created_at', table_name='comments', postgresql_concurrently=True)
+        op.drop_index('ix_images_created_at_id', table_name='images', postgresql_concurrently=True)
+        op.drop_index('ix_images_user_id_created_at', table_name='images', postgresql_concurrently=True)
@@ -0,0 +1,40 @@
+"""Denormalized image, comment and tag counters
+
+Revision ID: a4d2c6e8f013
+Revises: 9e1f5a7b3c48
+Create Date: 2026-10-17 20:03:27.914466
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d2c6e8f013'
+down_revision: Union[str, None] = '9e1f5a7b3c48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('images', sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('images', sa.Column('tag_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('image_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        """
+        UPDATE images SET
+            comment_count = (SELECT count(*) FROM comments WHERE comments.image_id = images.id),
+            tag_count = (SELECT count(*) FROM image_m2m_tag WHERE image_m2m_tag.image_id = images.id)
+        """
+    )
+    op.execute(
+        "UPDATE users SET image_count = (SELECT count(*) FROM images WHERE images.user_id = users.id)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'image_count')
+    op.drop_column('images', 'tag_count')
+    op.drop_column('images', 'comment_count')
@@ -0,0 +1,115 @@
+"""Separate comment search vector
+
+Revision ID: e5c8a2f4b617
+Revises: a4d2c6e8f013
+Create Date: 2026-10-17 23:41:08.532917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5c8a2f4b617'
+down_revision: Union[str, None] = 'a4d2c6e8f013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# images.search_vector keeps the description (weight A) and the tag names (B) only. Every
+# comment gets its own vector (C), computed from the comment row alone, so a comment write
+# no longer re-reads all the other comments of the image.
+SEARCH_DOCUMENT_FUNCTION = """
+CREATE OR REPLACE FUNCTION images_search_document(target_id integer, target_description text)
+RETURNS tsvector AS $$
+    SELECT
+        setweight(to_tsvector('simple', coalesce(target_description, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce((
+            SELECT string_agg(tags.tag_name, ' ')
+            FROM image_m2m_tag JOIN tags ON tags.id = image_m2m_tag.tag_id
+            WHERE image_m2m_tag.image_id = target_id
+        ), '')), 'B')
+$$ LANGUAGE sql STABLE;
+"""
+
+COMMENTS_TRIGGER = (
+"""
+CREATE OR REPLACE FUNCTION comments_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := setweight(to_tsvector('simple', coalesce(NEW.comment, '')), 'C');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+""",
+"""
+CREATE TRIGGER comments_search_vector_update
+BEFORE INSERT OR UPDATE OF comment ON comments
+FOR EACH ROW EXECUTE FUNCTION comments_search_vector_trigger();
+""",
+)
+
+# As created by migration 3c9f1d2a7b41.
+OLD_SEARCH_DOCUMENT_FUNCTION = """
+CREATE OR REPLACE FUNCTION images_search_document(target_id integer, target_description text)
+RETURNS tsvector AS $$
+    SELECT
+        setweight(to_tsvector('simple', coalesce(target_description, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce((
+            SELECT string_agg(tags.tag_name, ' ')
+            FROM image_m2m_tag JOIN tags ON tags.id = image_m2m_tag.tag_id
+            WHERE image_m2m_tag.image_id = target_id
+        ), '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce((
+            SELECT string_agg(comments.comment, ' ')
+            FROM comments
+            WHERE comments.image_id = target_id
+        ), '')), 'C')
+$$ LANGUAGE sql STABLE;
+"""
+
+OLD_COMMENTS_TRIGGER = (
+"""
+CREATE OR REPLACE FUNCTION comments_search_vector_trigger() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM images_search_vector_refresh(NEW.image_id);
+    END IF;
+    IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.image_id IS DISTINCT FROM NEW.image_id) THEN
+        PERFORM images_search_vector_refresh(OLD.image_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+""",
+"""
+CREATE TRIGGER comments_search_vector_update
+AFTER INSERT OR UPDATE OF comment, image_id OR DELETE ON comments
+FOR EACH ROW EXECUTE FUNCTION comments_search_vector_trigger();
+""",
+)
+
+
+def upgrade() -> None:
+    op.add_column('comments', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.execute("DROP TRIGGER IF EXISTS comments_search_vector_update ON comments")
+    op.execute(SEARCH_DOCUMENT_FUNCTION)
+    for statement in COMMENTS_TRIGGER:
+        op.execute(statement)
+    op.execute("UPDATE comments SET search_vector = setweight(to_tsvector('simple', comment), 'C')")
+    op.execute("UPDATE images SET search_vector = images_search_document(id, description)")
+    op.create_index(
+        'ix_comments_search_vector', 'comments', ['search_vector'], postgresql_using='gin'
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_comments_search_vector', table_name='comments', postgresql_using='gin')
+    op.execute("DROP TRIGGER IF EXISTS comments_search_vector_update ON comments")
+    op.execute(OLD_SEARCH_DOCUMENT_FUNCTION)
+    for statement in OLD_COMMENTS_TRIGGER:
+        op.execute(statement)
+    op.execute("UPDATE images SET search_vector = images_search_document(id, description)")
+    op.drop_column('comments', 'search_vector')
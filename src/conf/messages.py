@@ -36,4 +36,16 @@ NO_COMMENTS_ON_THIS_ID = "There are no pinned comments on this ID"
 ERROR_CREATING_COMMENT = "Error creating comment"
 NOT_AUTHORIZED_DELETE = "Not authorized to delete this image"
 NOT_ALLOWED = "Can`t update someones picture"
-NOT_AUTHORIZED_ACCESS = "Not authorized access"
\ No newline at end of file
+NOT_AUTHORIZED_ACCESS = "Not authorized access"
+INVALID_CURSOR = "Invalid pagination cursor"
+UPLOAD_QUEUE_FULL = "Too many uploads in progress, try again later"
+TOO_MANY_FILES = "Too many files in one batch"
+UPLOAD_TOO_LARGE = "File is too large"
+LENGTH_REQUIRED = "Content-Length header is required"
+NO_FILES = "No files uploaded"
+UPLOAD_NOT_FOUND = "Upload not found"
+INVALID_PART = "Invalid part number"
+CHUNK_SIZE_MISMATCH = "Part size does not match the upload"
+CHUNK_CHECKSUM_MISMATCH = "Checksum mismatch"
+UPLOAD_INCOMPLETE = "Not all parts have been uploaded"
+JOB_NOT_FOUND = "Job not found"
@@ -1,34 +1,195 @@
+import asyncio
 import contextlib
+import hashlib
+import time
 
-from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from fastapi import Request
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session
 
 from src.conf.config import config
+from src.database.pool import TimedQueuePool, pool_stats
+from src.services.cache_service import LRUCache
 from src.utils import messages 
 
 
-class DatabaseSessionManager:
+def engine_options(url: str) -> tuple[URL, dict]:
+    """
+    Build the engine URL and keyword arguments from the DB_POOL_* and DB_STATEMENT_* settings.
+
+    SQLite keeps the SQLAlchemy defaults. asyncpg also gets its statement caches and a
+    server-side statement_timeout.
+    """
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        return url, {}
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+    }
+    if url.get_driver_name() == "asyncpg":
+        # Both caches must be 0 behind pgbouncer in transaction pooling mode.
+        url = url.update_query_dict(
+            {"prepared_statement_cache_size": str(config.DB_STATEMENT_CACHE_SIZE)}
+        )
+        connect_args = {"statement_cache_size": config.DB_STATEMENT_CACHE_SIZE}
+        if config.DB_STATEMENT_TIMEOUT_MS:
+            connect_args["server_settings"] = {"statement_timeout": str(config.DB_STATEMENT_TIMEOUT_MS)}
+        options["connect_args"] = connect_args
+    return url, options
+
+
+STICKY_COOKIE = "primary_reads"
+
+
+class Replica:
     def __init__(self, url: str):
-        self._engine: AsyncEngine | None = create_async_engine(url)
+        url, options = engine_options(url)
+        self.engine: AsyncEngine = create_async_engine(url, **options)
+        self.session_maker: async_sessionmaker = async_sessionmaker(
+            autoflush=False, autocommit=False, bind=self.engine, info={"replica": True}
+        )
+        self.retry_at = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.retry_at <= time.monotonic()
+
+
+class DatabaseSessionManager:
+    def __init__(self, url: str, replica_urls: list[str] | None = None):
+        url, options = engine_options(url)
+        self._engine: AsyncEngine | None = create_async_engine(url, **options)
         self._session_maker: async_sessionmaker = async_sessionmaker(autoflush=False, autocommit=False, bind=self._engine)
-    
+        self._replicas = [Replica(replica_url) for replica_url in replica_urls or []]
+        self._next_replica = 0
+        # Clients that wrote recently, see stick_to_primary().
+        self._sticky = LRUCache(config.DB_STICKY_MAXSIZE, config.DB_STICKY_SECONDS)
+
+    @property
+    def has_replicas(self) -> bool:
+        return bool(self._replicas)
+
+    def stick_to_primary(self, client_key: str) -> None:
+        """
+        Send the reads of a client to the primary for DB_STICKY_SECONDS after it wrote,
+        so it reads its own writes even when the replicas lag behind.
+        """
+        self._sticky.set(client_key, True)
+
+    def is_sticky(self, client_key: str) -> bool:
+        return self._sticky.get(client_key, False)
+
+    def _pick_replica(self) -> Replica | None:
+        for _ in range(len(self._replicas)):
+            replica = self._replicas[self._next_replica % len(self._replicas)]
+            self._next_replica += 1
+            if replica.healthy:
+                return replica
+        return None
+
+    async def _replica_session(self) -> AsyncSession | None:
+        while (replica := self._pick_replica()) is not None:
+            session = replica.session_maker()
+            try:
+                # Checking out the connection pre-pings it, which is the health check.
+                await session.connection()
+                return session
+            except (DBAPIError, OSError, asyncio.TimeoutError) as err:
+                print(err)
+                await session.close()
+                replica.retry_at = time.monotonic() + config.DB_REPLICA_COOLDOWN
+        return None
+
+    @contextlib.asynccontextmanager
+    async def session(self, reraise: bool = False):
+        """
+        Open a session on the primary. Errors are rolled back and swallowed unless
+        ``reraise``, which background jobs need to see their failures.
+        """
+        if self._session_maker is None:
+            raise Exception(messages.SESSION_NOT_INITIALIZED)
+        async with self._managed(self._session_maker(), reraise) as session:
+            yield session
+
     @contextlib.asynccontextmanager
-    async def session(self):
+    async def read_session(self, primary: bool = False):
+        """
+        Open a session for reads only. Replicas are used round-robin; one that fails to
+        connect is skipped for DB_REPLICA_COOLDOWN seconds. Without a healthy replica, or
+        with ``primary``, the session goes to the primary.
+        """
         if self._session_maker is None:
             raise Exception(messages.SESSION_NOT_INITIALIZED)
-        session = self._session_maker()
+        session = None if primary else await self._replica_session()
+        async with self._managed(session or self._session_maker()) as session:
+            yield session
+
+    @contextlib.asynccontextmanager
+    async def _managed(self, session: AsyncSession, reraise: bool = False):
         try:
             yield session
         except Exception as err:
             print(err)
             await session.rollback()
+            if reraise:
+                raise
         finally:
             await session.close()
 
+    def pool_stats(self) -> dict:
+        stats = pool_stats(self._engine.pool)
+        if self._replicas:
+            stats["replicas"] = [
+                {**pool_stats(replica.engine.pool), "healthy": replica.healthy}
+                for replica in self._replicas
+            ]
+        return stats
+
+
+sessionmanager = DatabaseSessionManager(config.DB_URL, config.DB_REPLICA_URLS)
 
-sessionmanager = DatabaseSessionManager(config.DB_URL)
+
+def is_replica_session(session: AsyncSession) -> bool:
+    return session.info.get("replica", False)
+
+
+def upsert_insert(session: AsyncSession):
+    """
+    The ``insert`` of the session's dialect, which has ``on_conflict_do_update`` and
+    ``on_conflict_do_nothing``.
+    """
+    return postgresql.insert if session.bind.dialect.name == "postgresql" else sqlite.insert
+
+
+def client_key(request: Request) -> str | None:
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return hashlib.sha256(authorization.encode()).hexdigest()
+    return None
 
 
 async def get_db():
     async with sessionmanager.session() as session:
+        yield session
+
+
+async def get_read_db(request: Request):
+    """
+    Session for read-only routes, served by a replica when DB_REPLICA_URLS is set.
+
+    A client that wrote within DB_STICKY_SECONDS reads from the primary. It is recognised
+    by its Authorization header on this worker, or by the cookie that marks it for every
+    worker.
+    """
+    key = client_key(request)
+    primary = STICKY_COOKIE in request.cookies or (key is not None and sessionmanager.is_sticky(key))
+    async with sessionmanager.read_session(primary=primary) as session:
         yield session
\ No newline at end of file
@@ -0,0 +1,83 @@
+import bisect
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+# Upper bounds of the checkout wait histogram buckets, in milliseconds.
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class WaitHistogram:
+    """
+    Cumulative histogram of connection checkout times, in the Prometheus layout.
+    """
+
+    def __init__(self, buckets=WAIT_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total_ms = 0.0
+        self.timeouts = 0
+
+    def observe(self, wait_ms: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, wait_ms)] += 1
+        self.total_ms += wait_ms
+
+    def snapshot(self) -> dict:
+        cumulative, buckets = 0, {}
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "buckets_ms": buckets,
+            "count": cumulative,
+            "sum_ms": round(self.total_ms, 3),
+            "timeouts": self.timeouts,
+        }
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long every checkout waited, including pre-ping and
+    opening a new connection, so pool starvation can be told apart from slow queries.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_histogram = WaitHistogram()
+
+    def recreate(self) -> "TimedQueuePool":
+        pool = super().recreate()
+        pool.wait_histogram = self.wait_histogram
+        return pool
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.wait_histogram.timeouts += 1
+            raise
+        finally:
+            self.wait_histogram.observe((time.perf_counter() - started) * 1000)
+
+
+def pool_stats(pool: Pool) -> dict:
+    """
+    Describe the current state of a connection pool.
+
+    :param pool: The pool of an engine.
+    :return: Size, checked out and overflow connections, and the checkout wait histogram
+        when the pool records it.
+    """
+    stats = {"pool": type(pool).__name__}
+    if hasattr(pool, "checkedout"):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    if isinstance(pool, TimedQueuePool):
+        stats["checkout_wait"] = pool.wait_histogram.snapshot()
+    return stats
@@ -1,5 +1,9 @@
-from sqlalchemy import Column, ForeignKey, DateTime, Integer, String, Boolean, func, Table, Enum
-from sqlalchemy.orm import DeclarativeBase, relationship
+from sqlalchemy import (
+    Column, ForeignKey, DateTime, Integer, BigInteger, String, Boolean, func, Table, Enum, Text, Index,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import DeclarativeBase, relationship, deferred
 import enum
 
 
@@ -13,6 +17,8 @@ image_m2m_tag = Table(
     Column("id", Integer, primary_key=True),
     Column("image_id", Integer, ForeignKey("images.id", ondelete="CASCADE")),
     Column("tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE")),
+    Index("ix_image_m2m_tag_image_id_tag_id", "image_id", "tag_id", unique=True),
+    Index("ix_image_m2m_tag_tag_id", "tag_id"),
 )
 
 
@@ -39,6 +45,8 @@ class User(Base):
     images = relationship("Image", backref="users")
     # ratings = relationship("Rating", backref="user")
     avatar = Column(String(255), nullable=True)
+    # Denormalized counters, see src.repository.counters.
+    image_count = Column(Integer, nullable=False, default=0, server_default="0")
 
 
 class Image(Base):
@@ -54,6 +62,20 @@ class Image(Base):
     # transformed_link = relationship("TransformedImageLink", back_populates="image")
     comments = relationship("Comment", backref="images")
     qr_url = Column(String(255), nullable=True)
+    # SHA-256 of the uploaded bytes, see Asset. NULL for transformed and older images.
+    content_hash = Column(String(64), nullable=True, index=True)
+    # Perceptual hash, see src.services.similarity_service.
+    phash = Column(BigInteger, nullable=True)
+    # Denormalized counters, see src.repository.counters.
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
+    tag_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Maintained by database triggers, see migration 3c9f1d2a7b41.
+    search_vector = deferred(Column(TSVECTOR().with_variant(Text(), "sqlite"), nullable=True))
+
+    __table_args__ = (
+        Index("ix_images_user_id_created_at", user_id, created_at.desc()),
+        Index("ix_images_created_at_id", created_at, id),
+    )
 
 
 class Tag(Base):
@@ -71,6 +93,64 @@ class Comment(Base):
     image_id = Column("image_id", ForeignKey("images.id", ondelete="CASCADE"), default=None)
     created_at = Column("created_at", DateTime, default=func.now())
     updated_at = Column("updated_at", DateTime, default=func.now(), onupdate=func.now())
+    # Maintained by a database trigger, see migration e5c8a2f4b617.
+    search_vector = deferred(Column(TSVECTOR().with_variant(Text(), "sqlite"), nullable=True))
+
+    __table_args__ = (
+        Index("ix_comments_image_id_created_at", image_id, created_at),
+        Index("ix_comments_user_id", user_id),
+    )
+
+
+class DerivedImage(Base):
+    """
+    Cached result of a transformation, shared by all images that point to it.
+    """
+    __tablename__ = "derived_images"
+    id = Column(Integer, primary_key=True)
+    source_public_id = Column(String(150), nullable=False)
+    spec = Column(String(100), nullable=False)
+    public_id = Column(String(150), nullable=False, index=True)
+    url = Column(String(255), nullable=False)
+    size_bytes = Column(BigInteger, nullable=False, default=0)
+    ref_count = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime, default=func.now())
+    last_used_at = Column(DateTime, default=func.now(), index=True)
+
+    __table_args__ = (
+        UniqueConstraint("source_public_id", "spec", name="uq_derived_images_source_spec"),
+    )
+
+
+class Asset(Base):
+    """
+    A stored upload, shared by every image whose bytes hash the same.
+
+    ``ref_count`` counts those images; the file is deleted with the last one.
+    """
+    __tablename__ = "assets"
+    id = Column(Integer, primary_key=True)
+    content_hash = Column(String(64), nullable=False, unique=True)
+    public_id = Column(String(150), nullable=False)
+    url = Column(String(255), nullable=False)
+    size_bytes = Column(BigInteger, nullable=False, default=0)
+    ref_count = Column(Integer, nullable=False, default=1)
+    phash = Column(BigInteger, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+
+
+class StorageOutbox(Base):
+    """
+    A stored file to delete once the transaction that stopped using it has committed,
+    see src.repository.storage_outbox.
+    """
+    __tablename__ = "storage_outbox"
+    id = Column(Integer, primary_key=True)
+    public_id = Column(String(150), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=func.now(), index=True)
+    last_error = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=func.now())
 
 
 # class Rating(Base):
@@ -0,0 +1,148 @@
+from pathlib import Path
+from typing import Iterable, List
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.db import upsert_insert
+from src.entity.models import Asset
+from src.repository import storage_outbox
+from src.services.storage_service import content_hash, perceptual_hash, storage
+
+
+async def get_assets(db: AsyncSession, content_hashes: Iterable[str]) -> dict[str, Asset]:
+    """
+    Get the stored assets with the given content hashes.
+
+    :param db: The asynchronous database session.
+    :param content_hashes: SHA-256 of the files.
+    :return: Assets by content hash; unknown hashes are missing.
+    """
+    content_hashes = set(content_hashes)
+    if not content_hashes:
+        return {}
+    result = await db.execute(select(Asset).filter(Asset.content_hash.in_(content_hashes)))
+    return {asset.content_hash: asset for asset in result.scalars()}
+
+
+async def add_references(db: AsyncSession, stored: List[dict]) -> dict[str, int]:
+    """
+    Count new references to stored files with one upsert. A file seen for the first time
+    gets its asset row, otherwise ``ref_count`` grows atomically.
+
+    When concurrent uploads stored the same bytes under different public_ids, the file of
+    the asset row wins: the items of ``stored`` are rewritten to its ``public_id`` and
+    ``url``, and the losing upload is queued for deletion in the storage outbox. The
+    files are claimed against pending deletions, see
+    :func:`~src.repository.storage_outbox.claim`; check files referenced by nothing but
+    ``stored`` with :func:`file_lost`. The caller commits.
+
+    :param db: The asynchronous database session.
+    :param stored: Upload results with ``content_hash`` and ``refs``, one per distinct
+        hash, updated in place.
+    :return: ``ref_count`` after the upsert, by content hash.
+    """
+    insert = upsert_insert(db)
+    stmt = insert(Asset).values(
+        [
+            {
+                "content_hash": item["content_hash"],
+                "public_id": item["public_id"],
+                "url": item["url"],
+                "size_bytes": item.get("bytes") or 0,
+                "ref_count": item["refs"],
+                "phash": item.get("phash"),
+            }
+            for item in stored
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Asset.content_hash],
+        set_={"ref_count": Asset.ref_count + stmt.excluded.ref_count},
+    ).returning(Asset.content_hash, Asset.ref_count, Asset.public_id, Asset.url)
+    rows = {row.content_hash: row for row in await db.execute(stmt)}
+    lost = []
+    for item in stored:
+        row = rows[item["content_hash"]]
+        if item["public_id"] != row.public_id:
+            lost.append(item["public_id"])
+            item.update(public_id=row.public_id, url=row.url, existed=True)
+    storage_outbox.add_deletions(db, lost)
+    refs = {digest: row.ref_count for digest, row in rows.items()}
+    await storage_outbox.claim(db, [item["public_id"] for item in stored])
+    return refs
+
+
+async def file_lost(stored: dict) -> bool:
+    """
+    Check whether a drain may have deleted a file before it was claimed.
+
+    :param stored: Upload result of a file nothing else references.
+    :return: True if the file is gone or, where the backend cannot tell, was stored
+        before this upload.
+    """
+    found = await storage.exists(stored["public_id"])
+    return not found if found is not None else bool(stored.get("existed"))
+
+
+async def _upload(source, public_id: str) -> dict:
+    if isinstance(source, Path):
+        return await storage.upload_path(source, public_id)
+    source.seek(0)
+    return await storage.upload(source, public_id)
+
+
+async def store_asset(db: AsyncSession, source, public_id: str, digest: str | None = None) -> dict:
+    """
+    Store a file unless identical bytes are stored already, and count one reference to it.
+    The caller commits.
+
+    :param db: The asynchronous database session.
+    :param source: A path, or a seekable binary file object.
+    :param public_id: public_id for the file if it has to be uploaded.
+    :param digest: SHA-256 of the file if the caller has already computed it.
+    :return: Upload result of the stored file, with its ``content_hash`` and ``phash``.
+    """
+    if digest is None:
+        digest, size = await content_hash(source)
+    else:
+        size = None
+    asset = (await get_assets(db, [digest])).get(digest)
+    if asset and asset.phash is not None:
+        phash = asset.phash
+    else:
+        phash = await perceptual_hash(source)
+    if asset:
+        stored = {"public_id": asset.public_id, "url": asset.url, "bytes": asset.size_bytes, "existed": True}
+    else:
+        stored = await _upload(source, public_id)
+    stored = {"bytes": size, **stored, "content_hash": digest, "phash": phash, "refs": 1}
+    refs = await add_references(db, [stored])
+    if refs[digest] == 1 and await file_lost(stored):
+        await _upload(source, stored["public_id"])
+    return stored
+
+
+async def release_asset(db: AsyncSession, digest: str) -> bool:
+    """
+    Drop one reference to a stored file, removing its asset row with the last one.
+    The caller commits and deletes the file when this returns True.
+
+    :param db: The asynchronous database session.
+    :param digest: Content hash of the image row being deleted.
+    :return: True if no image references the file any more, or it has no asset row.
+    """
+    result = await db.execute(
+        update(Asset)
+        .where(Asset.content_hash == digest)
+        .values(ref_count=Asset.ref_count - 1)
+        .returning(Asset.ref_count)
+        .execution_options(synchronize_session=False)
+    )
+    remaining = result.scalar()
+    if remaining is None:
+        return True
+    if remaining <= 0:
+        await db.execute(delete(Asset).where(Asset.content_hash == digest, Asset.ref_count <= 0))
+        return True
+    return False
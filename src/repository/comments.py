@@ -1,7 +1,19 @@
 from sqlalchemy.future import select
-from src.entity.models import Comment, User
+from src.entity.models import Comment, Image, User
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from src.conf.config import config
+from src.repository import counters
+from src.schemas.comment_schemas import CommentAuthor, CommentItem, CommentPage, CommentsResponse
+from src.services.cache_service import invalidate_images
+from src.services.comment_stream import comment_hub
+from src.services.search_service import search_index
+from src.utils.cursor import decode_cursor, encode_cursor
+
+
+def _event_data(comment: Comment) -> dict:
+    return CommentsResponse.model_validate(comment).model_dump(mode="json")
 
 
 async def create_comment(db: AsyncSession, image_id: int, comment_text: str, user: User):
@@ -16,11 +28,91 @@ async def create_comment(db: AsyncSession, image_id: int, comment_text: str, use
     """
     comment = Comment(comment=comment_text, image_id=image_id, user_id=user.id)
     db.add(comment)
+    await counters.add_comments(db, image_id, 1)
     await db.commit()
     await db.refresh(comment)  # Оновлення об'єкта коментаря після збереження
+    if search_index.loaded:
+        search_index.index_comment(comment.image_id, comment.id, comment.comment)
+    await invalidate_images()
+    await comment_hub.publish(image_id, "created", _event_data(comment))
     return comment
 
 
+async def get_comments(
+    db: AsyncSession, image_id: int, cursor: str | None = None, limit: int = 50
+) -> CommentPage | None:
+    """
+        Get one page of the comments on an image, oldest first.
+
+        Pages follow ``(created_at, id)`` through a keyset cursor on the
+        ``ix_comments_image_id_created_at`` index, so a page costs the same however long
+        the thread is. ``next_cursor`` is returned even on the last page: passing it later
+        returns only the comments added since, which is how clients poll for new ones.
+        The authors of a page are read with a single IN query.
+
+        ``created_at`` is the start of the inserting transaction, so a comment can commit
+        after comments stamped later were already listed. Each page therefore re-reads the
+        last COMMENT_CURSOR_OVERLAP seconds before the cursor and skips the comments whose
+        IDs the cursor carries, i.e. those already returned within that window.
+
+        :param db: The asynchronous database session.
+        :param image_id: The ID of the image.
+        :param cursor: ``next_cursor`` of the previous page.
+        :param limit: Maximum number of comments in the page.
+        :return: The page, or None if the image doesn't exist.
+    """
+    last, seen = None, set()
+    query = select(Comment).filter(Comment.image_id == image_id).order_by(Comment.created_at, Comment.id)
+    if cursor:
+        created_at, comment_id, seen = decode_cursor(cursor, 3)
+        last, seen = (created_at, comment_id), set(seen)
+        query = query.filter(
+            Comment.created_at >= created_at - timedelta(seconds=config.COMMENT_CURSOR_OVERLAP)
+        )
+    # The comments already returned are read again, so they can be carried over.
+    fetch = limit + 1 + len(seen)
+    window = list((await db.execute(query.limit(fetch))).scalars())
+    comments = [comment for comment in window if comment.id not in seen]
+
+    if not comments and cursor is None:
+        image = await db.execute(select(Image.id).filter(Image.id == image_id))
+        if image.scalar() is None:
+            return None
+
+    has_more = len(comments) > limit
+    comments = comments[:limit]
+    authors = {}
+    user_ids = {comment.user_id for comment in comments if comment.user_id is not None}
+    if user_ids:
+        result = await db.execute(
+            select(User.id, User.username, User.avatar).filter(User.id.in_(user_ids))
+        )
+        authors = {row.id: CommentAuthor.model_validate(row, from_attributes=True) for row in result}
+
+    if comments:
+        # A page of late commits only ends before the cursor; the cursor never moves back.
+        last = max(filter(None, [last, (comments[-1].created_at, comments[-1].id)]))
+        window_start = last[0] - timedelta(seconds=config.COMMENT_CURSOR_OVERLAP)
+        returned = seen | {comment.id for comment in comments}
+        carried = {
+            comment.id for comment in window
+            if comment.id in returned and comment.created_at >= window_start
+        }
+        if len(window) == fetch:
+            carried |= seen - {comment.id for comment in window}
+        next_cursor = encode_cursor(*last, sorted(carried))
+    else:
+        next_cursor = cursor
+    return CommentPage(
+        comments=[
+            CommentItem.model_validate(comment).model_copy(update={"author": authors.get(comment.user_id)})
+            for comment in comments
+        ],
+        next_cursor=next_cursor,
+        has_more=has_more,
+    )
+
+
 async def update_comment(db: AsyncSession, comment_id: int, text: str, user: User):
     """
         Update an existing comment in the database.
@@ -44,6 +136,10 @@ async def update_comment(db: AsyncSession, comment_id: int, text: str, user: Use
     comment.updated_at = datetime.utcnow()
     await db.commit()
     await db.refresh(comment)
+    if search_index.loaded:
+        search_index.index_comment(comment.image_id, comment.id, comment.comment)
+    await invalidate_images()
+    await comment_hub.publish(comment.image_id, "updated", _event_data(comment))
 
     return comment
 
@@ -67,6 +163,11 @@ async def delete_comment(db: AsyncSession, comment_id: int, user: User):
         return False
 
     if user.role.name == "admin" or user.role.name == "moderator":
+        image_id = comment_.image_id
         await db.delete(comment_)
+        await counters.add_comments(db, image_id, -1)
         await db.commit()
+        search_index.remove_comment(comment_id)
+        await invalidate_images()
+        await comment_hub.publish(image_id, "deleted", {"id": comment_id, "image_id": image_id})
         return True
@@ -0,0 +1,73 @@
+"""
+Denormalized counters: ``images.comment_count``, ``images.tag_count`` and
+``users.image_count``.
+
+Each helper issues one atomic ``UPDATE ... SET n = n + delta`` in the caller's
+transaction, so a counter commits or rolls back together with the rows it counts.
+"""
+from collections import Counter
+from typing import Iterable
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.entity.models import Image, User, image_m2m_tag
+
+
+async def add_images(db: AsyncSession, user_ids: Iterable[int], sign: int = 1) -> None:
+    """
+    Count images added to (or, with ``sign=-1``, removed from) the users' galleries.
+
+    :param db: The asynchronous database session.
+    :param user_ids: Owner of every image, once per image.
+    :param sign: 1 for added images, -1 for removed ones.
+    """
+    for user_id, count in Counter(user_id for user_id in user_ids if user_id is not None).items():
+        await db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(image_count=User.image_count + sign * count)
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def add_comments(db: AsyncSession, image_id: int, delta: int) -> None:
+    await db.execute(
+        update(Image)
+        .where(Image.id == image_id)
+        .values(comment_count=Image.comment_count + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def add_tags(db: AsyncSession, image_id: int, delta: int, limit: int | None = None) -> bool:
+    """
+    Count tags added to (or, with a negative delta, removed from) an image.
+
+    :param db: The asynchronous database session.
+    :param image_id: The ID of the image.
+    :param delta: Change of the tag count.
+    :param limit: If given, the count only changes while the new total stays within it.
+    :return: False if the image does not exist or the limit would be exceeded.
+    """
+    query = update(Image).where(Image.id == image_id)
+    if limit is not None:
+        query = query.where(Image.tag_count + delta <= limit)
+    counted = await db.execute(
+        query.values(tag_count=Image.tag_count + delta)
+        .returning(Image.id)
+        .execution_options(synchronize_session=False)
+    )
+    return counted.scalar() is not None
+
+
+async def remove_tag_everywhere(db: AsyncSession, tag_id: int) -> None:
+    """
+    Uncount a tag on every image carrying it, before the tag is deleted.
+    """
+    await db.execute(
+        update(Image)
+        .where(Image.id.in_(select(image_m2m_tag.c.image_id).where(image_m2m_tag.c.tag_id == tag_id)))
+        .values(tag_count=Image.tag_count - 1)
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,161 @@
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import case, delete, exists, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.entity.models import DerivedImage, Image
+
+EVICTION_BATCH = 500
+
+
+async def get_derived(db: AsyncSession, source_public_id: str, spec: str) -> DerivedImage | None:
+    """
+    Get the cached result of a transformation and mark it as recently used.
+
+    :param db: The asynchronous database session.
+    :param source_public_id: public_id of the transformed image.
+    :param spec: Canonical transformation spec.
+    :return: The cache entry, or None on a miss.
+    """
+    result = await db.execute(
+        select(DerivedImage).filter(
+            DerivedImage.source_public_id == source_public_id, DerivedImage.spec == spec
+        )
+    )
+    derived = result.scalar()
+    if derived:
+        derived.last_used_at = datetime.utcnow()
+    return derived
+
+
+def add_derived(db: AsyncSession, source_public_id: str, spec: str, stored: dict) -> DerivedImage:
+    """
+    Register a freshly stored transformation result. The caller commits.
+
+    :param db: The asynchronous database session.
+    :param source_public_id: public_id of the transformed image.
+    :param spec: Canonical transformation spec.
+    :param stored: Upload result of the transformed file.
+    :return: The new cache entry.
+    """
+    derived = DerivedImage(
+        source_public_id=source_public_id,
+        spec=spec,
+        public_id=stored["public_id"],
+        url=stored["url"],
+        size_bytes=stored.get("bytes") or 0,
+        ref_count=1,
+    )
+    db.add(derived)
+    return derived
+
+
+async def reference_derived(db: AsyncSession, derived_id: int) -> bool:
+    """
+    Count one more image using a cached transformation. The caller commits.
+
+    :param db: The asynchronous database session.
+    :param derived_id: ID of the cache entry.
+    :return: False if the entry was evicted meanwhile.
+    """
+    result = await db.execute(
+        update(DerivedImage)
+        .where(DerivedImage.id == derived_id)
+        .values(ref_count=DerivedImage.ref_count + 1)
+        .returning(DerivedImage.id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalar() is not None
+
+
+async def release_derived(db: AsyncSession, public_id: str) -> bool:
+    """
+    Drop one reference to a derived file. The cache entry stays with ``ref_count`` 0, so
+    the file can be reused until :func:`evict_lru` removes it. The caller commits.
+
+    :param db: The asynchronous database session.
+    :param public_id: public_id of the image row being deleted.
+    :return: True if the file is a cache entry and must be kept.
+    """
+    result = await db.execute(
+        update(DerivedImage)
+        .where(DerivedImage.public_id == public_id)
+        .values(ref_count=case((DerivedImage.ref_count > 0, DerivedImage.ref_count - 1), else_=0))
+        .returning(DerivedImage.id)
+        .execution_options(synchronize_session=False)
+    )
+    return bool(result.all())
+
+
+async def drop_derivatives(db: AsyncSession, source_public_id: str) -> List[str]:
+    """
+    Remove the cached transformations of a deleted source, and those of their results in
+    turn. Only entries no image uses are removed; an image created from a transformation
+    keeps its file, whose entry stays in the cache until :func:`evict_lru` removes it. The
+    caller commits and deletes the returned files from storage.
+
+    :param db: The asynchronous database session.
+    :param source_public_id: public_id of the deleted source file.
+    :return: public_ids of the derived files that are no longer referenced.
+    """
+    dropped = []
+    sources = {source_public_id}
+    while sources:
+        result = await db.execute(
+            delete(DerivedImage)
+            .where(
+                DerivedImage.source_public_id.in_(sources),
+                DerivedImage.ref_count <= 0,
+                ~exists().where(Image.public_id == DerivedImage.public_id),
+            )
+            .returning(DerivedImage.public_id)
+            .execution_options(synchronize_session=False)
+        )
+        sources = set(result.scalars()) - {source_public_id, *dropped}
+        dropped += sources
+    return dropped
+
+
+async def evict_lru(db: AsyncSession, max_bytes: int, keep: str | None = None) -> List[str]:
+    """
+    Evict least recently used transformations until the cache fits in ``max_bytes``.
+
+    Only entries no image uses any more (``ref_count`` 0) count against the budget and
+    are evicted; a file an image points at belongs to that image, not to the cache. The
+    caller commits and deletes the returned files from storage.
+
+    :param db: The asynchronous database session.
+    :param max_bytes: Storage budget of the derived image cache.
+    :param keep: public_id that must not be evicted, e.g. the one just created.
+    :return: public_ids of the evicted files.
+    """
+    unused = DerivedImage.ref_count <= 0
+    total = await db.execute(
+        select(func.coalesce(func.sum(DerivedImage.size_bytes), 0)).filter(unused)
+    )
+    total = total.scalar()
+    if total <= max_bytes:
+        return []
+    result = await db.execute(
+        select(DerivedImage.id, DerivedImage.size_bytes)
+        .filter(unused, DerivedImage.public_id != keep)
+        .order_by(DerivedImage.last_used_at, DerivedImage.id)
+        .limit(EVICTION_BATCH)
+    )
+    victims = []
+    for derived_id, size_bytes in result:
+        if total <= max_bytes:
+            break
+        victims.append(derived_id)
+        total -= size_bytes
+    if not victims:
+        return []
+    # An entry referenced again since it was selected stays.
+    evicted = await db.execute(
+        delete(DerivedImage)
+        .where(DerivedImage.id.in_(victims), unused)
+        .returning(DerivedImage.public_id)
+        .execution_options(synchronize_session=False)
+    )
+    return list(evicted.scalars())
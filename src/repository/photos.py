@@ -1,50 +1,240 @@
-from fastapi import HTTPException, status
-from sqlalchemy import func, desc, select
+import asyncio
+import json
+from datetime import datetime
+from typing import AsyncIterator, List
+
+from fastapi import HTTPException, UploadFile, status
+from sqlalchemy import String, cast, desc, func, insert, literal, or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 
-from src.entity.models import Image, User, Tag
-from src.routes.tags_routes import create_tag
+from src.entity.models import Comment, Image, User, Tag, image_m2m_tag
+from src.repository import assets as repository_assets
+from src.repository import counters
+from src.repository import derived_images as repository_derived
+from src.repository import storage_outbox as repository_outbox
+from src.repository import tags as repository_tags
 from src.schemas.photo_schemas import (
     ImageChangeSizeModel,
     ImageAddResponse,
     ImageModel,
+    ImageUploadModel,
+    SimilarImage,
+    BatchUploadItem,
+    BatchUploadResponse,
     ImageTransformModel,
     ImageProfile,
     CommentByUser,
     ImagesByFilter,
     ImageQRResponse,
+    QRBulkResponse,
+    Gallery,
+    GalleryImage,
 )
-from src.schemas.tag_schemas import TagModel
 from src.conf import messages
-from src.services.cloudinary_service import CloudImage, image_cloudinary
-
-import qrcode
-from io import BytesIO
+from src.conf.config import config
+from src.database.db import is_replica_session, upsert_insert
+from src.utils.cursor import encode_cursor, decode_cursor
+from src.services.cache_service import image_cache, invalidate_images, search_cache
+from src.services.cloudinary_service import CloudImage
+from src.services.job_queue import job_queue
+from src.services.qr_service import qr_path
+from src.services.similarity_service import similarity_index
+from src.services.storage_service import content_hash, perceptual_hash, storage
+from src.services.search_service import SEARCH_CONFIG, search_index, supports_full_text
+from src.services.tag_dictionary import tag_dictionary
+from src.services.transform_service import canonical_spec
+
+MAX_TAGS = 5
+TAG_NAME_LENGTH = Tag.tag_name.type.length
 
 
 async def add_image(
-    db: AsyncSession, url: str, public_id: str, user: User, description: str
+    db: AsyncSession, url: str, public_id: str, user: User, description: str,
+    content_hash: str | None = None, phash: int | None = None,
 ) -> Image | None:
     if not user:
         return None
     image = Image(
-        url=url, public_id=public_id, user_id=user.id, description=description
+        url=url, public_id=public_id, user_id=user.id, description=description,
+        content_hash=content_hash, phash=phash,
     )
     db.add(image)
+    await counters.add_images(db, [user.id])
     await db.commit()
     await db.refresh(image)
+    await search_index.refresh_image(db, image.id)
+    similarity_index.add(image.id, phash)
+    await invalidate_images()
     return image
 
 
+async def add_images(
+    db: AsyncSession, files: List[UploadFile], user: User, description: str | None
+) -> BatchUploadResponse:
+    """
+    Upload many files and add them as images of the user.
+
+    Every file is hashed first, at most BATCH_UPLOAD_CONCURRENCY at a time. Files already
+    stored, by an earlier upload or earlier in the batch, are not uploaded again; the
+    others are stored through the same pipeline. The references are then counted with one
+    upsert on ``assets`` and the rows added with one batched ``INSERT ... RETURNING``,
+    its rows sorted back into the order of the parameters.
+    A file that fails to store is reported and does not stop the others.
+
+    :param db: The asynchronous database session.
+    :param files: The uploaded files.
+    :param user: Owner of the new images.
+    :param description: Description given to every image.
+    :return: One result per file, in the order of ``files``.
+    """
+    slots = asyncio.Semaphore(config.BATCH_UPLOAD_CONCURRENCY)
+    name = CloudImage.generate_name_image(user.email)
+
+    async def hash_file(file: UploadFile) -> tuple[str, int]:
+        async with slots:
+            return await content_hash(file.file)
+
+    hashes = await asyncio.gather(*(hash_file(file) for file in files), return_exceptions=True)
+    known = await repository_assets.get_assets(
+        db, [result[0] for result in hashes if not isinstance(result, BaseException)]
+    )
+    stored = {
+        digest: {"public_id": asset.public_id, "url": asset.url, "bytes": asset.size_bytes, "phash": asset.phash,
+                 "existed": True}
+        for digest, asset in known.items()
+    }
+    uploads = {}
+
+    async def store(index: int, file: UploadFile, digest: str) -> dict:
+        if digest not in stored:
+            # Identical files in one batch are stored once; the first upload wins.
+            if digest not in uploads:
+                async def upload() -> dict:
+                    async with slots:
+                        phash = await perceptual_hash(file.file)
+                        return {**await storage.upload(file.file, f"{name}_{index}"), "phash": phash}
+
+                uploads[digest] = asyncio.ensure_future(upload())
+            return await uploads[digest]
+        return stored[digest]
+
+    results = await asyncio.gather(
+        *(
+            store(index, file, result[0])
+            for index, (file, result) in enumerate(zip(files, hashes))
+            if not isinstance(result, BaseException)
+        ),
+        return_exceptions=True,
+    )
+    results = iter(results)
+
+    items = [BatchUploadItem(filename=file.filename) for file in files]
+    rows = []
+    for item, hashed in zip(items, hashes):
+        result = hashed if isinstance(hashed, BaseException) else next(results)
+        if isinstance(result, BaseException):
+            item.status = "failed"
+            item.detail = result.detail if isinstance(result, HTTPException) else str(result)
+        else:
+            rows.append((item, {**result, "content_hash": hashed[0]}))
+
+    if rows:
+        references = {}
+        sources = {}
+        for file, hashed in zip(files, hashes):
+            if not isinstance(hashed, BaseException):
+                sources.setdefault(hashed[0], file.file)
+        for _, result in rows:
+            references.setdefault(result["content_hash"], {**result, "refs": 0})["refs"] += 1
+        try:
+            refs = await repository_assets.add_references(db, list(references.values()))
+            for digest, reference in references.items():
+                if refs[digest] == reference["refs"] and await repository_assets.file_lost(reference):
+                    sources[digest].seek(0)
+                    await storage.upload(sources[digest], reference["public_id"])
+            for _, result in rows:
+                # A concurrent upload of the same bytes may have won the asset row.
+                reference = references[result["content_hash"]]
+                result.update(public_id=reference["public_id"], url=reference["url"])
+            inserted = await db.execute(
+                insert(Image).returning(
+                    Image.id, Image.url, Image.public_id, Image.user_id, sort_by_parameter_order=True
+                ),
+                [
+                    {"url": result["url"], "public_id": result["public_id"], "user_id": user.id,
+                     "description": description, "content_hash": result["content_hash"],
+                     "phash": result["phash"]}
+                    for _, result in rows
+                ],
+            )
+            inserted = inserted.all()
+            await counters.add_images(db, [user.id] * len(inserted))
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            new_files = {stored_file.result()["public_id"]: digest for digest, stored_file in uploads.items()
+                         if not stored_file.exception()}
+            # The same bytes may have been stored by a concurrent upload since.
+            still_known = await repository_assets.get_assets(db, new_files.values())
+            used = await db.execute(select(Image.public_id).filter(Image.public_id.in_(new_files)))
+            used = set(used.scalars())
+            for public_id, digest in new_files.items():
+                if digest not in still_known and public_id not in used:
+                    await storage.delete(public_id)
+            raise
+        for (item, result), row in zip(rows, inserted):
+            if search_index.loaded:
+                search_index.index(row.id, description, [])
+            similarity_index.add(row.id, result["phash"])
+        duplicates = await near_duplicates_many(
+            db, [(row.id, result["phash"]) for (_, result), row in zip(rows, inserted)]
+        )
+        for (item, result), row in zip(rows, inserted):
+            item.image = ImageUploadModel(
+                id=row.id, url=row.url, public_id=row.public_id, user_id=row.user_id,
+                near_duplicate_ids=duplicates[row.id],
+            )
+        await invalidate_images()
+
+    created = sum(item.status == "created" for item in items)
+    return BatchUploadResponse(images=items, created=created, failed=len(items) - created)
+
+
 async def delete_image(db: AsyncSession, image_id: int) -> Image | None:
     result = await db.execute(select(Image).filter(Image.id == image_id))
     image = result.scalar()
 
     if image:
-        image_cloudinary.delete_img(image.public_id)
+        last = True
+        if image.content_hash:
+            last = await repository_assets.release_asset(db, image.content_hash)
+        # Content-addressed backends may also share one file with images older than assets.
+        shared = 0
+        if last:
+            shared = await db.execute(
+                select(func.count(Image.id)).filter(
+                    Image.public_id == image.public_id, Image.id != image.id
+                )
+            )
+            shared = shared.scalar()
+        # A transformation result stays in the derived cache until evicted.
+        cached = await repository_derived.release_derived(db, image.public_id)
+        unused = []
+        if last and not shared:
+            unused = [] if cached else [image.public_id]
+            unused += await repository_derived.drop_derivatives(db, image.public_id)
         await db.delete(image)
+        await counters.add_images(db, [image.user_id], -1)
+        repository_outbox.add_deletions(db, unused)
         await db.commit()
+        search_index.remove(image_id)
+        similarity_index.remove(image_id)
+        await invalidate_images(image_id)
+        if unused:
+            await job_queue.enqueue("storage.drain_outbox")
 
     return image
 
@@ -56,18 +246,170 @@ async def update_desc(db: AsyncSession, image_id: int, description: str) -> Imag
         image.description = description
         await db.commit()
         await db.refresh(image)
+        await search_index.refresh_image(db, image.id)
+        await invalidate_images(image_id)
     return image
 
 
+async def _similar(
+    db: AsyncSession, phash: int, max_distance: int, limit: int, exclude_id: int
+) -> List[tuple[int, Image]]:
+    candidates = [
+        (distance, image_id)
+        for distance, image_id in await similarity_index.search(db, phash, max_distance)
+        if image_id != exclude_id
+    ]
+    found = []
+    # The index may still hold deleted images; look the best candidates up batch by batch.
+    for start in range(0, len(candidates), limit):
+        batch = candidates[start:start + limit]
+        images = await db.execute(select(Image).filter(Image.id.in_([image_id for _, image_id in batch])))
+        images = {image.id: image for image in images.scalars()}
+        found += [(distance, images[image_id]) for distance, image_id in batch if image_id in images]
+        if len(found) >= limit:
+            break
+    return found[:limit]
+
+
+async def near_duplicates_many(db: AsyncSession, images: List[tuple[int, int | None]]) -> dict[int, List[int]]:
+    """
+    Find images that look like new uploads, e.g. resized or re-encoded copies of them.
+
+    All hashes are searched after one index sync, and the candidates still in the
+    database are found with one query.
+
+    :param db: The asynchronous database session.
+    :param images: ``(image_id, phash)`` of the new images.
+    :return: By new image ID, IDs of at most 10 images within NEAR_DUPLICATE_DISTANCE
+        bits, closest first.
+    """
+    hashed = [(image_id, phash) for image_id, phash in images if phash is not None]
+    matches = await similarity_index.search_many(
+        db, [phash for _, phash in hashed], config.NEAR_DUPLICATE_DISTANCE
+    )
+    candidates = {
+        image_id: [found_id for _, found_id in found if found_id != image_id]
+        for (image_id, _), found in zip(hashed, matches)
+    }
+    ids = {found_id for found in candidates.values() for found_id in found}
+    existing = set()
+    if ids:
+        # The index may still hold deleted images.
+        existing = set((await db.execute(select(Image.id).filter(Image.id.in_(ids)))).scalars())
+    duplicates = {image_id: [] for image_id, _ in images}
+    for image_id, found in candidates.items():
+        duplicates[image_id] = [found_id for found_id in found if found_id in existing][:10]
+    return duplicates
+
+
+async def near_duplicates(db: AsyncSession, image_id: int, phash: int | None) -> List[int]:
+    """
+    Find images that look like a new upload, see :func:`near_duplicates_many`.
+
+    :return: IDs of the images within NEAR_DUPLICATE_DISTANCE bits, closest first.
+    """
+    return (await near_duplicates_many(db, [(image_id, phash)]))[image_id]
+
+
+async def upload_result(db: AsyncSession, image: Image) -> ImageUploadModel:
+    return ImageUploadModel(
+        id=image.id, url=image.url, public_id=image.public_id, user_id=image.user_id,
+        near_duplicate_ids=await near_duplicates(db, image.id, image.phash),
+    )
+
+
+async def get_similar_images(
+    db: AsyncSession, image_id: int, max_distance: int, limit: int
+) -> List[SimilarImage]:
+    """
+    Find the images that look most like an image.
+
+    Perceptual hashes are compared through the BK-tree of :data:`similarity_index`, so a
+    query visits only the part of the tree within ``max_distance`` instead of every image.
+
+    :param db: The asynchronous database session.
+    :param image_id: ID of the image.
+    :param max_distance: Largest Hamming distance between the perceptual hashes.
+    :param limit: Maximum number of images.
+    :return: Similar images, closest first.
+    """
+    phash = (await db.execute(select(Image.id, Image.phash).filter(Image.id == image_id))).first()
+    if phash is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.IMAGE_NOT_FOUND)
+    if phash.phash is None:
+        return []
+    found = await _similar(db, phash.phash, max_distance, limit, image_id)
+    return [
+        SimilarImage(id=image.id, url=image.url, description=image.description, user_id=image.user_id,
+                     distance=distance)
+        for distance, image in found
+    ]
+
+
+def _cache_ttl(db: AsyncSession) -> int | None:
+    # A lagging replica may return a row older than the last invalidation; keep it briefly.
+    return config.REPLICA_CACHE_TTL if is_replica_session(db) else None
+
+
+_CACHED_COLUMNS = ("id", "url", "public_id", "description", "user_id", "qr_url")
+_CACHED_DATES = ("created_at", "updated_at")
+
+
+def _image_to_cache(image: Image) -> dict:
+    data = {column: getattr(image, column) for column in _CACHED_COLUMNS}
+    for column in _CACHED_DATES:
+        value = getattr(image, column)
+        data[column] = value.isoformat() if value else None
+    return data
+
+
+def _image_from_cache(data: dict) -> Image:
+    data = dict(data)
+    for column in _CACHED_DATES:
+        if data[column]:
+            data[column] = datetime.fromisoformat(data[column])
+    return Image(**data)
+
+
 async def get_image_by_id(db: AsyncSession, image_id: int) -> Image | None:
+    """
+    Get an image by its ID through the two-tier read cache.
+
+    A cache hit returns a transient :class:`Image` that is not attached to ``db``; load
+    the row again before changing it.
+
+    :param db: The asynchronous database session.
+    :param image_id: ID of the image.
+    :return: The image, or None if it does not exist.
+    """
+    cached = await image_cache.get(str(image_id))
+    if cached is not None:
+        return _image_from_cache(cached)
     image = await db.execute(select(Image).filter(Image.id == image_id))
-    return image.scalar()
+    image = image.scalar()
+    if image:
+        await image_cache.set(str(image_id), _image_to_cache(image), _cache_ttl(db))
+    return image
 
 
-async def change_size_image(
-    body: ImageChangeSizeModel, db: AsyncSession, user: User
-) -> ImageAddResponse:
-    image = await db.execute(select(Image).filter(Image.id == body.id))
+async def _transform(public_id: str, transformation: dict, engine: str) -> dict:
+    if engine == "local":
+        return await storage.transform_local(public_id, transformation)
+    return await storage.transform(public_id, transformation)
+
+
+async def _derive_image(
+    db: AsyncSession, image_id: int, user: User, transformation: dict, engine: str, retry: bool = True
+) -> Image:
+    """
+    Get the user's image holding a transformation of another image.
+
+    Results are cached in ``derived_images`` by source public_id and canonical spec, so a
+    repeated request returns the existing image without transforming or uploading again.
+    When another request caches the same transformation concurrently, the insert fails
+    on the unique constraint and the call is repeated once to use the winner's entry.
+    """
+    image = await db.execute(select(Image).filter(Image.id == image_id))
     image = image.scalar()
 
     if image is None:
@@ -77,125 +419,309 @@ async def change_size_image(
     if image.user_id != user.id:
         raise HTTPException(status_code=403, detail=messages.NOT_ALLOWED)
 
-    url, public_id = await image_cloudinary.change_size(image.public_id, body.width)
+    source_public_id = image.public_id
+    spec = canonical_spec(transformation, engine)
+    derived = await repository_derived.get_derived(db, source_public_id, spec)
+    if derived:
+        existing = await db.execute(
+            select(Image).filter(Image.public_id == derived.public_id, Image.user_id == user.id).limit(1)
+        )
+        existing = existing.scalar()
+        if existing:
+            await db.commit()
+            await db.refresh(existing)
+            return existing
+        if not await repository_derived.reference_derived(db, derived.id):
+            # Evicted meanwhile; transform again.
+            db.expunge(derived)
+            derived = None
+    if derived:
+        stored = {"url": derived.url, "public_id": derived.public_id}
+    else:
+        stored = await _transform(image.public_id, transformation, engine)
+        await repository_outbox.claim(db, [stored["public_id"]])
+        if await repository_assets.file_lost(stored):
+            stored = await _transform(image.public_id, transformation, engine)
+        repository_derived.add_derived(db, image.public_id, spec, stored)
+
+    transformed = derived is None
     new_image = Image(
-        url=url, public_id=public_id, user_id=user.id, description=image.description
+        url=stored["url"], public_id=stored["public_id"], user_id=user.id, description=image.description
     )
     db.add(new_image)
-    await db.commit()
-    await db.refresh(new_image)
-    image_model = ImageModel(
-        id=new_image.id,
-        url=new_image.url,
-        public_id=new_image.public_id,
-        user_id=new_image.user_id,
+    await counters.add_images(db, [user.id])
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        winner = await repository_derived.get_derived(db, source_public_id, spec)
+        if transformed and (winner is None or winner.public_id != stored["public_id"]):
+            repository_outbox.add_deletions(db, [stored["public_id"]])
+            await db.commit()
+            await job_queue.enqueue("storage.drain_outbox")
+        if winner is None or not retry:
+            raise
+        # Someone cached the same transformation concurrently; use theirs.
+        return await _derive_image(db, image_id, user, transformation, engine, retry=False)
+    evicted = await repository_derived.evict_lru(
+        db, config.DERIVED_CACHE_MAX_BYTES, keep=stored["public_id"]
     )
-    return ImageAddResponse(image=image_model, detail=messages.IMAGE_RESIZED_ADDED)
-
+    if evicted:
+        repository_outbox.add_deletions(db, evicted)
+        await db.commit()
+        await job_queue.enqueue("storage.drain_outbox")
+    await db.refresh(new_image)
+    await search_index.refresh_image(db, new_image.id)
+    await invalidate_images()
+    return new_image
 
-async def fade_edges_image(
-    body: ImageTransformModel, db: AsyncSession, user: User
-) -> ImageAddResponse:
-    image = await db.execute(select(Image).filter(Image.id == body.id))
-    image = image.scalar()
 
-    if image is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail=messages.IMAGE_NOT_FOUND
-        )
-    if image.user_id != user.id:
-        raise HTTPException(status_code=403, detail=messages.NOT_ALLOWED)
+def _image_model(image: Image) -> ImageModel:
+    return ImageModel(
+        id=image.id,
+        url=image.url,
+        public_id=image.public_id,
+        user_id=image.user_id,
+    )
 
-    url, public_id = await image_cloudinary.fade_edges_image(public_id=image.public_id)
 
-    new_image = Image(
-        url=url, public_id=public_id, user_id=user.id, description=image.description
+async def change_size_image(
+    body: ImageChangeSizeModel, db: AsyncSession, user: User
+) -> ImageAddResponse:
+    new_image = await _derive_image(
+        db, body.id, user, {"op": "resize", "width": body.width}, body.engine
     )
-    db.add(new_image)
-    await db.commit()
-    await db.refresh(new_image)
+    return ImageAddResponse(image=_image_model(new_image), detail=messages.IMAGE_RESIZED_ADDED)
 
-    image_model = ImageModel(
-        id=new_image.id,
-        url=new_image.url,
-        public_id=new_image.public_id,
-        user_id=new_image.user_id,
-    )
 
-    return ImageAddResponse(image=image_model, detail=messages.IMAGE_FADE_ADDED)
+async def fade_edges_image(
+    body: ImageTransformModel, db: AsyncSession, user: User
+) -> ImageAddResponse:
+    new_image = await _derive_image(db, body.id, user, {"op": "vignette"}, body.engine)
+    return ImageAddResponse(image=_image_model(new_image), detail=messages.IMAGE_FADE_ADDED)
 
 
 async def black_white_image(
     body: ImageTransformModel, db: AsyncSession, user: User
 ) -> ImageAddResponse:
-    image = await db.execute(select(Image).filter(Image.id == body.id))
-    image = image.scalar()
+    new_image = await _derive_image(db, body.id, user, {"op": "grayscale"}, body.engine)
+    return ImageAddResponse(image=_image_model(new_image), detail=messages.BLACK_WHITE_ADDED)
+
+
+def _image_profile(image: Image, rank: float | None = None) -> ImageProfile:
+    return ImageProfile(
+        id=image.id,
+        url=image.url,
+        description=image.description,
+        tags=[tag.tag_name for tag in image.tags],
+        comments=[
+            CommentByUser(user_id=comment.user_id, comment=comment.comment)
+            for comment in image.comments
+        ],
+        created_at=image.created_at,
+        rank=rank,
+    )
 
-    if image is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail=messages.IMAGE_NOT_FOUND
-        )
-    if image.user_id != user.id:
-        raise HTTPException(status_code=403, detail=messages.NOT_ALLOWED)
 
-    url, public_id = await image_cloudinary.make_black_white_image(
-        public_id=image.public_id
+async def _search_images_in_memory(
+    db: AsyncSession, keyword: str, tag: str | None, cursor: str | None, limit: int
+) -> ImagesByFilter:
+    await search_index.ensure_loaded(db)
+    ranked = search_index.search(keyword, tag)
+    if cursor:
+        last_rank, last_id = decode_cursor(cursor, 2)
+        ranked = [(rank, image_id) for rank, image_id in ranked if (rank, image_id) < (last_rank, last_id)]
+
+    next_cursor = None
+    if len(ranked) > limit:
+        ranked = ranked[:limit]
+        next_cursor = encode_cursor(*ranked[-1])
+
+    result = await db.execute(
+        select(Image)
+        .options(selectinload(Image.tags), selectinload(Image.comments))
+        .filter(Image.id.in_([image_id for _, image_id in ranked]))
     )
-
-    new_image = Image(
-        url=url, public_id=public_id, user_id=user.id, description=image.description
+    images = {image.id: image for image in result.scalars()}
+    return ImagesByFilter(
+        images=[_image_profile(images[image_id], rank) for rank, image_id in ranked if image_id in images],
+        next_cursor=next_cursor,
     )
 
-    db.add(new_image)
-    await db.commit()
-    await db.refresh(new_image)
 
-    image_model = ImageModel(
-        id=new_image.id,
-        url=new_image.url,
-        public_id=new_image.public_id,
-        user_id=new_image.user_id,
+async def get_all_images(
+    db: AsyncSession,
+    current_user: User,
+    keyword: str = None,
+    tag: str = None,
+    cursor: str = None,
+    limit: int = 20,
+) -> ImagesByFilter:
+    """
+    Search images page by page.
+
+    Without a keyword pages are ordered by ``(created_at, id)`` descending. With a keyword
+    the description, tag names and comments are searched through the full-text index and
+    pages are ordered by ``(rank, id)`` descending. Either way the next page is found with a
+    keyset cursor, so a deep page costs the same as the first one. Tags and comments for the
+    whole page are loaded with one ``selectinload`` query each.
+
+    Keywords use the ``images.search_vector`` and ``comments.search_vector`` GIN indexes
+    on Postgres and the in-process :data:`search_index` on other databases. An image
+    matches when its description and tags, or one of its comments, match the keyword; its
+    rank adds the rank of the best matching comment to its own. Pages are kept in :data:`search_cache` until
+    the next image, tag or comment write.
+
+    :param db: The asynchronous database session.
+    :param current_user: The user performing the search.
+    :param keyword: Full-text query.
+    :param tag: Tag name the images must carry.
+    :param cursor: ``next_cursor`` of the previous page.
+    :param limit: Maximum number of images in the page.
+    :return: The page of images and the cursor of the next page.
+    """
+    cache_key = json.dumps([keyword, tag, cursor, limit])
+    cached = await search_cache.get(cache_key)
+    if cached is not None:
+        return ImagesByFilter.model_validate(cached)
+    page = await _search_images(db, keyword, tag, cursor, limit)
+    await search_cache.set(cache_key, page.model_dump(mode="json"), _cache_ttl(db))
+    return page
+
+
+async def _search_images(
+    db: AsyncSession, keyword: str | None, tag: str | None, cursor: str | None, limit: int
+) -> ImagesByFilter:
+    if keyword and not supports_full_text(db):
+        return await _search_images_in_memory(db, keyword, tag, cursor, limit)
+
+    query = (
+        select(Image)
+        .options(selectinload(Image.tags), selectinload(Image.comments))
+        .limit(limit + 1)
+    )
+    if tag:
+        tag_id = await tag_dictionary.get_id(tag.lower())
+        if tag_id is None:
+            return ImagesByFilter(images=[])
+        query = query.filter(
+            Image.id.in_(select(image_m2m_tag.c.image_id).filter(image_m2m_tag.c.tag_id == tag_id))
+        )
+
+    if keyword:
+        ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, keyword)
+        comment_rank = (
+            select(func.max(func.ts_rank_cd(Comment.search_vector, ts_query)))
+            .filter(Comment.image_id == Image.id, Comment.search_vector.op("@@")(ts_query))
+            .scalar_subquery()
+        )
+        rank = func.ts_rank_cd(Image.search_vector, ts_query) + func.coalesce(comment_rank, 0)
+        query = (
+            query.add_columns(rank)
+            .filter(
+                or_(
+                    Image.search_vector.op("@@")(ts_query),
+                    Image.id.in_(
+                        select(Comment.image_id).filter(Comment.search_vector.op("@@")(ts_query))
+                    ),
+                )
+            )
+            .order_by(desc(rank), desc(Image.id))
+        )
+        if cursor:
+            last_rank, image_id = decode_cursor(cursor, 2)
+            query = query.filter(tuple_(rank, Image.id) < (last_rank, image_id))
+        rows = (await db.execute(query)).all()
+    else:
+        query = query.order_by(desc(Image.created_at), desc(Image.id))
+        if cursor:
+            created_at, image_id = decode_cursor(cursor, 2)
+            query = query.filter(tuple_(Image.created_at, Image.id) < (created_at, image_id))
+        rows = [(image, None) for image in (await db.execute(query)).scalars()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        image, rank = rows[-1]
+        next_cursor = encode_cursor(rank if keyword else image.created_at, image.id)
+
+    return ImagesByFilter(
+        images=[_image_profile(image, rank) for image, rank in rows],
+        next_cursor=next_cursor,
     )
 
-    return ImageAddResponse(image=image_model, detail=messages.BLACK_WHITE_ADDED)
 
+async def get_gallery(
+    db: AsyncSession, user_id: int, cursor: str | None = None, limit: int = 20
+) -> Gallery | None:
+    """
+    Get one page of a user's images, newest first.
+
+    Pages follow ``(created_at, id)`` through a keyset cursor on the
+    ``ix_images_user_id_created_at`` index. Counts come from the denormalized counter
+    columns, so no comments or tags are read.
+
+    :param db: The asynchronous database session.
+    :param user_id: Owner of the gallery.
+    :param cursor: ``next_cursor`` of the previous page.
+    :param limit: Maximum number of images in the page.
+    :return: The page, or None if the user does not exist.
+    """
+    owner = (
+        await db.execute(
+            select(User.id, User.username, User.avatar, User.image_count).filter(User.id == user_id)
+        )
+    ).first()
+    if owner is None:
+        return None
+    query = (
+        select(
+            Image.id, Image.url, Image.description, Image.created_at, Image.comment_count, Image.tag_count
+        )
+        .filter(Image.user_id == user_id)
+        .order_by(desc(Image.created_at), desc(Image.id))
+        .limit(limit + 1)
+    )
+    if cursor:
+        created_at, image_id = decode_cursor(cursor, 2)
+        query = query.filter(tuple_(Image.created_at, Image.id) < (created_at, image_id))
+    rows = (await db.execute(query)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return Gallery(
+        user_id=owner.id,
+        username=owner.username,
+        avatar=owner.avatar,
+        image_count=owner.image_count,
+        images=[GalleryImage.model_validate(row, from_attributes=True) for row in rows],
+        next_cursor=next_cursor,
+    )
 
-async def get_all_images(
+
+async def iter_image_pages(
     db: AsyncSession,
     current_user: User,
     keyword: str = None,
     tag: str = None,
-) -> ImagesByFilter:
-    pass
-    # query = select(Image)
-    # if keyword:
-    #     query = query.filter(Image.description.ilike(f"%{keyword}%"))
-    # if tag:
-    #     query = query.filter(Image.tags.any(Tag.tag_name == tag))
-    
-    # query = query.order_by(desc(Image.created_at))
-    # result = await db.execute(query)
-    # images = []
-    # async for image in result:
-    #     tags = []
-    #     comments = []
-    #     async for comment in image.comments:
-    #         new_comment = CommentByUser(
-    #             user_id=comment.user_id, comment=comment.comment
-    #         )
-    #         comments.append(new_comment)
-    #     async for tag in image.tags:
-    #         new_tag = tag.tag_name
-    #         tags.append(new_tag)
-    #     new_image = ImageProfile(
-    #         url=image.url,
-    #         description=image.description,
-    #         tags=tags,
-    #         comments=comments,
-    #     )
-    #     images.append(new_image)
-    # all_images = ImagesByFilter(images=images)
-    # return all_images
+    limit: int = 100,
+) -> AsyncIterator[ImagesByFilter]:
+    """
+    Walk through all search results, yielding one page at a time.
+
+    The session identity map is cleared after every page, so memory stays flat
+    however many images match.
+    """
+    cursor = None
+    while True:
+        page = await get_all_images(db, current_user, keyword, tag, cursor, limit)
+        db.expunge_all()
+        yield page
+        cursor = page.next_cursor
+        if cursor is None:
+            break
 
 
 async def create_qr(body: ImageTransformModel, db: AsyncSession, user: User) -> ImageQRResponse:
@@ -209,53 +735,115 @@ async def create_qr(body: ImageTransformModel, db: AsyncSession, user: User) ->
     if image.qr_url:
         return ImageQRResponse(image_id=image.id, qr_code_url=image.qr_url)
 
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(image.url)
-    qr.make(fit=True)
-
-    qr_code_img = BytesIO()
-    qr.make_image(fill_color="black", back_color="white").save(qr_code_img)
-
-    qr_code_img.seek(0)
-
-    new_public_id = CloudImage.generate_name_image(user.email)
-
-    upload_file = CloudImage.upload_image(qr_code_img, new_public_id)
-
-    qr_code_url = CloudImage.get_url_for_image(new_public_id, upload_file)
-
-    image.qr_url = qr_code_url
+    # The QR code is served by GET /api/images/{image_id}/qr, rendered on demand.
+    response = ImageQRResponse(image_id=image.id, qr_code_url=qr_path(image.id))
+    image.qr_url = response.qr_code_url
 
     await db.commit()
-    await db.refresh(image)
-
-    return ImageQRResponse(image_id=image.id, qr_code_url=qr_code_url)
+    await invalidate_images(response.image_id)
+
+    return response
+
+
+async def create_qrs(db: AsyncSession, user: User) -> tuple[QRBulkResponse, List[str]]:
+    """
+    Give every image of the user a QR code with one UPDATE.
+
+    :param db: The asynchronous database session.
+    :param user: Owner of the images.
+    :return: The QR code URL of every image of the user, and the image URLs whose QR
+        codes were just created, to be rendered ahead of the first request.
+    """
+    created = await db.execute(
+        update(Image)
+        .where(Image.user_id == user.id, Image.qr_url.is_(None))
+        .values(qr_url=literal("/api/images/").concat(cast(Image.id, String)).concat("/qr"))
+        .returning(Image.id, Image.url)
+        .execution_options(synchronize_session=False)
+    )
+    created = created.all()
+    await db.commit()
+    await invalidate_images(*(row.id for row in created))
+    images = await db.execute(
+        select(Image.id, Image.qr_url).filter(Image.user_id == user.id).order_by(Image.id)
+    )
+    return (
+        QRBulkResponse(images=[ImageQRResponse(image_id=row.id, qr_code_url=row.qr_url) for row in images]),
+        [row.url for row in created],
+    )
 
 
-async def add_tag(db: AsyncSession, user: User, image_id: int, tag_name: str) -> dict:
-    image = await db.execute(select(Image).filter(Image.id == image_id))
-    image = image.scalar()
+async def add_tags(
+    db: AsyncSession, user: User, image_id: int, tag_names: List[str], retry: bool = True
+) -> dict:
+    """
+    Attach tags to an image in one transaction.
+
+    The image row is locked first, so concurrent taggings of an image run one after
+    another. Missing tags are created by a single upsert and the new links are added by
+    one multi-row insert. The limit of five tags is enforced by the UPDATE of
+    ``tag_count``, which only matches while the new total stays within it. Tags the image
+    already has are left alone. Should a tag ID from the tag dictionary belong to a tag
+    deleted meanwhile, the links fail their foreign key and the call is repeated once
+    with the IDs read from the database.
+
+    :param db: The asynchronous database session.
+    :param user: The owner of the image.
+    :param image_id: The ID of the image.
+    :param tag_names: Names of the tags, at most five.
+    :param retry: Whether a foreign key violation may be retried.
+    :return: The names of the tags that were added.
+    """
+    names = list(dict.fromkeys(name.strip().lower() for name in tag_names))
+    if not names or any(not name or len(name) > TAG_NAME_LENGTH for name in names):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.INVALID_TAG)
+    if len(names) > MAX_TAGS:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=messages.ONLY_FIVE_TAGS)
+
+    owner_id = await db.execute(select(Image.user_id).filter(Image.id == image_id).with_for_update())
+    owner_id = owner_id.scalar()
+    if owner_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.IMAGE_NOT_FOUND)
+    if owner_id != user.id:
+        raise HTTPException(status_code=403, detail=messages.NOT_ALLOWED)
 
-    if image is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail=messages.IMAGE_NOT_FOUND
+    tag_ids, created = await repository_tags.upsert_tags(names, db, cached=retry)
+    linked = await db.execute(
+        select(image_m2m_tag.c.tag_id).filter(
+            image_m2m_tag.c.image_id == image_id, image_m2m_tag.c.tag_id.in_(tag_ids.values())
         )
-    if image.user_id != user.id:
-        raise HTTPException(status_code=403, detail=messages.NOT_ALLOWED)
-    if len(image.tags) >= 5:
-        raise HTTPException(
-            status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=messages.ONLY_FIVE_TAGS
+    )
+    linked = set(linked.scalars())
+    added = [name for name in names if tag_ids[name] not in linked]
+    if not added:
+        await db.commit()
+        if created:
+            await tag_dictionary.invalidate()
+        return {"image_id": image_id, "added": []}
+
+    if not await counters.add_tags(db, image_id, len(added), limit=MAX_TAGS):
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=messages.ONLY_FIVE_TAGS)
+    try:
+        await db.execute(
+            upsert_insert(db)(image_m2m_tag)
+            .values([{"image_id": image_id, "tag_id": tag_ids[name]} for name in added])
+            .on_conflict_do_nothing(index_elements=[image_m2m_tag.c.image_id, image_m2m_tag.c.tag_id])
         )
-    tag = await db.execute(select(Tag).filter(Tag.tag_name == tag_name.lower()))
-    tag = tag.scalar()
-
-    if tag is None:
-        tag_model = TagModel(tag_name=tag_name)
-        tag = await create_tag(tag_model, db)
-
-    image.tags.append(tag)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        if not retry:
+            raise
+        await tag_dictionary.invalidate()
+        return await add_tags(db, user, image_id, tag_names, retry=False)
+    if created:
+        await tag_dictionary.invalidate()
+    await search_index.refresh_image(db, image_id)
+    await invalidate_images(image_id)
+    return {"image_id": image_id, "added": added}
 
-    await db.commit()
-    await db.refresh(image)
 
-    return {"message": "Tag successfully added", "tag": tag.tag_name}
+async def add_tag(db: AsyncSession, user: User, image_id: int, tag_name: str) -> dict:
+    await add_tags(db, user, image_id, [tag_name])
+    return {"message": "Tag successfully added", "tag": tag_name.strip().lower()}
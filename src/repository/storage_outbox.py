@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from sqlalchemy import delete, func, select, union
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import config
+from src.entity.models import Asset, DerivedImage, Image, StorageOutbox
+from src.services.storage_service import StorageBackend
+
+
+def add_deletions(db: AsyncSession, public_ids: Iterable[str]) -> None:
+    """
+    Schedule stored files for deletion. The caller commits, so the files are deleted
+    only if the rows that used them are really gone.
+
+    :param db: The asynchronous database session.
+    :param public_ids: public_ids of the files.
+    """
+    now = datetime.utcnow()
+    db.add_all(StorageOutbox(public_id=public_id, next_attempt_at=now) for public_id in public_ids)
+
+
+async def _lock(db: AsyncSession, public_ids: Iterable[str], wait: bool = True) -> set[str]:
+    """
+    Take the transaction-level advisory lock of every file, in sorted order so lockers
+    cannot deadlock. Without ``wait`` files locked elsewhere are skipped. Only Postgres
+    has these locks; SQLite runs one writer at a time anyway.
+
+    :return: public_ids of the files now locked.
+    """
+    public_ids = sorted(set(public_ids))
+    if db.bind.dialect.name != "postgresql":
+        return set(public_ids)
+    locked = set()
+    for public_id in public_ids:
+        key = func.hashtextextended(public_id, 0)
+        if wait:
+            await db.execute(select(func.pg_advisory_xact_lock(key)))
+            locked.add(public_id)
+        elif (await db.execute(select(func.pg_try_advisory_xact_lock(key)))).scalar():
+            locked.add(public_id)
+    return locked
+
+
+async def claim(db: AsyncSession, public_ids: Iterable[str]) -> None:
+    """
+    Keep files from being deleted, before a transaction starts or keeps using them.
+
+    The files stay locked against drainers until the caller commits, and their pending
+    deletions are cancelled. A drain that was deleting one of them has finished once
+    this returns; callers reusing a file that may have been deleted store it again.
+
+    :param db: The asynchronous database session.
+    :param public_ids: public_ids of the files.
+    """
+    public_ids = set(public_ids)
+    if not public_ids:
+        return
+    await _lock(db, public_ids)
+    await db.execute(
+        delete(StorageOutbox)
+        .where(StorageOutbox.public_id.in_(public_ids))
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _still_used(db: AsyncSession, public_ids: list[str]) -> set[str]:
+    # Content-addressed storage hands out the same public_id again for the same bytes.
+    result = await db.execute(
+        union(
+            select(Image.public_id).filter(Image.public_id.in_(public_ids)),
+            select(Asset.public_id).filter(Asset.public_id.in_(public_ids)),
+            select(DerivedImage.public_id).filter(DerivedImage.public_id.in_(public_ids)),
+        )
+    )
+    return set(result.scalars())
+
+
+async def drain(db: AsyncSession, storage: StorageBackend, batch_size: int) -> int:
+    """
+    Delete one batch of due files from storage.
+
+    Rows are claimed with ``FOR UPDATE SKIP LOCKED`` on Postgres, so several drainers
+    share the work. Every file is locked with the advisory lock :func:`claim` takes, so
+    it cannot be used again between the check below and its deletion; files a
+    transaction holds are put off by OUTBOX_RETRY_BASE seconds. Files used again since
+    they were scheduled are kept. A failed delete is retried after OUTBOX_RETRY_BASE
+    seconds, doubled on every attempt.
+
+    :param db: The asynchronous database session.
+    :param storage: The storage backend holding the files.
+    :param batch_size: Most files handled at once.
+    :return: Number of outbox rows handled.
+    """
+    now = datetime.utcnow()
+    result = await db.execute(
+        select(StorageOutbox)
+        .filter(StorageOutbox.next_attempt_at <= now)
+        .order_by(StorageOutbox.next_attempt_at, StorageOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    entries = list(result.scalars())
+    if not entries:
+        await db.commit()
+        return 0
+    locked = await _lock(db, {entry.public_id for entry in entries}, wait=False)
+    public_ids = list(locked)
+    used = await _still_used(db, public_ids) if public_ids else set()
+    errors = await storage.delete_many([public_id for public_id in public_ids if public_id not in used])
+
+    done = []
+    for entry in entries:
+        if entry.public_id not in locked:
+            entry.next_attempt_at = now + timedelta(seconds=config.OUTBOX_RETRY_BASE)
+            continue
+        error = errors.get(entry.public_id)
+        if error is None:
+            done.append(entry.id)
+            continue
+        entry.attempts += 1
+        entry.last_error = error[:255]
+        delay = min(config.OUTBOX_RETRY_MAX, config.OUTBOX_RETRY_BASE * 2 ** (entry.attempts - 1))
+        entry.next_attempt_at = now + timedelta(seconds=delay)
+    if done:
+        await db.execute(delete(StorageOutbox).where(StorageOutbox.id.in_(done)))
+    await db.commit()
+    return len(entries)
@@ -1,10 +1,15 @@
-from typing import List, Type
+from typing import List
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from src.database.db import upsert_insert
 from src.entity.models import Tag
+from src.repository import counters
 from src.schemas.tag_schemas import TagModel
+from src.services.cache_service import invalidate_images
+from src.services.search_service import search_index
+from src.services.tag_dictionary import tag_dictionary
 
 
 async def create_tag(body: TagModel, db: AsyncSession) -> Tag:
@@ -24,14 +29,68 @@ async def create_tag(body: TagModel, db: AsyncSession) -> Tag:
     db.add(tag)
     await db.commit()
     await db.refresh(tag)
+    await tag_dictionary.invalidate()
     return tag
 
 
+async def upsert_tags(
+    tag_names: List[str], db: AsyncSession, cached: bool = True
+) -> tuple[dict[str, int], bool]:
+    """
+    Get the IDs of tags by name, creating the missing ones. The caller commits, and
+    invalidates the tag dictionary if tags were created.
+
+    Tags are looked up in the tag dictionary first, unless ``cached`` is False, then in
+    the database. The missing
+    ones are created with a single ``INSERT ... ON CONFLICT DO NOTHING RETURNING``, so a
+    tag created concurrently by another request is skipped instead of failing; those are
+    read once more. Names are inserted in sorted order, so concurrent upserts lock them
+    in the same order.
+
+    :param tag_names: Lowercase tag names.
+    :type tag_names: List[str]
+    :param db: Database session.
+    :type db: AsyncSession
+    :param cached: Whether IDs may come from the tag dictionary, which can hold tags
+        deleted by another worker while Redis is unavailable.
+    :type cached: bool
+    :return: Tag ID by name, and whether any tag was created.
+    :rtype: tuple[dict[str, int], bool]
+    """
+    names = set(tag_names)
+    tag_ids = await tag_dictionary.known_ids(names) if cached else {}
+    if len(tag_ids) == len(names):
+        return tag_ids, False
+    result = await db.execute(
+        select(Tag.tag_name, Tag.id).filter(Tag.tag_name.in_(names - tag_ids.keys()))
+    )
+    tag_ids.update(result.all())
+    missing = sorted(names - tag_ids.keys())
+    created = False
+    if missing:
+        insert = upsert_insert(db)
+        result = await db.execute(
+            insert(Tag)
+            .values([{"tag_name": name} for name in missing])
+            .on_conflict_do_nothing(index_elements=[Tag.tag_name])
+            .returning(Tag.tag_name, Tag.id)
+        )
+        inserted = result.all()
+        tag_ids.update(inserted)
+        created = bool(inserted)
+    if len(tag_ids) < len(names):
+        result = await db.execute(
+            select(Tag.tag_name, Tag.id).filter(Tag.tag_name.in_(names - tag_ids.keys()))
+        )
+        tag_ids.update(result.all())
+    return tag_ids, created
+
+
 async def get_tag_by_id(tag_id: int, db: AsyncSession) -> Tag | None:
     """
     Get a tag by its ID.
 
-    This function retrieves a tag based on its ID.
+    This function retrieves a tag based on its ID from the tag dictionary.
 
     :param tag_id: ID of the tag.
     :type tag_id: int
@@ -40,16 +99,15 @@ async def get_tag_by_id(tag_id: int, db: AsyncSession) -> Tag | None:
     :return: Tag if found, None otherwise.
     :rtype: Tag | None
     """
-    result = await db.execute(select(Tag).filter(Tag.id == tag_id))
-    tag = result.scalar()
-    return tag
+    tag_name = await tag_dictionary.get_name(tag_id)
+    return Tag(id=tag_id, tag_name=tag_name) if tag_name is not None else None
 
 
 async def get_tag_by_name(tag_name: str, db: AsyncSession) -> Tag | None:
     """
     Get a tag by its name.
 
-    This function retrieves a tag based on its name.
+    This function retrieves a tag based on its name from the tag dictionary.
 
     :param tag_name: Name of the tag.
     :type tag_name: str
@@ -58,25 +116,8 @@ async def get_tag_by_name(tag_name: str, db: AsyncSession) -> Tag | None:
     :return: Tag if found, None otherwise.
     :rtype: Tag | None
     """
-    result = await db.execute(select(Tag).filter(Tag.tag_name == tag_name))
-    tag = result.scalar()
-    return tag
-
-
-async def get_tags(db: AsyncSession) -> List[Type[Tag]]:
-    """
-    Get all tags.
-
-    This function retrieves all tags present in the database.
-
-    :param db: Database session.
-    :type db: AsyncSession
-    :return: List of tags.
-    :rtype: List[Type[Tag]]
-    """
-    result = await db.execute(select(Tag))
-    tags = result.scalars().all()
-    return tags
+    tag_id = await tag_dictionary.get_id(tag_name)
+    return Tag(id=tag_id, tag_name=tag_name) if tag_id is not None else None
 
 
 async def update_tag(tag_id: int, body: TagModel, db: AsyncSession) -> Tag | None:
@@ -100,6 +141,10 @@ async def update_tag(tag_id: int, body: TagModel, db: AsyncSession) -> Tag | Non
         return None
     tag.tag_name = body.tag_name.lower()
     await db.commit()
+    await db.refresh(tag)
+    await tag_dictionary.invalidate()
+    search_index.invalidate()
+    await invalidate_images()
     return tag
 
 
@@ -119,8 +164,12 @@ async def remove_tag_by_id(tag_id: int, db: AsyncSession) -> Tag | None:
     result = await db.execute(select(Tag).filter(Tag.id == tag_id))
     tag = result.scalar()
     if tag:
-        db.delete(tag)
+        await counters.remove_tag_everywhere(db, tag.id)
+        await db.delete(tag)
         await db.commit()
+        await tag_dictionary.invalidate()
+        search_index.invalidate()
+        await invalidate_images()
     return tag
 
 
@@ -140,6 +189,10 @@ async def remove_tag_by_name(tag_name: str, db: AsyncSession) -> Tag | None:
     result = await db.execute(select(Tag).filter(Tag.tag_name == tag_name))
     tag = result.scalar()
     if tag:
-        db.delete(tag)
+        await counters.remove_tag_everywhere(db, tag.id)
+        await db.delete(tag)
         await db.commit()
+        await tag_dictionary.invalidate()
+        search_index.invalidate()
+        await invalidate_images()
     return tag
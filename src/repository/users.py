@@ -61,6 +61,20 @@ async def update_token(user: User, token: str | None, db: AsyncSession):
     await db.commit()
 
 
+async def update_password(user: User, password_hash: str, db: AsyncSession):
+    """
+    The update_password function replaces the stored password hash of a user,
+    e.g. after it was rehashed with a new bcrypt cost.
+
+    :param user: User: Identify the user to update
+    :param password_hash: str: The new password hash
+    :param db: AsyncSession: Pass the database session to the function
+    :return: Nothing
+    """
+    user.password = password_hash
+    await db.commit()
+
+
 async def confirmed_email(email: str, db: AsyncSession):
     """
     The confirmed_email function takes an email address and a database connection as arguments.
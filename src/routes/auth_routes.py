@@ -42,7 +42,7 @@ async def signup(body: UserSchema, bt: BackgroundTasks, request: Request, db: As
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=messages.ACCOUNT_EXIST)
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repository_users.create_user(body, db)
     bt.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
 
@@ -67,12 +67,17 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession =
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.EMAIL_NOT_CONFIRMED)
 
-    if not auth_service.verify_password(body.password, user.password):
+    valid, new_hash = await auth_service.verify_and_update_password(body.password, user.password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_PASSWORD)
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email, "test": "My token"})  # payload
+    claims = await auth_service.access_token_claims(user)
+    access_token = await auth_service.create_access_token(data={"sub": user.email, "test": "My token", **claims})  # payload
     refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
     await repository_users.update_token(user, refresh_token, db)
+    if new_hash:
+        # BCRYPT_ROUNDS changed since the password was stored.
+        await repository_users.update_password(user, new_hash, db)
 
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
@@ -93,12 +98,13 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(get
     email = await auth_service.decode_refresh_token(token)
     user = await repository_users.get_user_by_email(email, db)
     if user.refresh_token != token:
-        await repository_users.update_token(user, db, token=None)
-        user.refresh_token = None
-        db.commit()
+        # A reused refresh token may be stolen, so revoke everything issued to the user.
+        await repository_users.update_token(user, None, db)
+        await auth_service.revoke_tokens(user.id)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_REFRESH_TOKEN)
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
+    claims = await auth_service.access_token_claims(user)
+    access_token = await auth_service.create_access_token(data={"sub": email, **claims})
     refresh_token = await auth_service.create_refresh_token(data={"sub": email})
     await repository_users.update_token(user, refresh_token, db)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
@@ -126,6 +132,7 @@ async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     if user.confirmed:
         return {"message": messages.VERIFIED_ALREADY}
     await repository_users.confirmed_email(email, db)
+    await auth_service.invalidate_user(email)
     return {"message": messages.VERIFICATION_COMPLETE}
 
 
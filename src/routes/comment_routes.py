@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.repository.comments import create_comment, update_comment, delete_comment
-from src.schemas.comment_schemas import CommentSchema, CommentsResponse
-from src.database.db import get_db
-from src.entity.models import User
+from src.conf import messages
+from src.repository.comments import create_comment, get_comments, update_comment, delete_comment
+from src.schemas.comment_schemas import CommentPage, CommentSchema, CommentsResponse
+from src.database.db import get_db, get_read_db
+from src.entity.models import Image, User
 from src.services.auth_service import get_current_user
+from src.services.comment_stream import comment_hub
 
 router = APIRouter(prefix='/comments', tags=['comments'])
 
@@ -30,6 +34,58 @@ async def create_comments(comment_data: CommentSchema, image_id: int,
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+# Роут для перегляду коментарів
+@router.get("/", response_model=CommentPage)
+async def list_comments(image_id: int,
+                        cursor: str | None = None,
+                        limit: int = Query(default=50, ge=1, le=100),
+                        current_user: User = Depends(get_current_user),
+                        db: AsyncSession = Depends(get_read_db)):
+    """
+        List the comments on an image, oldest first.
+
+        :param image_id: The ID of the image.
+        :param cursor: next_cursor of the previous page; pass the last one again to get
+            only the comments added since.
+        :param limit: Maximum number of comments in the page.
+        :param current_user: The current user.
+        :param db: The asynchronous database session.
+        :return: One page of comments with their authors.
+    """
+    page = await get_comments(db, image_id, cursor, limit)
+    if page is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.IMAGE_NOT_FOUND)
+    return page
+
+
+# Роут для потоку нових коментарів
+@router.get("/stream")
+async def stream_comments(image_id: int, current_user: User = Depends(get_current_user),
+                          db: AsyncSession = Depends(get_db)):
+    """
+        Stream changes to the comments on an image as server-sent events.
+
+        Events are ``created`` and ``updated`` with the comment, and ``deleted`` with its ID.
+        A client that falls behind gets a ``dropped`` event and the stream ends; it then
+        reloads what it missed from the comment listing with its last cursor and reconnects.
+
+        :param image_id: The ID of the image.
+        :param current_user: The current user.
+        :param db: The asynchronous database session.
+        :return: An event stream.
+    """
+    image = await db.execute(select(Image.id).filter(Image.id == image_id))
+    if image.scalar() is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.IMAGE_NOT_FOUND)
+    # Give the connection back to the pool, the stream may stay open for hours.
+    await db.close()
+    return StreamingResponse(
+        comment_hub.stream(image_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # Роут для редагування коментарів
 @router.put("/{comment_id}/", response_model=CommentsResponse)
 async def update_comments(comment_id: int, comment: CommentSchema,
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import JSONResponse
+
+from src.conf import messages
+from src.entity.models import Role, User
+from src.schemas.job_schemas import JobAccepted, JobResponse
+from src.services.auth_service import auth_service
+from src.services.job_queue import job_queue
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+async def enqueue_job(name: str, user: User, idempotency_key: str | None = None, **kwargs) -> JSONResponse:
+    """
+    Queue a job on behalf of a user and build the 202 response pointing at its status.
+
+    :param name: Name of the task.
+    :param user: The user the job belongs to.
+    :param idempotency_key: Value of the Idempotency-Key header, if any.
+    :param kwargs: Arguments of the task.
+    :return: 202 Accepted with the job ID and a Location header.
+    """
+    if idempotency_key:
+        idempotency_key = f"{user.id}:{idempotency_key}"
+    job = await job_queue.enqueue(name, owner_id=user.id, idempotency_key=idempotency_key, **kwargs)
+    status_url = f"/api/jobs/{job['id']}"
+    body = JobAccepted(job_id=job["id"], status=job["status"], status_url=status_url)
+    return JSONResponse(body.model_dump(), status_code=status.HTTP_202_ACCEPTED, headers={"Location": status_url})
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Get the status, progress and result of a background job.
+
+    :param job_id: ID of the job.
+    :type job_id: str
+    :param current_user: Currently authenticated user.
+    :type current_user: User
+    :return: The job.
+    :rtype: JobResponse
+    """
+    job = await job_queue.get(job_id)
+    if job is None or (job["owner_id"] != current_user.id and current_user.role != Role.admin):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.JOB_NOT_FOUND)
+    return job
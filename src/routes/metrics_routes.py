@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends
+
+from src.database.db import sessionmanager
+from src.services.cache_service import image_cache, search_cache
+from src.services.comment_stream import comment_hub
+from src.services.password_service import password_hasher
+from src.services.roles import only_admin
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/cache", dependencies=[Depends(only_admin)])
+async def cache_stats() -> dict:
+    """
+    Get hit and miss counters of the read caches of this worker.
+
+    :return: Counters of the image and search caches.
+    :rtype: dict
+    """
+    return {"images": image_cache.snapshot(), "search": search_cache.snapshot()}
+
+
+@router.get("/hashing", dependencies=[Depends(only_admin)])
+async def hashing_stats() -> dict:
+    """
+    Get the load of the password hashing pool of this worker.
+
+    :return: Running and queued bcrypt jobs and the average time spent waiting for a slot.
+    :rtype: dict
+    """
+    return password_hasher.stats()
+
+
+@router.get("/db", dependencies=[Depends(only_admin)])
+async def db_pool_stats() -> dict:
+    """
+    Get the state of the database connection pool of this worker.
+
+    :return: Checked out and overflow connections and the checkout wait histogram.
+    :rtype: dict
+    """
+    return sessionmanager.pool_stats()
+
+
+@router.get("/streams", dependencies=[Depends(only_admin)])
+async def stream_stats() -> dict:
+    """
+    Get the comment streams connected to this worker.
+
+    :return: Watched images, open streams and streams dropped for falling behind.
+    :rtype: dict
+    """
+    return comment_hub.stats()
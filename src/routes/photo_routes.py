@@ -1,36 +1,52 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
+from typing import List
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.entity.models import User
-from src.repository.photos import get_all_images
+from src.repository.photos import get_all_images, iter_image_pages
 from src.schemas.photo_schemas import ImageModel
 from src.services.auth_service import auth_service
 from src.services.cloudinary_service import CloudImage
+from src.routes.jobs_routes import enqueue_job
+from src.schemas.job_schemas import JobAccepted
+from src.services.job_queue import job_queue
+from src.services.qr_service import qr_service
+from src.services.upload_service import chunked_uploads, read_batch_files
+from src.repository import assets as repository_assets
 from src.repository import photos as repository_image
 from src.services.roles import all_roles
 
 from src.conf import messages
+from src.conf.config import config
 
 from src.schemas.photo_schemas import (
     ImageDeleteResponse,
     ImageUpdateResponse,
     ImageURLResponse,
     ImageModel,
+    ImageUploadModel,
     ImagesByFilter,
+    SimilarImage,
     ImageQRResponse,
+    QRBulkResponse,
     ImageTransformModel,
     ImageAddResponse,
     ImageChangeSizeModel,
+    BatchUploadResponse,
+    UploadInitModel,
+    UploadSessionResponse,
 )
-from src.schemas.tag_schemas import AddTag
+from src.schemas.tag_schemas import AddTag, ImageTagsModel, ImageTagsResponse
 
 router = APIRouter(prefix='/images', tags=['images'])
 
 
 @router.post(
     "/upload",
-    response_model=ImageModel,
+    response_model=ImageUploadModel,
     status_code=status.HTTP_201_CREATED,
     dependencies=[Depends(all_roles)],
 )
@@ -53,16 +69,287 @@ async def upload_image(
     :type current_user: User
     :param db: Database session.
     :type db: AsyncSession
-    :return: Details of the uploaded image.
-    :rtype: ImageModel
+    :return: Details of the uploaded image and the images it nearly duplicates.
+    :rtype: ImageUploadModel
     """
+    chunked_uploads.check_size(file.size)
     public_id = CloudImage.generate_name_image(current_user.email)
-    upload_file = CloudImage.upload_image(file.file, public_id)
-    src_url = CloudImage.get_url_for_image(public_id, upload_file)
+    upload_file = await repository_assets.store_asset(db, file.file, public_id)
     image = await repository_image.add_image(
-        db, src_url, public_id, current_user, description
+        db, upload_file["url"], upload_file["public_id"], current_user, description,
+        upload_file["content_hash"], upload_file["phash"],
     )
-    return image
+    return await repository_image.upload_result(db, image)
+
+
+@router.post(
+    "/uploads",
+    response_model=UploadSessionResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(all_roles)],
+)
+async def init_upload(
+        body: UploadInitModel,
+        current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Start a chunked, resumable upload.
+
+    Send the file as parts of ``chunk_size`` bytes with ``PUT /uploads/{upload_id}/parts/{n}``,
+    then finish with ``POST /uploads/{upload_id}/complete``. Files over MAX_UPLOAD_SIZE are
+    rejected here, before any byte is sent.
+
+    :param body: File name, size, description and optional SHA-256 of the whole file.
+    :type body: UploadInitModel
+    :param current_user: Currently authenticated user.
+    :type current_user: User
+    :return: The upload session.
+    :rtype: UploadSessionResponse
+    """
+    session = await chunked_uploads.init(
+        current_user.id, body.filename, body.size, body.description, body.sha256
+    )
+    return session.describe()
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadSessionResponse, dependencies=[Depends(all_roles)])
+async def get_upload(
+        upload_id: str,
+        current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Get the parts received so far, to resume an interrupted upload.
+
+    :param upload_id: ID of the upload.
+    :type upload_id: str
+    :param current_user: Currently authenticated user.
+    :type current_user: User
+    :return: The upload session.
+    :rtype: UploadSessionResponse
+    """
+    session = await chunked_uploads.get(upload_id, current_user.id)
+    return session.describe()
+
+
+@router.put(
+    "/uploads/{upload_id}/parts/{part_number}",
+    response_model=UploadSessionResponse,
+    dependencies=[Depends(all_roles)],
+)
+async def upload_part(
+        upload_id: str,
+        part_number: int,
+        request: Request,
+        x_chunk_sha256: str = Header(pattern="^[0-9a-fA-F]{64}$"),
+        current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Upload one part as the raw request body.
+
+    Every part but the last is exactly ``chunk_size`` bytes. The body streams to disk and
+    must match the SHA-256 in the ``X-Chunk-SHA256`` header, otherwise the part is dropped
+    and may be sent again.
+
+    :param upload_id: ID of the upload.
+    :type upload_id: str
+    :param part_number: Zero-based number of the part.
+    :type part_number: int
+    :param request: The request whose body is the part.
+    :type request: Request
+    :param x_chunk_sha256: SHA-256 of the part, hex encoded.
+    :type x_chunk_sha256: str
+    :param current_user: Currently authenticated user.
+    :type current_user: User
+    :return: The upload session.
+    :rtype: UploadSessionResponse
+    """
+    session = await chunked_uploads.get(upload_id, current_user.id)
+    content_length = request.headers.get("content-length")
+    await chunked_uploads.write_part(
+        session,
+        part_number,
+        int(content_length) if content_length and content_length.isdigit() else None,
+        x_chunk_sha256,
+        request.stream(),
+    )
+    return session.describe()
+
+
+@router.post(
+    "/uploads/{upload_id}/complete",
+    response_model=ImageUploadModel,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(all_roles)],
+)
+async def complete_upload(
+        upload_id: str,
+        current_user: User = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db),
+):
+    """
+    Store an upload whose parts have all arrived and add it as an image.
+
+    :param upload_id: ID of the upload.
+    :type upload_id: str
+    :param current_user: Currently authenticated user.
+    :type current_user: User
+    :param db: Database session.
+    :type db: AsyncSession
+    :return: Details of the uploaded image and the images it nearly duplicates.
+    :rtype: ImageUploadModel
+    """
+    session = await chunked_uploads.get(upload_id, current_user.id)
+    digest = await chunked_uploads.check_complete(session)
+    public_id = CloudImage.generate_name_image(current_user.email)
+    upload_file = await repository_assets.store_asset(db, session.data_path, public_id, digest)
+    image = await repository_image.add_image(
+        db, upload_file["url"], upload_file["public_id"], current_user, session.manifest["description"],
+        upload_file["content_hash"], upload_file["phash"],
+    )
+    await chunked_uploads.discard(session)
+    return await repository_image.upload_result(db, image)
+
+
+@router.delete("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(all_roles)])
+async def abort_upload(
+        upload_id: str,
+        current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Abort an upload and drop its parts.
+
+    :param upload_id: ID of the upload.
+    :type upload_id: str
+    :param current_user: Currently authenticated user.
+    :type current_user: User
+    """
+    session = await chunked_uploads.get(upload_id, current_user.id)
+    await chunked_uploads.discard(session)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.post(
+    "/upload/batch",
+    response_model=BatchUploadResponse,
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(all_roles)],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["files"],
+                        "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                    }
+                }
+            },
+        }
+    },
+)
+async def upload_images(
+        request: Request,
+        description: str = None,
+        current_user: User = Depends(auth_service.get_current_user),
+        db: AsyncSession = Depends(get_db),
+):
+    """
+    Upload many images at once, as the ``files`` fields of a multipart body.
+
+    Files are stored concurrently and their images are added with a single insert. Every
+    file gets its own result, so a failed file does not fail the batch. The body is parsed
+    here, after authentication, and rejected with 413 as soon as it holds more than
+    BATCH_UPLOAD_MAX_FILES files or a file over MAX_UPLOAD_SIZE.
+
+    :param request: The multipart request.
+    :type request: Request
+    :param description: Description given to every image.
+    :type description: str
+    :param current_user: Currently authenticated user.
+    :type current_user: User
+    :param db: Database session.
+    :type db: AsyncSession
+    :return: Result of every file.
+    :rtype: BatchUploadResponse
+    """
+    files = await read_batch_files(request)
+    try:
+        return await repository_image.add_images(db, files, current_user, description)
+    finally:
+        for file in files:
+            await file.close()
+
+
+@router.get("/search", response_model=ImagesByFilter, dependencies=[Depends(all_roles)])
+async def search_images(
+        db: AsyncSession = Depends(get_read_db),
+        current_user: User = Depends(auth_service.get_current_user),
+        keyword: str = Query(default=None),
+        tag: str = Query(default=None),
+        cursor: str = Query(default=None),
+        limit: int = Query(default=20, ge=1, le=100),
+):
+    """
+    Search for images based on specified filters.
+
+    This endpoint allows users with the necessary roles to search for images based on various filters.
+    Results are paginated with a keyset cursor: pass ``next_cursor`` of a page to get the next one.
+
+    :param db: Database session.
+    :type db: Session
+    :param current_user: Currently authenticated user.
+    :type current_user: User
+    :param keyword: Keyword to search for in image descriptions.
+    :type keyword: str
+    :param tag: Tag to filter images by.
+    :type tag: str
+    :param cursor: Cursor of the page to return.
+    :type cursor: str
+    :param limit: Maximum number of images in the page.
+    :type limit: int
+    :return: Images matching the specified filters.
+    :rtype: ImagesByFilter
+    """
+    try:
+        all_images = await get_all_images(db, current_user, keyword, tag, cursor, limit)
+        return all_images
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/search/stream", dependencies=[Depends(all_roles)])
+async def stream_search_images(
+        db: AsyncSession = Depends(get_read_db),
+        current_user: User = Depends(auth_service.get_current_user),
+        keyword: str = Query(default=None),
+        tag: str = Query(default=None),
+        limit: int = Query(default=100, ge=1, le=500),
+):
+    """
+    Stream all images matching the filters.
+
+    The response is newline-delimited JSON, one ``ImagesByFilter`` page per line.
+
+    :param db: Database session.
+    :type db: Session
+    :param current_user: Currently authenticated user.
+    :type current_user: User
+    :param keyword: Keyword to search for in image descriptions.
+    :type keyword: str
+    :param tag: Tag to filter images by.
+    :type tag: str
+    :param limit: Number of images per streamed page.
+    :type limit: int
+    :return: Stream of result pages.
+    :rtype: StreamingResponse
+    """
+
+    async def pages():
+        async for page in iter_image_pages(db, current_user, keyword, tag, limit):
+            yield page.model_dump_json() + "\n"
+
+    return StreamingResponse(pages(), media_type="application/x-ndjson")
 
 
 @router.get(
@@ -70,7 +357,7 @@ async def upload_image(
 )
 async def get_image_url(
         image_id: int,
-        db: AsyncSession = Depends(get_db),
+        db: AsyncSession = Depends(get_read_db),
         current_user: User = Depends(auth_service.get_current_user),
 ):
     """
@@ -100,6 +387,35 @@ async def get_image_url(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get(
+    "/{image_id}/similar", response_model=List[SimilarImage], dependencies=[Depends(all_roles)]
+)
+async def get_similar_images(
+        image_id: int,
+        max_distance: int = Query(config.SIMILAR_MAX_DISTANCE, ge=0, le=16),
+        limit: int = Query(20, ge=1, le=100),
+        db: AsyncSession = Depends(get_read_db),
+        current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Find images that look like an image: resized, re-encoded or lightly edited copies.
+
+    :param image_id: ID of the image.
+    :type image_id: int
+    :param max_distance: Largest number of differing perceptual hash bits, out of 64.
+    :type max_distance: int
+    :param limit: Maximum number of images.
+    :type limit: int
+    :param db: Database session.
+    :type db: AsyncSession
+    :param current_user: Currently authenticated user.
+    :type current_user: User
+    :return: Similar images, closest first.
+    :rtype: List[SimilarImage]
+    """
+    return await repository_image.get_similar_images(db, image_id, max_distance, limit)
+
+
 @router.patch(
     "/{image_id}/update", response_model=ImageUpdateResponse, dependencies=[Depends(all_roles)]
 )
@@ -146,36 +462,6 @@ async def update_description(
         )
 
 
-@router.get("/search", response_model=ImagesByFilter, dependencies=[Depends(all_roles)])
-async def search_images(
-        db: AsyncSession = Depends(get_db),
-        current_user: User = Depends(auth_service.get_current_user),
-        keyword: str = Query(default=None),
-        tag: str = Query(default=None)
-):
-    """
-    Search for images based on specified filters.
-
-    This endpoint allows users with the necessary roles to search for images based on various filters.
-
-    :param db: Database session.
-    :type db: Session
-    :param current_user: Currently authenticated user.
-    :type current_user: User
-    :param keyword: Keyword to search for in image descriptions.
-    :type keyword: str
-    :param tag: Tag to filter images by.
-    :type tag: str
-    :return: Images matching the specified filters.
-    :rtype: ImagesByFilter
-    """
-    try:
-        all_images = await get_all_images(db, current_user, keyword, tag)
-        return all_images
-    except SQLAlchemyError as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-
 @router.delete(
     "/{image_id}", response_model=ImageDeleteResponse, dependencies=[Depends(all_roles)]
 )
@@ -252,6 +538,98 @@ async def add_tag(
         )
 
 
+@router.patch("/{image_id}/tags", response_model=ImageTagsResponse, dependencies=[Depends(all_roles)])
+async def add_tags(
+    image_id: int,
+    body: ImageTagsModel,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Add up to five tags to an image at once.
+
+    Missing tags are created, and tags the image already has are skipped. The image may
+    carry five tags in total.
+
+    :param image_id: ID of the image.
+    :type image_id: int
+    :param body: Names of the tags.
+    :type body: ImageTagsModel
+    :param db: Database session.
+    :type db: AsyncSession
+    :param current_user: Currently authenticated user.
+    :type current_user: User
+    :return: The tags that were added.
+    :rtype: ImageTagsResponse
+    """
+    try:
+        return await repository_image.add_tags(db, current_user, image_id, body.tags)
+    except SQLAlchemyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        )
+
+
+@router.get("/{image_id}/qr", response_class=Response, dependencies=[Depends(all_roles)])
+async def get_qr(
+    image_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Get the QR code of an image URL as PNG.
+
+    The code is rendered on first use and then served from memory. The ETag depends on
+    the image URL only, so a client revalidating with If-None-Match gets a 304.
+
+    :param image_id: ID of the image.
+    :type image_id: int
+    :param request: The incoming request.
+    :type request: Request
+    :param db: Database session.
+    :type db: AsyncSession
+    :param current_user: Currently authenticated user.
+    :type current_user: User
+    :return: The QR code image.
+    :rtype: Response
+    """
+    image = await repository_image.get_image_by_id(db, image_id)
+    if image is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.IMAGE_NOT_FOUND)
+    etag = qr_service.etag(image.url)
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={config.QR_MAX_AGE}"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(await qr_service.png(image.url), media_type="image/png", headers=headers)
+
+
+@router.post("/qr/bulk", response_model=QRBulkResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_qrs(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    """
+    Create QR codes for all images of the current user.
+
+    The codes that did not exist yet are rendered by a background job, whose ID is
+    returned as ``job_id``, so they are ready when first requested.
+
+    :param db: Database session.
+    :type db: AsyncSession
+    :param current_user: Currently authenticated user.
+    :type current_user: User
+    :return: The QR code URL of every image of the user.
+    :rtype: QRBulkResponse
+    """
+    response, urls = await repository_image.create_qrs(db, current_user)
+    if urls:
+        job = await job_queue.enqueue("images.qr_prerender", owner_id=current_user.id, urls=urls)
+        response.job_id = job["id"]
+    return response
+
+
 @router.post(
     "/create_qr", response_model=ImageQRResponse, status_code=status.HTTP_201_CREATED
 )
@@ -283,10 +661,15 @@ async def create_qr(
 
 
 @router.post(
-    "/change_size", response_model=ImageAddResponse, status_code=status.HTTP_201_CREATED
+    "/change_size",
+    response_model=ImageAddResponse,
+    status_code=status.HTTP_201_CREATED,
+    responses={202: {"model": JobAccepted}},
 )
 async def change_size_image(
     body: ImageChangeSizeModel,
+    background: bool = True,
+    idempotency_key: str | None = Header(None),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
@@ -297,6 +680,11 @@ async def change_size_image(
 
     :param body: Data for changing the size of the image.
     :type body: ImageChangeSizeModel
+    :param background: Transform in a background job and answer 202 with its ID, the
+        default; ``false`` waits for the transformation and answers 201.
+    :type background: bool
+    :param idempotency_key: Repeated requests with the same key return the same job.
+    :type idempotency_key: str | None
     :param db: Database session.
     :type db: Session
     :param current_user: Currently authenticated user.
@@ -304,6 +692,11 @@ async def change_size_image(
     :return: Response containing information about the modified image.
     :rtype: ImageAddResponse
     """
+    if background:
+        return await enqueue_job(
+            "images.transform", current_user, idempotency_key,
+            kind="change_size", body=body.model_dump(), user_id=current_user.id,
+        )
     image = await repository_image.change_size_image(
         body=body, db=db, user=current_user
     )
@@ -315,10 +708,15 @@ async def change_size_image(
 
 
 @router.post(
-    "/black_white", response_model=ImageAddResponse, status_code=status.HTTP_201_CREATED
+    "/black_white",
+    response_model=ImageAddResponse,
+    status_code=status.HTTP_201_CREATED,
+    responses={202: {"model": JobAccepted}},
 )
 async def black_white_image(
     body: ImageTransformModel,
+    background: bool = True,
+    idempotency_key: str | None = Header(None),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
@@ -329,6 +727,11 @@ async def black_white_image(
 
     :param body: Data for the black and white transformation.
     :type body: ImageTransformModel
+    :param background: Transform in a background job and answer 202 with its ID, the
+        default; ``false`` waits for the transformation and answers 201.
+    :type background: bool
+    :param idempotency_key: Repeated requests with the same key return the same job.
+    :type idempotency_key: str | None
     :param db: Database session.
     :type db: Session
     :param current_user: Currently authenticated user.
@@ -336,6 +739,11 @@ async def black_white_image(
     :return: Response containing information about the modified image.
     :rtype: ImageAddResponse
     """
+    if background:
+        return await enqueue_job(
+            "images.transform", current_user, idempotency_key,
+            kind="black_white", body=body.model_dump(), user_id=current_user.id,
+        )
     image = await repository_image.black_white_image(
         body=body, db=db, user=current_user
     )
@@ -347,10 +755,15 @@ async def black_white_image(
 
 
 @router.post(
-    "/fade_edges", response_model=ImageAddResponse, status_code=status.HTTP_201_CREATED
+    "/fade_edges",
+    response_model=ImageAddResponse,
+    status_code=status.HTTP_201_CREATED,
+    responses={202: {"model": JobAccepted}},
 )
 async def fade_edges_image(
     body: ImageTransformModel,
+    background: bool = True,
+    idempotency_key: str | None = Header(None),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user),
 ):
@@ -361,6 +774,11 @@ async def fade_edges_image(
 
     :param body: Data for the fade edges transformation.
     :type body: ImageTransformModel
+    :param background: Transform in a background job and answer 202 with its ID, the
+        default; ``false`` waits for the transformation and answers 201.
+    :type background: bool
+    :param idempotency_key: Repeated requests with the same key return the same job.
+    :type idempotency_key: str | None
     :param db: Database session.
     :type db: Session
     :param current_user: Currently authenticated user.
@@ -368,16 +786,14 @@ async def fade_edges_image(
     :return: Response containing information about the modified image.
     :rtype: ImageAddResponse
     """
+    if background:
+        return await enqueue_job(
+            "images.transform", current_user, idempotency_key,
+            kind="fade_edges", body=body.model_dump(), user_id=current_user.id,
+        )
     image = await repository_image.fade_edges_image(body=body, db=db, user=current_user)
     if image is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail=messages.IMAGE_NOT_FOUND
         )
     return image
-
-# @router.get("/list", response_model=list[ImageModel], dependencies=[Depends(all_roles)])
-# async def list_images(skip: int = 0, limit: int = 10, db: AsyncSession = Depends(get_db)):
-#     stmt = select(Image).offset(skip).limit(limit)
-#     result = await db.execute(stmt)
-#     images = result.scalars().all()
-#     return images
\ No newline at end of file
@@ -1,15 +1,16 @@
-from typing import List, Type
+from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.entity.models import User, Tag
 from src.services import auth_service
 from src.repository import tags as repo_tags
 from src.schemas.tag_schemas import TagModel, TagResponse
 from src.conf import messages
 from src.services.auth_service import auth_service
+from src.services.tag_dictionary import tag_dictionary
 
 router = APIRouter(prefix="/tags", tags=["tags"])
 
@@ -48,7 +49,7 @@ async def create_tag(
 @router.get("/by_id/{tag_id}", response_model=TagResponse)
 async def get_tag_by_id(
         tag_id: int,
-        db: AsyncSession = Depends(get_db),
+        db: AsyncSession = Depends(get_read_db),
         current_user: User = Depends(auth_service.get_current_user),
 ) -> Tag | None:
     """
@@ -76,7 +77,7 @@ async def get_tag_by_id(
 @router.get("/by_name/{tag_name}", response_model=TagResponse)
 async def get_tag_by_name(
         tag_name: str,
-        db: AsyncSession = Depends(get_db),
+        db: AsyncSession = Depends(get_read_db),
         current_user: User = Depends(auth_service.get_current_user),
 ) -> Tag | None:
     """
@@ -103,23 +104,28 @@ async def get_tag_by_name(
 
 @router.get("/", response_model=List[TagResponse])
 async def get_all_tags(
-        db: AsyncSession = Depends(get_db),
+        request: Request,
         current_user: User = Depends(auth_service.get_current_user),
-) -> list[Type[Tag]] | None:
+) -> Response:
     """
     Get all tags.
 
-    This endpoint retrieves all tags.
+    This endpoint serves the listing kept by the tag dictionary, already encoded as JSON.
+    A client revalidating with the ETag it got gets a 304 while the tags are unchanged.
 
-    :param db: Database session.
-    :type db: Session
+    :param request: The incoming request.
+    :type request: Request
     :param current_user: The current authenticated user.
     :type current_user: User
     :return: A list of tags.
     :rtype: List[TagResponse]
     """
-    tags = await repo_tags.get_tags(db)
-    return tags
+    listing, etag = await tag_dictionary.listing()
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(listing, media_type="application/json", headers=headers)
 
 
 @router.patch("/{tag_id}", response_model=TagResponse)
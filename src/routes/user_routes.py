@@ -1,43 +1,49 @@
-import pickle
-import cloudinary
-import cloudinary.uploader
-
-from fastapi import APIRouter, File, Depends, UploadFile
+from fastapi import APIRouter, File, Depends, Header, HTTPException, Query, UploadFile, status
 from fastapi_limiter.depends import RateLimiter
 from sqlalchemy.ext.asyncio  import AsyncSession
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 
 from src.schemas.user_schemas import UserResponse
+from src.schemas.photo_schemas import Gallery
+from src.conf import messages
+from src.repository import photos as repository_image
 from src.entity.models import User
 from src.conf.config import config
 from src.services.auth_service import auth_service
+from src.services.storage_service import stage_file, storage
+from src.routes.jobs_routes import enqueue_job
+from src.schemas.job_schemas import JobAccepted
 from src.repository import users as repository_users
 
 
 router = APIRouter(prefix='/users', tags=['users'])
-cloudinary.config(cloud_name=config.CLD_NAME, api_key=config.CLD_API_KEY, api_secret=config.CLD_API_SECRET, secure=True)
 
 @router.get("/me", response_model=UserResponse,
             description='No more than 3 requests per minute',
             dependencies=[Depends(RateLimiter(times=1, seconds=20))])
-async def get_current_user(user: User = Depends(auth_service.get_current_user)):
+async def get_current_user(user: User = Depends(auth_service.get_current_user),
+                           db: AsyncSession = Depends(get_read_db)):
     """
     The get_current_user function is a dependency that will be injected into the
         get_users function. It uses the Depends() class to inject it as a parameter, and
         then returns the user object if it exists.
     
     :param user: User: Specify the type of object that will be returned by the function
+    :param db: AsyncSession: Load the full profile, the cached user only holds the principal
     :return: The user object
     :doc-author: Trelent
     """
-    return user
+    return await repository_users.get_user_by_email(user.email, db)
 
 
 
 @router.patch("/avatar", response_model=UserResponse,
             description='No more than 3 requests per minute',
-            dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+            dependencies=[Depends(RateLimiter(times=1, seconds=20))],
+            responses={202: {"model": JobAccepted}})
 async def get_current_user(file: UploadFile = File(),
+                           background: bool = False,
+                           idempotency_key: str | None = Header(None),
                            user: User = Depends(auth_service.get_current_user),
                            db: AsyncSession = Depends(get_db)):
     """
@@ -47,17 +53,44 @@ async def get_current_user(file: UploadFile = File(),
         is provided, then it simply returns the current user object.
     
     :param file: UploadFile: Get the file that is being uploaded
+    :param background: bool: Upload in a background job and answer 202 with its ID
+    :param idempotency_key: str | None: Repeated requests with the same key return the same job
     :param user: User: Get the current user
     :param db: AsyncSession: Get the database session
     :return: The current user, based on the token
     :doc-author: Trelent
     """
+    if background:
+        # The worker reads the file from JOB_STAGING_DIR, so it must run on this host.
+        path = await stage_file(file.file)
+        return await enqueue_job("users.avatar", user, idempotency_key, user_id=user.id, path=str(path))
     public_id = f"Contacts_Hw_web/{user.email}"
-    res = cloudinary.uploader.upload(file.file, public_id=public_id, overwrite=True)
-    res_url = cloudinary.CloudinaryImage(public_id).build_url(width=250, height=250, crop="fill", version=res.get("version"))
+    res = await storage.upload(file.file, public_id, overwrite=True)
+    res_url = storage.build_url(res["public_id"], res, width=250, height=250, crop="fill")
+
+    user = await repository_users.update_avatar_url(user.email, res_url, db)
+
+    return user
+
 
-    await repository_users.update_avatar_url(user.email, res_url, db)
-    auth_service.cache.set(user.email, pickle.dumps(user))
-    auth_service.cache.expire(user.email, 300)
+@router.get("/{user_id}/images", response_model=Gallery)
+async def get_gallery(user_id: int,
+                      cursor: str | None = None,
+                      limit: int = Query(20, ge=1, le=100),
+                      current_user: User = Depends(auth_service.get_current_user),
+                      db: AsyncSession = Depends(get_read_db)):
+    """
+    The get_gallery function lists the images of a user, newest first, together with
+    their comment and tag counts and the number of images the user has.
 
-    return user
\ No newline at end of file
+    :param user_id: int: The owner of the gallery
+    :param cursor: str | None: next_cursor of the previous page
+    :param limit: int: Maximum number of images in the page
+    :param current_user: User: The current user
+    :param db: AsyncSession: Get the database session
+    :return: One page of the gallery
+    """
+    gallery = await repository_image.get_gallery(db, user_id, cursor, limit)
+    if gallery is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.USER_NOT_FOUND)
+    return gallery
@@ -1,4 +1,6 @@
 import datetime
+from typing import List
+
 from pydantic import BaseModel, Field
 
 
@@ -21,3 +23,19 @@ class CommentsResponse(BaseModel):
 class CommentByUser(BaseModel):
     user_id: int
     comment: str
+
+
+class CommentAuthor(BaseModel):
+    id: int
+    username: str
+    avatar: str | None
+
+
+class CommentItem(CommentsResponse):
+    author: CommentAuthor | None = None
+
+
+class CommentPage(BaseModel):
+    comments: List[CommentItem]
+    next_cursor: str | None = None
+    has_more: bool = False
@@ -0,0 +1,24 @@
+import datetime
+from typing import Any, Literal
+
+from pydantic import BaseModel
+
+JobStatus = Literal["queued", "running", "retrying", "succeeded", "failed"]
+
+
+class JobAccepted(BaseModel):
+    job_id: str
+    status: JobStatus
+    status_url: str
+
+
+class JobResponse(BaseModel):
+    id: str
+    name: str
+    status: JobStatus
+    progress: int
+    attempts: int
+    result: Any = None
+    error: str | None = None
+    created_at: datetime.datetime
+    updated_at: datetime.datetime
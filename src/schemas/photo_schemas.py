@@ -1,4 +1,5 @@
-from typing import List
+import datetime
+from typing import List, Literal
 from pydantic import BaseModel, Field, HttpUrl
 
 from src.schemas.comment_schemas import CommentByUser
@@ -11,12 +12,45 @@ class ImageModel(BaseModel):
     user_id: int
 
 
+class ImageUploadModel(ImageModel):
+    near_duplicate_ids: List[int] = []
+
+
+class SimilarImage(BaseModel):
+    id: int
+    url: str
+    description: str | None
+    user_id: int
+    distance: int
+
+
+class GalleryImage(BaseModel):
+    id: int
+    url: str
+    description: str | None
+    created_at: datetime.datetime
+    comment_count: int
+    tag_count: int
+
+
+class Gallery(BaseModel):
+    user_id: int
+    username: str
+    avatar: str | None
+    image_count: int
+    images: List[GalleryImage]
+    next_cursor: str | None = None
+
+
 class ImageProfile(BaseModel):
+    id: int
     url: str
     description: str | None
-    average_rating: float | None
+    average_rating: float | None = None
     tags: List[str] | None
     comments: List[CommentByUser] | None
+    created_at: datetime.datetime | None = None
+    rank: float | None = None
 
 
 class ImageAddResponse(BaseModel):
@@ -24,6 +58,34 @@ class ImageAddResponse(BaseModel):
     detail: str = "Image has been added"
 
 
+class UploadInitModel(BaseModel):
+    filename: str = Field(max_length=255)
+    size: int = Field(gt=0)
+    description: str | None = Field(default=None, max_length=150)
+    sha256: str | None = Field(default=None, pattern="^[0-9a-fA-F]{64}$")
+
+
+class UploadSessionResponse(BaseModel):
+    upload_id: str
+    size: int
+    chunk_size: int
+    parts_total: int
+    parts_received: List[int]
+
+
+class BatchUploadItem(BaseModel):
+    filename: str | None
+    status: Literal["created", "failed"] = "created"
+    image: ImageUploadModel | None = None
+    detail: str | None = None
+
+
+class BatchUploadResponse(BaseModel):
+    images: List[BatchUploadItem]
+    created: int
+    failed: int
+
+
 class ImageDeleteResponse(BaseModel):
     detail: str = "Image has been deleted"
 
@@ -38,13 +100,18 @@ class ImageURLResponse(BaseModel):
     url: str
 
 
+TransformEngineName = Literal["storage", "local"]
+
+
 class ImageChangeSizeModel(BaseModel):
     id: int
-    width: int = 200
+    width: int = Field(default=200, ge=1, le=4000)
+    engine: TransformEngineName = "storage"
 
 
 class ImageTransformModel(BaseModel):
     id: int
+    engine: TransformEngineName = "storage"
 
 
 class ImageQRResponse(BaseModel):
@@ -52,5 +119,11 @@ class ImageQRResponse(BaseModel):
     qr_code_url: str
 
 
+class QRBulkResponse(BaseModel):
+    images: List[ImageQRResponse]
+    job_id: str | None = None
+
+
 class ImagesByFilter(BaseModel):
-    images: List[ImageProfile]
\ No newline at end of file
+    images: List[ImageProfile]
+    next_cursor: str | None = None
@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import BaseModel, EmailStr, Field, field_validator
 from pydantic_settings import SettingsConfigDict
 from datetime import datetime
@@ -15,3 +17,12 @@ class TagResponse(TagModel):
 
 class AddTag(BaseModel):
     detail: str = "Image tags has been updated"
+
+
+class ImageTagsModel(BaseModel):
+    tags: List[str] = Field(min_length=1, max_length=5)
+
+
+class ImageTagsResponse(BaseModel):
+    image_id: int
+    added: List[str]
@@ -26,6 +26,7 @@ class UserResponse(BaseModel):
     sex: str | None
     role: Role
     avatar: str | None
+    image_count: int = 0
     created_at: datetime
     updated_at: datetime
 
@@ -1,30 +1,37 @@
-import pickle
+import json
 from datetime import datetime, timedelta
 from typing import Optional
 
-import redis
 from fastapi import Depends, HTTPException, status
-from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
+from redis.exceptions import RedisError
 
 from src.database.db import get_db
+from src.entity.models import Role, User
 from src.repository import users as repository_users
 from src.utils import messages
 from src.conf.config import config
+from src.services.cache_service import LRUCache
+from src.services.password_service import password_hasher
+from src.services.redis_service import redis_client
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    hasher = password_hasher
     SECRET_KEY = config.SECRET_KEY_JWT
     ALGORITHM = config.ALGORITHM
-    cache = redis.Redis(host=config.REDIS_DOMAIN, port=config.REDIS_PORT, db=0, password=config.REDIS_PASSWORD)
+    cache = redis_client
+    local_cache = LRUCache(config.AUTH_LOCAL_CACHE_SIZE, config.AUTH_LOCAL_CACHE_TTL)
+    version_cache = LRUCache(config.AUTH_LOCAL_CACHE_SIZE, config.AUTH_LOCAL_CACHE_TTL)
+    PRINCIPAL_TTL = 300
 
-    def verify_password(self, plain_password, hashed_password):
+    async def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function is used to verify a plain-text password against a hashed password.
         The function returns True if the passwords match, and False otherwise.
+        bcrypt runs in the hashing process pool, off the event loop.
 
         :param self: Make the method work for a specific instance of the class
         :param plain_password: Verify the password that is entered by the user
@@ -32,19 +39,32 @@ class Auth:
         :return: True if the plain_password is correct,
         :doc-author: Trelent
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        valid, _ = await self.hasher.verify_and_update(plain_password, hashed_password)
+        return valid
 
-    def get_password_hash(self, password: str):
+    async def verify_and_update_password(self, plain_password, hashed_password):
+        """
+        The verify_and_update_password function verifies a password like verify_password and
+        also returns a new hash when the stored one was made with a different BCRYPT_ROUNDS.
+
+        :param self: Represent the instance of the class
+        :param plain_password: Password entered by the user
+        :param hashed_password: Hash stored in the database
+        :return: (True if the password is correct, new hash to store or None)
+        """
+        return await self.hasher.verify_and_update(plain_password, hashed_password)
+
+    async def get_password_hash(self, password: str):
         """
         The get_password_hash function takes a password and returns the hashed version of it.
-        The hashing algorithm is defined in the config file.
+        The hashing algorithm is defined in the config file, bcrypt runs in the hashing process pool.
 
         :param self: Represent the instance of the class
         :param password: str: Specify the password that is to be hashed
         :return: A hashed password
         :doc-author: Trelent
         """
-        return self.pwd_context.hash(password)
+        return await self.hasher.hash(password)
 
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
@@ -112,16 +132,85 @@ class Auth:
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
+    async def access_token_claims(self, user: User) -> dict:
+        """
+        The access_token_claims function returns the claims that let AUTH_MODE=claims
+            authorize a request without loading the user: uid, role and the current token version.
+
+        :param self: Represent the instance of the class
+        :param user: User: The user the token is issued to
+        :return: The claims to add to the access token payload
+        """
+        try:
+            version = await self.token_version(user.id)
+        except RedisError:
+            # Tokens revoked earlier will reject this one once Redis is back; the user logs in again.
+            version = 0
+        return {"uid": user.id, "role": user.role.name, "ver": version}
+
+    @staticmethod
+    def _version_key(user_id: int) -> str:
+        return f"token_version:{user_id}"
+
+    async def token_version(self, user_id: int) -> int:
+        """
+        The token_version function returns the current access token version of a user.
+            Access tokens carrying an older version are rejected in AUTH_MODE=claims.
+            The value is cached in-process for AUTH_LOCAL_CACHE_TTL seconds.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: ID of the user
+        :return: The token version, 0 if tokens were never revoked
+        :raises RedisError: If Redis can not be reached
+        """
+        version = self.version_cache.get(user_id)
+        if version is None:
+            version = int(await self.cache.get(self._version_key(user_id)) or 0)
+            self.version_cache.set(user_id, version)
+        return version
+
+    async def revoke_tokens(self, user_id: int):
+        """
+        The revoke_tokens function invalidates every access token issued to a user so far
+            by bumping their token version.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: ID of the user
+        :return: Nothing
+        """
+        self.version_cache.delete(user_id)
+        try:
+            await self.cache.incr(self._version_key(user_id))
+        except RedisError:
+            pass
+
+    async def _user_from_claims(self, payload: dict) -> User | None:
+        try:
+            version = await self.token_version(payload["uid"])
+        except RedisError:
+            return None
+        if payload.get("ver", 0) != version:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return User(id=payload["uid"], email=payload["sub"], role=Role[payload["role"]], confirmed=True)
+
     async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         """
         The get_current_user function is a dependency that will be used in the
             protected routes. It takes a token as an argument and returns the user
             associated with that token. If no user is found, it raises an exception.
+            FastAPI caches dependencies per request, so the token is decoded once per request.
+            With AUTH_MODE=claims the user is built from the token claims after a token
+            version check, and the cached principal is only used for tokens without claims
+            or when Redis is unavailable.
 
         :param self: Access the class attributes
         :param token: str: Pass the token that is sent in the request
         :param db: AsyncSession: Get the database session
-        :return: The user object from the database
+        :return: A transient User holding the cached id, email, role and confirmed flag
         :doc-author: Trelent
         """
         credentials_exception = HTTPException(
@@ -142,19 +231,85 @@ class Auth:
         except JWTError as e:
             raise credentials_exception
 
-        user_hash = str(email)
+        user = None
+        if config.AUTH_MODE == "claims" and "uid" in payload:
+            user = await self._user_from_claims(payload)
+        if user is None:
+            principal = await self.get_principal(email, db)
+            if principal is None:
+                raise credentials_exception
+            user = self.user_from_principal(principal)
+        return user
 
-        user = self.cache.get(user_hash)
+    @staticmethod
+    def _principal_key(email: str) -> str:
+        return f"principal:{email}"
 
-        if user is None:
+    async def get_principal(self, email: str, db: AsyncSession) -> dict | None:
+        """
+        The get_principal function returns the id, email, role and confirmed flag of a user.
+            It looks in the in-process cache first, then in Redis, and only then in the database.
+            Redis errors are treated as a cache miss.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user
+        :param db: AsyncSession: Get the database session
+        :return: The principal dict, or None if the user does not exist
+        """
+        principal = self.local_cache.get(email)
+        if principal is not None:
+            return principal
+
+        key = self._principal_key(email)
+        try:
+            cached = await self.cache.get(key)
+        except RedisError:
+            cached = None
+        if cached is not None:
+            principal = json.loads(cached)
+        else:
             user = await repository_users.get_user_by_email(email, db)
             if user is None:
-                raise credentials_exception
-            self.cache.set(user_hash, pickle.dumps(user))
-            self.cache.expire(user_hash, 300)
-        else:
-            user = pickle.loads(user)
-        return user
+                return None
+            principal = {"id": user.id, "email": user.email, "role": user.role.name, "confirmed": user.confirmed}
+            try:
+                await self.cache.set(key, json.dumps(principal), ex=self.PRINCIPAL_TTL)
+            except RedisError:
+                pass
+        self.local_cache.set(email, principal)
+        return principal
+
+    @staticmethod
+    def user_from_principal(principal: dict) -> User:
+        """
+        The user_from_principal function builds a transient User holding only the cached fields.
+            Load the user from the database when other fields are needed.
+
+        :param principal: dict: The cached principal
+        :return: A User that is not attached to any session
+        """
+        return User(
+            id=principal["id"],
+            email=principal["email"],
+            role=Role[principal["role"]],
+            confirmed=principal["confirmed"],
+        )
+
+    async def invalidate_user(self, email: str):
+        """
+        The invalidate_user function drops the cached principal of a user after their role or
+            confirmation changes. Other workers may still serve it from their in-process cache
+            for up to AUTH_LOCAL_CACHE_TTL seconds.
+
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user
+        :return: Nothing
+        """
+        self.local_cache.delete(email)
+        try:
+            await self.cache.delete(self._principal_key(email))
+        except RedisError:
+            pass
 
     def create_email_token(self, data: dict):
         """
@@ -0,0 +1,165 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any
+
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+from src.services.redis_service import redis_client
+
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded in-process cache with least-recently-used eviction and a per-entry TTL.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TwoTierCache:
+    """
+    Cache-aside store with a small in-process LRU in front of Redis.
+
+    Values must be JSON serializable. Keys live under a generation number kept in Redis,
+    so :meth:`invalidate_all` drops every entry on every worker with a single INCR. Local
+    entries expire after ``local_ttl`` seconds, which bounds how long another worker may
+    serve a value invalidated elsewhere. Redis errors are counted and treated as misses.
+    """
+
+    def __init__(self, prefix: str, local_maxsize: int, local_ttl: float, redis_ttl: int):
+        self.prefix = prefix
+        self.redis_ttl = redis_ttl
+        self.local = LRUCache(local_maxsize, local_ttl)
+        self._generation: tuple[float, int] | None = None
+        self._redis_retry_at = 0.0
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "redis_errors": 0}
+
+    def _redis_down(self) -> bool:
+        return time.monotonic() < self._redis_retry_at
+
+    def _redis_failed(self) -> None:
+        self.stats["redis_errors"] += 1
+        self._redis_retry_at = time.monotonic() + config.REDIS_RETRY_SECONDS
+
+    async def _current_generation(self) -> int:
+        if self._generation and self._generation[0] > time.monotonic():
+            return self._generation[1]
+        generation = 0
+        if not self._redis_down():
+            try:
+                generation = int(await redis_client.get(f"{self.prefix}:generation") or 0)
+            except RedisError:
+                self._redis_failed()
+        self._generation = (time.monotonic() + self.local.ttl, generation)
+        return generation
+
+    async def _redis_key(self, key: str) -> str:
+        return f"{self.prefix}:{await self._current_generation()}:{key}"
+
+    async def get(self, key: str):
+        value = self.local.get(key, MISSING)
+        if value is not MISSING:
+            self.stats["local_hits"] += 1
+            return value
+        if not self._redis_down():
+            try:
+                raw = await redis_client.get(await self._redis_key(key))
+            except RedisError:
+                self._redis_failed()
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value)
+                self.stats["redis_hits"] += 1
+                return value
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any, ttl: int | None = None) -> None:
+        ttl = ttl or self.redis_ttl
+        self.local.set(key, value, min(self.local.ttl, ttl))
+        if self._redis_down():
+            return
+        try:
+            await redis_client.set(await self._redis_key(key), json.dumps(value), ex=ttl)
+        except RedisError:
+            self._redis_failed()
+
+    async def delete(self, key: str) -> None:
+        self.local.delete(key)
+        if self._redis_down():
+            return
+        try:
+            await redis_client.delete(await self._redis_key(key))
+        except RedisError:
+            self._redis_failed()
+
+    async def invalidate_all(self) -> None:
+        self.local.clear()
+        self._generation = None
+        if self._redis_down():
+            return
+        try:
+            await redis_client.incr(f"{self.prefix}:generation")
+        except RedisError:
+            self._redis_failed()
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["local_hits"] + self.stats["redis_hits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "local_size": len(self.local),
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+        }
+
+
+image_cache = TwoTierCache(
+    "cache:image", config.CACHE_LOCAL_MAXSIZE, config.CACHE_LOCAL_TTL, config.IMAGE_CACHE_TTL
+)
+search_cache = TwoTierCache(
+    "cache:search", config.CACHE_LOCAL_MAXSIZE, config.CACHE_LOCAL_TTL, config.SEARCH_CACHE_TTL
+)
+
+
+async def invalidate_images(*image_ids: int) -> None:
+    """
+    Forget cached images and every cached search result after a write.
+
+    :param image_ids: IDs of the images whose own cache entries are stale.
+    """
+    for image_id in image_ids:
+        await image_cache.delete(str(image_id))
+    await search_cache.invalidate_all()
@@ -1,9 +1,15 @@
+import asyncio
+import functools
 import hashlib
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple
 
 import cloudinary
 import cloudinary.uploader
+from fastapi import HTTPException, status
+
+from src.conf import messages
 from src.conf.config import config
 
 
@@ -15,51 +21,113 @@ class CloudImage:
         secure=True,
     )
 
+    # Cloudinary's SDK is blocking, so its calls run on a dedicated pool. At most
+    # CLD_UPLOAD_CONCURRENCY calls run at once and at most CLD_UPLOAD_QUEUE_SIZE wait
+    # for a slot; anything beyond that is rejected with 503 instead of piling up.
+    _executor = ThreadPoolExecutor(
+        max_workers=config.CLD_UPLOAD_CONCURRENCY, thread_name_prefix="cloudinary"
+    )
+    _slots = asyncio.Semaphore(config.CLD_UPLOAD_CONCURRENCY)
+    _pending = 0
+
     @staticmethod
     def generate_name_image(email: str) -> str:
         name = hashlib.sha256(email.encode("utf-8")).hexdigest()[:12]
         time = datetime.datetime.now()
         return f"photo_share/{name}{time}"
 
+    @classmethod
+    async def run_blocking(cls, func, *args, **kwargs):
+        """
+        Run a blocking Cloudinary call on the upload pool without stalling the event loop.
+
+        :param func: Cloudinary SDK function.
+        :param args: Positional arguments for the function.
+        :param kwargs: Keyword arguments for the function.
+        :return: Whatever the function returns.
+        :raises HTTPException: 503 if the upload queue is full.
+        """
+        if cls._pending >= config.CLD_UPLOAD_CONCURRENCY + config.CLD_UPLOAD_QUEUE_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=messages.UPLOAD_QUEUE_FULL,
+                headers={"Retry-After": "1"},
+            )
+        cls._pending += 1
+        try:
+            async with cls._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    cls._executor, functools.partial(func, *args, **kwargs)
+                )
+        finally:
+            cls._pending -= 1
+
+    @classmethod
+    def upload_stats(cls) -> dict:
+        in_flight = config.CLD_UPLOAD_CONCURRENCY - cls._slots._value
+        return {
+            "in_flight": in_flight,
+            "queued": cls._pending - in_flight,
+            "concurrency": config.CLD_UPLOAD_CONCURRENCY,
+            "queue_size": config.CLD_UPLOAD_QUEUE_SIZE,
+        }
+
     @staticmethod
     def upload_image(file, public_id: str) -> dict:
         upload_file = cloudinary.uploader.upload(file, public_id=public_id)
         return upload_file
 
+    @classmethod
+    async def upload_image_async(cls, file, public_id: str, **options) -> dict:
+        return await cls.run_blocking(
+            cloudinary.uploader.upload, file, public_id=public_id, **options
+        )
+
     @staticmethod
     def get_url_for_image(public_id, upload_file) -> str:
         src_url = cloudinary.CloudinaryImage(public_id).build_url(
             version=upload_file.get("version")
         )
         return src_url
-       
+
     def delete_img(self, public_id: str):
         cloudinary.uploader.destroy(public_id, resource_type="image")
         return f"{public_id} deleted"
 
-    @staticmethod
-    async def change_size(public_id: str, width: int) -> Tuple[str, str]:
+    async def delete_img_async(self, public_id: str):
+        await self.run_blocking(cloudinary.uploader.destroy, public_id, resource_type="image")
+        return f"{public_id} deleted"
+
+    @classmethod
+    async def change_size(cls, public_id: str, width: int) -> Tuple[str, str]:
         img = cloudinary.CloudinaryImage(public_id).image(
             transformation=[{"width": width, "crop": "pad"}]
         )
         url = img.split('"')
-        upload_image = cloudinary.uploader.upload(url[1], folder="photo_share")
+        upload_image = await cls.run_blocking(
+            cloudinary.uploader.upload, url[1], folder="photo_share"
+        )
         return upload_image["url"], upload_image["public_id"]
 
-    @staticmethod
-    async def fade_edges_image(public_id: str, effect: str = "vignette") -> str:
+    @classmethod
+    async def fade_edges_image(cls, public_id: str, effect: str = "vignette") -> Tuple[str, str]:
         img = cloudinary.CloudinaryImage(public_id).image(effect=effect)
         url = img.split('"')
-        upload_image = cloudinary.uploader.upload(url[1], folder="photo_share")
+        upload_image = await cls.run_blocking(
+            cloudinary.uploader.upload, url[1], folder="photo_share"
+        )
         return upload_image["url"], upload_image["public_id"]
-    
-    @staticmethod
-    async def make_black_white_image(public_id: str, effect: str = "art:audrey"
-    ) -> str:
+
+    @classmethod
+    async def make_black_white_image(cls, public_id: str, effect: str = "art:audrey"
+    ) -> Tuple[str, str]:
         img = cloudinary.CloudinaryImage(public_id).image(effect=effect)
         url = img.split('"')
-        upload_image = cloudinary.uploader.upload(url[1], folder="photo_share")
+        upload_image = await cls.run_blocking(
+            cloudinary.uploader.upload, url[1], folder="photo_share"
+        )
         return upload_image["url"], upload_image["public_id"]
 
 
-image_cloudinary = CloudImage()
\ No newline at end of file
+image_cloudinary = CloudImage()
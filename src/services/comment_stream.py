@@ -0,0 +1,161 @@
+import asyncio
+import contextlib
+import json
+import time
+
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+from src.services.redis_service import redis_client
+
+CHANNEL_PREFIX = "comments:"
+
+
+class Subscription:
+    """
+    One stream connection: a bounded queue of encoded events for one image.
+
+    ``None`` in the queue means the subscriber was dropped for falling behind.
+    """
+
+    def __init__(self, image_id: int):
+        self.image_id = image_id
+        self.queue: asyncio.Queue[str | None] = asyncio.Queue(config.COMMENT_STREAM_QUEUE_SIZE)
+        self.dropped = False
+
+    def offer(self, event: str) -> bool:
+        """
+        Queue an event without waiting. A full queue drops the subscriber: its pending
+        events are discarded and the stream ends, so the client reloads the comments it
+        missed instead of holding memory on the server.
+
+        :return: False if the subscriber was dropped.
+        """
+        if self.dropped:
+            return False
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return False
+
+
+class CommentHub:
+    """
+    Fans comment events out to the streams connected to this worker.
+
+    Events are published to the Redis channel ``comments:<image_id>``. Every worker with
+    subscribers holds one pattern subscription and hands each message to the queues of
+    the streams watching that image, so a comment costs one publish however many clients
+    watch. When Redis is unavailable events are delivered to this worker's streams only.
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self._subscribers: dict[int, set[Subscription]] = {}
+        self._listener: asyncio.Task | None = None
+        self._redis_retry_at = 0.0
+        self.dropped = 0
+
+    def stats(self) -> dict:
+        return {
+            "images": len(self._subscribers),
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "dropped": self.dropped,
+        }
+
+    @contextlib.contextmanager
+    def subscribe(self, image_id: int):
+        """
+        Register a subscription for the duration of a ``with`` block.
+        """
+        subscription = Subscription(image_id)
+        self._subscribers.setdefault(image_id, set()).add(subscription)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        try:
+            yield subscription
+        finally:
+            subscribers = self._subscribers.get(image_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[image_id]
+
+    async def publish(self, image_id: int, event: str, data: dict) -> None:
+        """
+        Send an event to every stream watching the image, on all workers.
+
+        :param image_id: The image the event belongs to.
+        :param event: Event name, e.g. ``created``.
+        :param data: JSON serializable payload.
+        """
+        message = json.dumps({"event": event, "data": data})
+        if time.monotonic() >= self._redis_retry_at:
+            try:
+                await self.redis.publish(f"{CHANNEL_PREFIX}{image_id}", message)
+                return
+            except RedisError as err:
+                print(err)
+                self._redis_retry_at = time.monotonic() + config.REDIS_RETRY_SECONDS
+        self._deliver(image_id, message)
+
+    def _deliver(self, image_id: int, message: str) -> None:
+        payload = json.loads(message)
+        event = f"event: {payload['event']}\ndata: {json.dumps(payload['data'])}\n\n"
+        for subscription in list(self._subscribers.get(image_id, ())):
+            if not subscription.dropped and not subscription.offer(event):
+                self.dropped += 1
+
+    async def _listen(self) -> None:
+        # Runs while this worker has subscribers and reconnects after Redis errors.
+        while self._subscribers:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                while self._subscribers:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None:
+                        continue
+                    channel = message["channel"].decode()
+                    image_id = channel.removeprefix(CHANNEL_PREFIX)
+                    if image_id.isdigit():
+                        self._deliver(int(image_id), message["data"].decode())
+            except RedisError as err:
+                print(err)
+                await asyncio.sleep(config.REDIS_RETRY_SECONDS)
+            finally:
+                with contextlib.suppress(RedisError):
+                    await pubsub.close()
+
+    async def stream(self, image_id: int):
+        """
+        Server-sent events for one image: ``created``, ``updated`` and ``deleted``, a
+        comment line every COMMENT_STREAM_HEARTBEAT seconds so proxies keep the
+        connection open, and a final ``dropped`` event if the client fell behind.
+        """
+        with self.subscribe(image_id) as subscription:
+            yield f"retry: {int(config.REDIS_RETRY_SECONDS * 1000)}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), config.COMMENT_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    yield "event: dropped\ndata: {}\n\n"
+                    return
+                yield event
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._listener
+
+
+comment_hub = CommentHub(redis_client)
@@ -0,0 +1,378 @@
+import asyncio
+import contextlib
+import json
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+from src.services.cache_service import LRUCache
+from src.services.redis_service import redis_client
+
+FINISHED = ("succeeded", "failed")
+
+
+@dataclass
+class Task:
+    name: str
+    func: Callable[..., Awaitable]
+    max_attempts: int
+
+
+class JobContext:
+    """
+    Handed to every task as its first argument, to report progress while it runs.
+    """
+
+    def __init__(self, queue: "JobQueue", job: dict):
+        self.queue = queue
+        self.job = job
+
+    @property
+    def last_attempt(self) -> bool:
+        return self.job["attempts"] >= self.queue.tasks[self.job["name"]].max_attempts
+
+    async def progress(self, percent: int) -> None:
+        self.job["progress"] = max(0, min(100, percent))
+        await self.queue._save(self.job)
+
+
+class JobQueue(ABC):
+    """
+    Background jobs: named tasks run outside the request, with retries and status.
+
+    A route enqueues a job and answers 202 with its ID; ``GET /api/jobs/{job_id}`` then
+    reports its progress. A failed job is retried with exponential backoff, JOB_RETRY_BASE
+    seconds doubled on every attempt, up to the task's ``max_attempts``. An HTTPException
+    with a 4xx status fails the job at once, since retrying cannot help. Enqueueing twice
+    with the same idempotency key returns the first job.
+
+    Task arguments and results must be JSON serializable. Subclasses decide where jobs
+    are stored and run.
+    """
+
+    def __init__(self, tasks: dict[str, Task] | None = None):
+        self.tasks: dict[str, Task] = {} if tasks is None else tasks
+
+    def task(self, name: str, max_attempts: int | None = None):
+        """
+        Register a coroutine function as a task. It is called as
+        ``func(context, **kwargs)`` and its return value becomes the job result.
+        """
+
+        def register(func):
+            self.tasks[name] = Task(name, func, max_attempts or config.JOB_MAX_ATTEMPTS)
+            return func
+
+        return register
+
+    async def enqueue(self, name: str, *, owner_id: int | None = None, idempotency_key: str | None = None,
+                      **kwargs) -> dict:
+        """
+        Queue a job.
+
+        :param name: Name of a registered task.
+        :param owner_id: ID of the user who may read the status of the job.
+        :param idempotency_key: Jobs enqueued with the same key within JOB_RESULT_TTL
+            seconds are the same job.
+        :param kwargs: Arguments of the task.
+        :return: The job.
+        """
+        if name not in self.tasks:
+            raise ValueError(f"Unknown task: {name}")
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "name": name,
+            "kwargs": kwargs,
+            "owner_id": owner_id,
+            "status": "queued",
+            "progress": 0,
+            "attempts": 0,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        if idempotency_key:
+            existing = await self._claim(f"{name}:{idempotency_key}", job["id"])
+            if existing is not None:
+                found = await self.get(existing)
+                if found is not None:
+                    return found
+        await self._save(job)
+        await self._push(job["id"])
+        return job
+
+    async def get(self, job_id: str) -> dict | None:
+        return await self._load(job_id)
+
+    async def run(self, job_id: str) -> None:
+        """
+        Run one attempt of a job and record its outcome.
+        """
+        job = await self._load(job_id)
+        if job is None or job["status"] in FINISHED:
+            return
+        task = self.tasks.get(job["name"])
+        if task is None:
+            job.update(status="failed", error=f"Unknown task: {job['name']}")
+            await self._save(job)
+            return
+        job.update(status="running", attempts=job["attempts"] + 1)
+        await self._save(job)
+        try:
+            result = await asyncio.wait_for(task.func(JobContext(self, job), **job["kwargs"]), config.JOB_TIMEOUT)
+        except Exception as err:
+            job["error"] = err.detail if isinstance(err, HTTPException) else repr(err)
+            permanent = isinstance(err, HTTPException) and err.status_code < 500
+            if permanent or job["attempts"] >= task.max_attempts:
+                job["status"] = "failed"
+                await self._save(job)
+                return
+            delay = min(config.JOB_RETRY_MAX, config.JOB_RETRY_BASE * 2 ** (job["attempts"] - 1))
+            job.update(status="retrying", retry_at=time.time() + delay)
+            await self._save(job)
+            await self._schedule(job_id, delay)
+            return
+        job.update(status="succeeded", progress=100, result=result, error=None)
+        await self._save(job)
+
+    @abstractmethod
+    async def _claim(self, key: str, job_id: str) -> str | None:
+        """
+        Bind an idempotency key to a job unless it is bound already.
+
+        :return: The job the key was already bound to, or None.
+        """
+
+    @abstractmethod
+    async def _save(self, job: dict) -> None:
+        """
+        Store a job, replacing its previous state.
+        """
+
+    @abstractmethod
+    async def _load(self, job_id: str) -> dict | None:
+        """
+        Fetch a stored job.
+        """
+
+    @abstractmethod
+    async def _push(self, job_id: str) -> None:
+        """
+        Make a job ready to run.
+        """
+
+    @abstractmethod
+    async def _schedule(self, job_id: str, delay: float) -> None:
+        """
+        Make a job ready to run after ``delay`` seconds.
+        """
+
+
+class InProcessJobQueue(JobQueue):
+    """
+    Jobs kept in memory and run as tasks of the current event loop, at most
+    JOB_WORKER_CONCURRENCY at a time. Used by tests, and whenever Redis is unavailable.
+    """
+
+    def __init__(self, tasks: dict[str, Task] | None = None):
+        super().__init__(tasks)
+        self._jobs = LRUCache(config.JOB_LOCAL_MAXSIZE, config.JOB_RESULT_TTL)
+        self._keys = LRUCache(config.JOB_LOCAL_MAXSIZE, config.JOB_RESULT_TTL)
+        self._running: set[asyncio.Task] = set()
+        self._slots: asyncio.Semaphore | None = None
+
+    async def _claim(self, key: str, job_id: str) -> str | None:
+        existing = self._keys.get(key)
+        if existing is None:
+            self._keys.set(key, job_id)
+        return existing
+
+    async def _save(self, job: dict) -> None:
+        job["updated_at"] = time.time()
+        self._jobs.set(job["id"], job)
+
+    async def _load(self, job_id: str) -> dict | None:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def _run_limited(self, job_id: str) -> None:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(config.JOB_WORKER_CONCURRENCY)
+        async with self._slots:
+            await self.run(job_id)
+
+    def _start(self, job_id: str) -> None:
+        task = asyncio.get_running_loop().create_task(self._run_limited(job_id))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _push(self, job_id: str) -> None:
+        self._start(job_id)
+
+    async def _schedule(self, job_id: str, delay: float) -> None:
+        asyncio.get_running_loop().call_later(delay, self._start, job_id)
+
+    async def drain(self) -> None:
+        """
+        Wait until every started job has finished, retries scheduled later excluded.
+        """
+        while self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Jobs in Redis, run by worker processes: ``python -m src.worker``.
+
+    ``job:<id>`` holds the job as JSON, ``jobs:queue`` the IDs ready to run and
+    ``jobs:delayed`` the retries by due time. A worker takes a job by moving its ID
+    atomically to its own list ``jobs:processing:<worker>`` with BLMOVE, and removes it
+    there once the attempt is over. Workers renew their deadline in ``jobs:workers``
+    every JOB_WORKER_HEARTBEAT seconds; the jobs of a worker that missed three heartbeats
+    are queued again. When Redis cannot be reached jobs fall back to an
+    :class:`InProcessJobQueue`, so the API keeps working without a worker.
+    """
+
+    QUEUE = "jobs:queue"
+    DELAYED = "jobs:delayed"
+    WORKERS = "jobs:workers"
+    PROCESSING = "jobs:processing:"
+
+    def __init__(self, redis, tasks: dict[str, Task] | None = None):
+        super().__init__(tasks)
+        self.redis = redis
+        self.fallback = InProcessJobQueue(self.tasks)
+        self._redis_retry_at = 0.0
+
+    async def enqueue(self, name: str, **kwargs) -> dict:
+        if time.monotonic() >= self._redis_retry_at:
+            try:
+                return await super().enqueue(name, **kwargs)
+            except RedisError as err:
+                print(err)
+                self._redis_retry_at = time.monotonic() + config.REDIS_RETRY_SECONDS
+        return await self.fallback.enqueue(name, **kwargs)
+
+    async def get(self, job_id: str) -> dict | None:
+        job = await self.fallback.get(job_id)
+        if job is not None or time.monotonic() < self._redis_retry_at:
+            return job
+        try:
+            return await self._load(job_id)
+        except RedisError as err:
+            print(err)
+            return None
+
+    async def _claim(self, key: str, job_id: str) -> str | None:
+        key = f"jobs:key:{key}"
+        if await self.redis.set(key, job_id, nx=True, ex=config.JOB_RESULT_TTL):
+            return None
+        existing = await self.redis.get(key)
+        return existing.decode() if existing else None
+
+    async def _save(self, job: dict) -> None:
+        job["updated_at"] = time.time()
+        await self.redis.set(f"job:{job['id']}", json.dumps(job), ex=config.JOB_RESULT_TTL)
+
+    async def _load(self, job_id: str) -> dict | None:
+        data = await self.redis.get(f"job:{job_id}")
+        return json.loads(data) if data else None
+
+    async def _push(self, job_id: str) -> None:
+        await self.redis.lpush(self.QUEUE, job_id)
+
+    async def _schedule(self, job_id: str, delay: float) -> None:
+        await self.redis.zadd(self.DELAYED, {job_id: time.time() + delay})
+
+    async def _promote(self) -> None:
+        # Due retries and jobs of dead workers go back to the queue. ZREM decides which
+        # worker moves an entry when several see it.
+        now = time.time()
+        for job_id in await self.redis.zrangebyscore(self.DELAYED, 0, now):
+            if await self.redis.zrem(self.DELAYED, job_id):
+                await self.redis.lpush(self.QUEUE, job_id)
+        for worker_id in await self.redis.zrangebyscore(self.WORKERS, 0, now):
+            if await self.redis.zrem(self.WORKERS, worker_id):
+                processing = f"{self.PROCESSING}{worker_id.decode()}"
+                # Back to the end BLMOVE takes from, so they run next.
+                while await self.redis.lmove(processing, self.QUEUE, "RIGHT", "RIGHT"):
+                    pass
+
+    async def _beat(self, worker_id: str) -> None:
+        await self.redis.zadd(self.WORKERS, {worker_id: time.time() + 3 * config.JOB_WORKER_HEARTBEAT})
+
+    async def _heartbeat(self, worker_id: str, stop: asyncio.Event) -> None:
+        # Keeps the worker alive while all its slots are busy with long jobs.
+        while not stop.is_set():
+            try:
+                await self._beat(worker_id)
+            except RedisError as err:
+                print(err)
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(stop.wait(), config.JOB_WORKER_HEARTBEAT)
+
+    async def _run_claimed(self, job_id: str, processing: str, slots: asyncio.Semaphore) -> None:
+        try:
+            await self.run(job_id)
+        except Exception as err:
+            print(err)
+        finally:
+            slots.release()
+            try:
+                await self.redis.lrem(processing, 1, job_id)
+            except RedisError as err:
+                print(err)
+
+    async def work(self, concurrency: int, stop: asyncio.Event) -> None:
+        """
+        Take jobs from the queue and run up to ``concurrency`` of them at a time until
+        ``stop`` is set, then wait for the running ones.
+        """
+        worker_id = uuid.uuid4().hex
+        processing = f"{self.PROCESSING}{worker_id}"
+        slots = asyncio.Semaphore(concurrency)
+        running: set[asyncio.Task] = set()
+        heartbeat = asyncio.create_task(self._heartbeat(worker_id, stop))
+        while not stop.is_set():
+            await slots.acquire()
+            try:
+                # Registered before taking a job, so its jobs can be recovered.
+                await self._beat(worker_id)
+                await self._promote()
+                item = await self.redis.blmove(self.QUEUE, processing, 1, "RIGHT", "LEFT")
+            except RedisError as err:
+                print(err)
+                slots.release()
+                await asyncio.sleep(config.REDIS_RETRY_SECONDS)
+                continue
+            if item is None:
+                slots.release()
+                continue
+            task = asyncio.create_task(self._run_claimed(item.decode(), processing, slots))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        await heartbeat
+        with contextlib.suppress(RedisError):
+            await self.redis.zrem(self.WORKERS, worker_id)
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Create the job queue selected by JOB_QUEUE_BACKEND.
+    """
+    if config.JOB_QUEUE_BACKEND == "inprocess":
+        return InProcessJobQueue()
+    return RedisJobQueue(redis_client)
+
+
+job_queue = get_job_queue()
@@ -0,0 +1,75 @@
+"""
+Tasks of the background job queue. Imported by the API, which enqueues them, and by the
+worker, which runs them.
+"""
+from pathlib import Path
+
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.entity.models import User
+from src.repository import photos as repository_image
+from src.repository import storage_outbox as repository_outbox
+from src.repository import users as repository_users
+from src.schemas.photo_schemas import ImageChangeSizeModel, ImageTransformModel
+from src.services.job_queue import JobContext, job_queue
+from src.services.qr_service import qr_service
+from src.services.storage_service import storage
+
+TRANSFORMS = {
+    "change_size": (repository_image.change_size_image, ImageChangeSizeModel),
+    "fade_edges": (repository_image.fade_edges_image, ImageTransformModel),
+    "black_white": (repository_image.black_white_image, ImageTransformModel),
+}
+
+
+async def drain_storage_outbox() -> int:
+    """
+    Delete every due file of the storage outbox, batch by batch.
+
+    :return: Number of outbox rows handled.
+    """
+    handled = 0
+    while True:
+        async with sessionmanager.session(reraise=True) as db:
+            count = await repository_outbox.drain(db, storage, config.OUTBOX_BATCH_SIZE)
+        handled += count
+        if count < config.OUTBOX_BATCH_SIZE:
+            return handled
+
+
+# The outbox retries failed deletes itself, so a failed drain is not retried.
+@job_queue.task("storage.drain_outbox", max_attempts=1)
+async def drain_outbox(ctx: JobContext) -> dict:
+    return {"handled": await drain_storage_outbox()}
+
+
+@job_queue.task("images.transform")
+async def transform_image(ctx: JobContext, kind: str, body: dict, user_id: int) -> dict:
+    transform, model = TRANSFORMS[kind]
+    async with sessionmanager.session(reraise=True) as db:
+        user = await db.get(User, user_id)
+        response = await transform(body=model(**body), db=db, user=user)
+        return response.model_dump(mode="json")
+
+
+@job_queue.task("images.qr_prerender")
+async def prerender_qrs(ctx: JobContext, urls: list[str]) -> dict:
+    await qr_service.prerender(urls)
+    return {"rendered": min(len(urls), qr_service.cache.maxsize)}
+
+
+@job_queue.task("users.avatar")
+async def update_avatar(ctx: JobContext, user_id: int, path: str) -> dict:
+    try:
+        async with sessionmanager.session(reraise=True) as db:
+            user = await db.get(User, user_id)
+            res = await storage.upload_path(Path(path), f"Contacts_Hw_web/{user.email}", overwrite=True)
+            await ctx.progress(80)
+            url = storage.build_url(res["public_id"], res, width=250, height=250, crop="fill")
+            await repository_users.update_avatar_url(user.email, url, db)
+    except Exception:
+        if ctx.last_attempt:
+            Path(path).unlink(missing_ok=True)
+        raise
+    Path(path).unlink(missing_ok=True)
+    return {"avatar": url}
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from passlib.context import CryptContext
+
+from src.conf.config import config
+
+
+@lru_cache
+def _context(rounds: int) -> CryptContext:
+    # min and max rounds make verify_and_update flag hashes made with any other cost.
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+def hash_password(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+
+def verify_and_update(password: str, hashed: str, rounds: int) -> tuple[bool, str | None]:
+    """
+    Check a password and rehash it when ``hashed`` was made with another cost.
+
+    Runs in the worker processes of :class:`PasswordHasher`.
+
+    :return: Whether the password matches, and the new hash if it should be replaced.
+    """
+    return _context(rounds).verify_and_update(password, hashed)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a pool of worker processes, so a burst of logins never blocks the
+    event loop. At most ``concurrency`` jobs are handed to the pool at once, the rest
+    wait on a semaphore and are reported as the queue depth.
+    """
+
+    def __init__(self, rounds: int, workers: int | None = None, concurrency: int | None = None):
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 1
+        self.concurrency = concurrency or self.workers
+        self._executor: ProcessPoolExecutor | None = None
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._queued = 0
+        self._running = 0
+        self._max_queued = 0
+        self._completed = 0
+        self._wait_seconds = 0.0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def run(self, func, *args):
+        started = time.perf_counter()
+        self._queued += 1
+        self._max_queued = max(self._max_queued, self._queued)
+        dequeued = False
+        try:
+            async with self._slots:
+                self._queued -= 1
+                dequeued = True
+                self._wait_seconds += time.perf_counter() - started
+                self._running += 1
+                try:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self.executor, func, *args)
+                finally:
+                    self._running -= 1
+                    self._completed += 1
+        finally:
+            if not dequeued:
+                self._queued -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self.run(hash_password, password, self.rounds)
+
+    async def verify_and_update(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        return await self.run(verify_and_update, password, hashed, self.rounds)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "concurrency": self.concurrency,
+            "running": self._running,
+            "queued": self._queued,
+            "max_queued": self._max_queued,
+            "completed": self._completed,
+            "avg_wait_ms": round(1000 * self._wait_seconds / self._completed, 2) if self._completed else None,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(config.BCRYPT_ROUNDS, config.HASH_WORKERS, config.HASH_CONCURRENCY)
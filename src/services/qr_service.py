@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+import math
+import time
+from io import BytesIO
+
+import qrcode
+from redis.exceptions import RedisError
+
+from src.conf.config import config
+from src.services.cache_service import LRUCache
+from src.services.redis_service import redis_client
+from src.services.transform_service import transform_engine
+
+
+def render_qr(data: str) -> bytes:
+    """
+    Render a QR code as PNG. Runs in the worker processes of the transform engine.
+    """
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffer = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer)
+    return buffer.getvalue()
+
+
+def qr_path(image_id: int) -> str:
+    return f"/api/images/{image_id}/qr"
+
+
+class QRService:
+    """
+    QR codes of image URLs, rendered on the transform pool and kept as PNG bytes in a
+    bounded LRU, and in Redis for QR_MAX_AGE seconds so codes prerendered by a background
+    job reach every worker.
+
+    A QR code depends on nothing but the URL it encodes, so entries never go stale and
+    the SHA-256 of the URL serves both as cache key and as ETag. Concurrent requests for
+    the same URL share one rendering. When Redis is unavailable codes are rendered locally.
+    """
+
+    def __init__(self, maxsize: int, redis):
+        self.cache = LRUCache(maxsize, math.inf)
+        self.redis = redis
+        self._rendering: dict[str, asyncio.Future] = {}
+        self._redis_retry_at = 0.0
+
+    @staticmethod
+    def etag(url: str) -> str:
+        return f'"{hashlib.sha256(url.encode()).hexdigest()}"'
+
+    async def png(self, url: str) -> bytes:
+        """
+        :param url: URL to encode.
+        :return: The QR code as PNG bytes.
+        """
+        key = self.etag(url)
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+        future = self._rendering.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._render(url, key))
+            self._rendering[key] = future
+            future.add_done_callback(lambda _: self._rendering.pop(key, None))
+        data = await future
+        self.cache.set(key, data)
+        return data
+
+    def _redis_failed(self, err: RedisError) -> None:
+        print(err)
+        self._redis_retry_at = time.monotonic() + config.REDIS_RETRY_SECONDS
+
+    async def _render(self, url: str, key: str) -> bytes:
+        redis_key = f"qr:{key.strip(chr(34))}"
+        redis_up = time.monotonic() >= self._redis_retry_at
+        if redis_up:
+            try:
+                data = await self.redis.get(redis_key)
+                if data is not None:
+                    return data
+            except RedisError as err:
+                self._redis_failed(err)
+                redis_up = False
+        data = await transform_engine.run(render_qr, url)
+        if redis_up:
+            try:
+                await self.redis.set(redis_key, data, ex=config.QR_MAX_AGE)
+            except RedisError as err:
+                self._redis_failed(err)
+        return data
+
+    async def prerender(self, urls: list[str]) -> None:
+        """
+        Render QR codes ahead of their first request, no more than the cache holds.
+
+        :param urls: URLs to encode.
+        """
+        slots = asyncio.Semaphore(transform_engine.workers)
+
+        async def render(url: str) -> None:
+            async with slots:
+                await self.png(url)
+
+        await asyncio.gather(*(render(url) for url in urls[:self.cache.maxsize]))
+
+
+qr_service = QRService(config.QR_CACHE_SIZE, redis_client)
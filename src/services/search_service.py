@@ -0,0 +1,223 @@
+import asyncio
+import re
+from collections import defaultdict
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.entity.models import Image, Tag, Comment, image_m2m_tag
+
+SEARCH_CONFIG = "simple"
+
+# Same weights Postgres uses for the A/B labels of images.search_vector and the C label
+# of comments.search_vector.
+DESCRIPTION_WEIGHT = 1.0
+TAG_WEIGHT = 0.4
+COMMENT_WEIGHT = 0.2
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def supports_full_text(db: AsyncSession) -> bool:
+    """
+    Check whether the session is bound to Postgres, which maintains the search vectors.
+
+    :param db: The asynchronous database session.
+    :return: True if the tsvector/GIN index can be used.
+    """
+    return db.bind is not None and db.bind.dialect.name == "postgresql"
+
+
+def tokenize(text: str | None) -> list[str]:
+    if not text:
+        return []
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """
+    In-process inverted index over image descriptions, tag names and comments.
+
+    It mirrors the Postgres ``images.search_vector`` and ``comments.search_vector``
+    columns for databases without full-text search (SQLite in tests): an image document
+    holds its description and tag names, and every comment is a document of its own, so
+    a comment write touches one comment only. The index is built lazily on the first
+    search and then kept up to date by the repository write functions.
+    """
+
+    def __init__(self):
+        # Document keys are ("image", image_id) and ("comment", image_id, comment_id).
+        self._postings: dict[str, dict[tuple, float]] = defaultdict(dict)
+        self._documents: dict[tuple, dict[str, float]] = {}
+        self._comments: dict[int, set[tuple]] = defaultdict(set)
+        self._comment_keys: dict[int, tuple] = {}
+        self._tags: dict[int, set[str]] = {}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def invalidate(self) -> None:
+        """
+        Drop the whole index; it is rebuilt on the next search.
+        """
+        self._postings.clear()
+        self._documents.clear()
+        self._comments.clear()
+        self._comment_keys.clear()
+        self._tags.clear()
+        self._loaded = False
+
+    def _add_document(self, key: tuple, weights: dict[str, float]) -> None:
+        self._remove_document(key)
+        for token, weight in weights.items():
+            self._postings[token][key] = weight
+        self._documents[key] = dict(weights)
+
+    def _remove_document(self, key: tuple) -> None:
+        for token in self._documents.pop(key, {}):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[token]
+
+    def index(self, image_id: int, description: str | None, tags: list[str]) -> None:
+        """
+        Index the description and tag names of an image. Its comments are kept.
+        """
+        weights: dict[str, float] = defaultdict(float)
+        for token in tokenize(description):
+            weights[token] += DESCRIPTION_WEIGHT
+        for tag_name in tags:
+            for token in tokenize(tag_name):
+                weights[token] += TAG_WEIGHT
+        self._add_document(("image", image_id), weights)
+        self._tags[image_id] = {tag_name.lower() for tag_name in tags}
+
+    def index_comment(self, image_id: int, comment_id: int, comment: str | None) -> None:
+        """
+        Index one comment, replacing its previous text.
+        """
+        self.remove_comment(comment_id)
+        weights: dict[str, float] = defaultdict(float)
+        for token in tokenize(comment):
+            weights[token] += COMMENT_WEIGHT
+        key = ("comment", image_id, comment_id)
+        self._add_document(key, weights)
+        self._comments[image_id].add(key)
+        self._comment_keys[comment_id] = key
+
+    def remove_comment(self, comment_id: int) -> None:
+        key = self._comment_keys.pop(comment_id, None)
+        if key is None:
+            return
+        self._remove_document(key)
+        keys = self._comments.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._comments[key[1]]
+
+    def remove(self, image_id: int) -> None:
+        self._remove_document(("image", image_id))
+        for key in self._comments.pop(image_id, ()):
+            self._remove_document(key)
+            self._comment_keys.pop(key[2], None)
+        self._tags.pop(image_id, None)
+
+    def search(self, keyword: str, tag: str | None = None) -> list[tuple[float, int]]:
+        """
+        Find images whose own document or one of whose comments contains every token
+        of the keyword, like the Postgres query does.
+
+        Only the posting lists of the query tokens are visited, starting from the
+        shortest one, so the cost does not depend on the number of indexed images.
+
+        :param keyword: Search query.
+        :param tag: Optional tag name the images must carry.
+        :return: ``(rank, image_id)`` pairs, best match first. The rank of an image is
+            the rank of its own document plus that of its best matching comment.
+        """
+        tokens = set(tokenize(keyword))
+        if not tokens:
+            return []
+        postings = sorted((self._postings.get(token, {}) for token in tokens), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting.keys()
+            if not candidates:
+                return []
+        if tag:
+            tag = tag.lower()
+            candidates = {key for key in candidates if tag in self._tags.get(key[1], ())}
+        image_ranks: dict[int, float] = defaultdict(float)
+        comment_ranks: dict[int, float] = defaultdict(float)
+        for key in candidates:
+            rank = sum(posting[key] for posting in postings)
+            if key[0] == "image":
+                image_ranks[key[1]] = rank
+            else:
+                comment_ranks[key[1]] = max(comment_ranks[key[1]], rank)
+        ranked = [
+            (image_ranks.get(image_id, 0.0) + comment_ranks.get(image_id, 0.0), image_id)
+            for image_id in image_ranks.keys() | comment_ranks.keys()
+        ]
+        ranked.sort(reverse=True)
+        return ranked
+
+    async def ensure_loaded(self, db: AsyncSession) -> None:
+        """
+        Build the index from the database if it has not been built yet.
+
+        :param db: The asynchronous database session.
+        """
+        if self._loaded:
+            return
+        async with self._lock:
+            if self._loaded:
+                return
+            descriptions = dict((await db.execute(select(Image.id, Image.description))).all())
+            tags = defaultdict(list)
+            result = await db.execute(
+                select(image_m2m_tag.c.image_id, Tag.tag_name).join(
+                    Tag, Tag.id == image_m2m_tag.c.tag_id
+                )
+            )
+            for image_id, tag_name in result:
+                tags[image_id].append(tag_name)
+            for image_id, description in descriptions.items():
+                self.index(image_id, description, tags[image_id])
+            result = await db.execute(select(Comment.image_id, Comment.id, Comment.comment))
+            for image_id, comment_id, comment in result:
+                if image_id in descriptions:
+                    self.index_comment(image_id, comment_id, comment)
+            self._loaded = True
+
+    async def refresh_image(self, db: AsyncSession, image_id: int) -> None:
+        """
+        Re-index the description and tags of one image after a write. Does nothing until
+        the index has been built.
+
+        :param db: The asynchronous database session.
+        :param image_id: The ID of the changed image.
+        """
+        if not self._loaded or image_id is None:
+            return
+        description = (
+            await db.execute(select(Image.description).filter(Image.id == image_id))
+        ).first()
+        if description is None:
+            self.remove(image_id)
+            return
+        tags = await db.execute(
+            select(Tag.tag_name)
+            .join(image_m2m_tag, Tag.id == image_m2m_tag.c.tag_id)
+            .filter(image_m2m_tag.c.image_id == image_id)
+        )
+        self.index(image_id, description[0], list(tags.scalars()))
+
+
+search_index = SearchIndex()
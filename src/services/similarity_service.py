@@ -0,0 +1,155 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import config
+from src.entity.models import Image
+
+HASH_MASK = (1 << 64) - 1
+
+
+def hamming(a: int, b: int) -> int:
+    return ((a ^ b) & HASH_MASK).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes under the Hamming distance.
+
+    Every child hangs off its parent by its distance to it, so by the triangle inequality
+    a query within ``radius`` only descends into children whose edge lies within
+    ``radius`` of the query's own distance. For small radii that is a small part of the
+    tree. Nodes hold every image with the same hash; removing an image leaves its node
+    in place.
+    """
+
+    def __init__(self):
+        self._root: list | None = None
+
+    def add(self, value: int, image_id: int) -> None:
+        # A node is [hash, image ids, {distance: child}].
+        if self._root is None:
+            self._root = [value, {image_id}, {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].add(image_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, {image_id}, {}]
+                return
+            node = child
+
+    def remove(self, value: int, image_id: int) -> None:
+        node = self._root
+        while node is not None:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].discard(image_id)
+                return
+            node = node[2].get(distance)
+
+    def search(self, value: int, radius: int) -> list[tuple[int, int]]:
+        """
+        :return: ``(distance, image_id)`` pairs within ``radius``, closest first.
+        """
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.extend((distance, image_id) for image_id in node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        found.sort()
+        return found
+
+
+class SimilarityIndex:
+    """
+    In-process BK-tree over the perceptual hashes of all images.
+
+    The index is built lazily on the first query. Uploads on this worker add their images
+    directly; images added by other workers are picked up before every query by loading
+    the rows created since the newest one seen, SIMILARITY_SYNC_OVERLAP seconds back.
+    ``created_at`` is the start of the inserting transaction, so a row may commit after
+    newer ones were seen; the overlap reads it anyway, and IDs already in the tree are
+    skipped. Every SIMILARITY_REBUILD_SECONDS the tree is rebuilt from all rows, which
+    also drops images deleted on other workers and any row that committed later still.
+    Until then deleted images may linger in the tree, so callers look the results up in
+    the database.
+    """
+
+    def __init__(self):
+        self._tree = BKTree()
+        self._hashes: dict[int, int] = {}
+        self._seen_at: datetime | None = None
+        self._built_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    def add(self, image_id: int, value: int | None) -> None:
+        if value is None or image_id in self._hashes:
+            return
+        self._tree.add(value, image_id)
+        self._hashes[image_id] = value
+
+    def remove(self, image_id: int) -> None:
+        value = self._hashes.pop(image_id, None)
+        if value is not None:
+            self._tree.remove(value, image_id)
+
+    async def sync(self, db: AsyncSession) -> None:
+        """
+        Add the images stored since the last sync; the first call builds the index, as
+        does the first one SIMILARITY_REBUILD_SECONDS after the last build.
+
+        :param db: The asynchronous database session.
+        """
+        async with self._lock:
+            rebuild = self._built_at is None or time.monotonic() - self._built_at >= config.SIMILARITY_REBUILD_SECONDS
+            query = select(Image.id, Image.phash, Image.created_at).filter(Image.phash.is_not(None))
+            if not rebuild and self._seen_at is not None:
+                query = query.filter(
+                    Image.created_at >= self._seen_at - timedelta(seconds=config.SIMILARITY_SYNC_OVERLAP)
+                )
+            result = (await db.execute(query)).all()
+            if rebuild:
+                self._tree = BKTree()
+                self._hashes = {}
+                self._built_at = time.monotonic()
+            for image_id, value, created_at in result:
+                self.add(image_id, value)
+                if created_at is not None and (self._seen_at is None or created_at > self._seen_at):
+                    self._seen_at = created_at
+
+    async def search(self, db: AsyncSession, value: int, radius: int) -> list[tuple[int, int]]:
+        """
+        Find images whose hash lies within ``radius`` bits of ``value``.
+
+        :param db: The asynchronous database session.
+        :param value: Perceptual hash to look for.
+        :param radius: Largest Hamming distance to report.
+        :return: ``(distance, image_id)`` pairs, closest first.
+        """
+        await self.sync(db)
+        return self._tree.search(value, radius)
+
+    async def search_many(self, db: AsyncSession, values: list[int], radius: int) -> list[list[tuple[int, int]]]:
+        """
+        Like :meth:`search` for several hashes, with a single sync.
+
+        :return: The matches of every value, in the order of ``values``.
+        """
+        await self.sync(db)
+        return [self._tree.search(value, radius) for value in values]
+
+
+similarity_index = SimilarityIndex()
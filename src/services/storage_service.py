@@ -0,0 +1,332 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import urllib.request
+import uuid
+from abc import ABC, abstractmethod
+from io import BytesIO
+from pathlib import Path
+
+import cloudinary
+import cloudinary.api
+import cloudinary.uploader
+from PIL import Image as PILImage, UnidentifiedImageError
+
+from src.conf.config import config
+from src.services.cloudinary_service import CloudImage
+from src.services.transform_service import transform_engine
+
+CHUNK_SIZE = 1024 * 1024
+# Most public_ids Cloudinary's delete_resources accepts in one call.
+CLOUDINARY_DELETE_BATCH = 100
+
+
+def _sha256(source) -> tuple[str, int]:
+    if isinstance(source, (bytes, bytearray)):
+        return hashlib.sha256(source).hexdigest(), len(source)
+    if isinstance(source, Path):
+        with open(source, "rb") as file:
+            return _sha256(file)
+    digest = hashlib.sha256()
+    size = 0
+    start = source.tell()
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+        size += len(chunk)
+    source.seek(start)
+    return digest.hexdigest(), size
+
+
+async def content_hash(source) -> tuple[str, int]:
+    """
+    Hash a file in CHUNK_SIZE reads on a worker thread.
+
+    :param source: Bytes, a path, or a seekable binary file object, rewound afterwards.
+    :return: Hex encoded SHA-256 and size in bytes.
+    """
+    return await asyncio.to_thread(_sha256, source)
+
+
+def _read(file) -> bytes:
+    file.seek(0)
+    data = file.read()
+    file.seek(0)
+    return data
+
+
+async def perceptual_hash(source) -> int | None:
+    """
+    dHash of an image, computed on the transform pool.
+
+    :param source: A path, or a seekable binary file object, rewound afterwards.
+    :return: The hash, or None if the file is not an image.
+    """
+    if isinstance(source, Path):
+        return await transform_engine.dhash(str(source))
+    return await transform_engine.dhash(await asyncio.to_thread(_read, source))
+
+
+def _stage(file) -> Path:
+    directory = Path(config.JOB_STAGING_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / uuid.uuid4().hex
+    with open(path, "wb") as staged:
+        shutil.copyfileobj(file, staged, CHUNK_SIZE)
+    return path
+
+
+async def stage_file(file) -> Path:
+    """
+    Copy an uploaded file to JOB_STAGING_DIR for a background job, which deletes it.
+
+    :param file: Binary file object.
+    :return: Path of the copy.
+    """
+    return await asyncio.to_thread(_stage, file)
+
+
+class StorageBackend(ABC):
+    """
+    Where image bytes live.
+
+    Transformations are plain dicts with an ``op`` key:
+    ``{"op": "resize", "width": 200}``, ``{"op": "vignette"}`` or ``{"op": "grayscale"}``,
+    see :mod:`src.services.transform_service`.
+    """
+
+    name: str
+
+    @abstractmethod
+    async def upload(self, file, public_id: str, **options) -> dict:
+        """
+        Store a file.
+
+        :param file: Binary file object or bytes.
+        :param public_id: Suggested identifier; backends may choose their own.
+        :param options: Backend specific upload options.
+        :return: Upload result with at least ``public_id`` and ``url`` keys.
+        """
+
+    @abstractmethod
+    def build_url(self, public_id: str, upload_result: dict | None = None, **transformation) -> str:
+        """
+        Build the public URL of a stored file.
+        """
+
+    @abstractmethod
+    async def delete(self, public_id: str) -> None:
+        """
+        Remove a stored file.
+        """
+
+    async def delete_many(self, public_ids: list[str]) -> dict[str, str]:
+        """
+        Remove several stored files.
+
+        :return: Error message by public_id of the files that could not be removed.
+        """
+        errors = {}
+        for public_id in public_ids:
+            try:
+                await self.delete(public_id)
+            except Exception as err:
+                errors[public_id] = repr(err)
+        return errors
+
+    async def exists(self, public_id: str) -> bool | None:
+        """
+        Check whether a stored file exists.
+
+        :return: None if the backend cannot tell without a remote call.
+        """
+        return None
+
+    @abstractmethod
+    async def read(self, public_id: str) -> bytes:
+        """
+        Fetch the bytes of a stored file.
+        """
+
+    @abstractmethod
+    async def transform(self, public_id: str, transformation: dict) -> dict:
+        """
+        Store a transformed copy of a file.
+
+        :return: Upload result of the new file, as returned by :meth:`upload`.
+        """
+
+    async def upload_path(self, path: Path, public_id: str, **options) -> dict:
+        """
+        Store a file from disk without loading it into memory.
+
+        :return: Upload result, as returned by :meth:`upload`.
+        """
+        with open(path, "rb") as file:
+            return await self.upload(file, public_id, **options)
+
+    async def transform_local(self, public_id: str, transformation: dict) -> dict:
+        """
+        Store a transformed copy of a file, rendered by the local transform engine.
+
+        The source is read once and the result is written straight back to this backend.
+
+        :return: Upload result of the new file, as returned by :meth:`upload`.
+        """
+        data = await self.read(public_id)
+        result = await transform_engine.transform(data, transformation)
+        return await self.upload(result, f"photo_share/{uuid.uuid4().hex}")
+
+
+class LocalStorage(StorageBackend):
+    """
+    Content-addressed storage on the local filesystem.
+
+    Files are named after the SHA-256 of their bytes (``ab/cd/abcd....png``) under
+    LOCAL_STORAGE_DIR and served from LOCAL_STORAGE_URL, by default the ``/static`` mount.
+    Upload results of bytes already on disk have ``existed`` set.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+
+    def path(self, public_id: str) -> Path:
+        return self.root / public_id
+
+    def _store(self, file) -> dict:
+        if isinstance(file, (bytes, bytearray)):
+            file = BytesIO(file)
+        self.root.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=self.root, delete=False) as tmp:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+        try:
+            with PILImage.open(tmp.name) as image:
+                ext = f".{image.format.lower()}"
+        except (UnidentifiedImageError, OSError):
+            ext = ".bin"
+        hexdigest = digest.hexdigest()
+        public_id = f"{hexdigest[:2]}/{hexdigest[2:4]}/{hexdigest}{ext}"
+        target = self.path(public_id)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        existed = target.exists()
+        if existed:
+            os.remove(tmp.name)
+        else:
+            shutil.move(tmp.name, target)
+        return {
+            "public_id": public_id, "url": self.build_url(public_id), "version": None, "bytes": size,
+            "existed": existed,
+        }
+
+    async def upload(self, file, public_id: str, **options) -> dict:
+        return await asyncio.to_thread(self._store, file)
+
+    def build_url(self, public_id: str, upload_result: dict | None = None, **transformation) -> str:
+        return f"{self.base_url}/{public_id}"
+
+    async def delete(self, public_id: str) -> None:
+        await asyncio.to_thread(self.path(public_id).unlink, missing_ok=True)
+
+    async def exists(self, public_id: str) -> bool | None:
+        return await asyncio.to_thread(self.path(public_id).exists)
+
+    async def read(self, public_id: str) -> bytes:
+        return await asyncio.to_thread(self.path(public_id).read_bytes)
+
+    async def transform(self, public_id: str, transformation: dict) -> dict:
+        return await self.transform_local(public_id, transformation)
+
+
+class CloudinaryStorage(StorageBackend):
+    """
+    Storage on Cloudinary, transformations are rendered by Cloudinary itself.
+    """
+
+    name = "cloudinary"
+
+    async def upload(self, file, public_id: str, **options) -> dict:
+        upload_file = await CloudImage.upload_image_async(file, public_id, **options)
+        return {
+            **upload_file,
+            "public_id": upload_file.get("public_id", public_id),
+            "url": self.build_url(upload_file.get("public_id", public_id), upload_file),
+        }
+
+    async def upload_path(self, path: Path, public_id: str, **options) -> dict:
+        # upload_large sends the file in CLD_CHUNK_SIZE requests instead of one body.
+        upload_file = await CloudImage.run_blocking(
+            cloudinary.uploader.upload_large, str(path), public_id=public_id,
+            chunk_size=config.CLD_CHUNK_SIZE, **options
+        )
+        return {**upload_file, "url": self.build_url(upload_file["public_id"], upload_file)}
+
+    def build_url(self, public_id: str, upload_result: dict | None = None, **transformation) -> str:
+        version = upload_result.get("version") if upload_result else None
+        return cloudinary.CloudinaryImage(public_id).build_url(version=version, **transformation)
+
+    async def delete(self, public_id: str) -> None:
+        await CloudImage.run_blocking(cloudinary.uploader.destroy, public_id, resource_type="image")
+
+    async def delete_many(self, public_ids: list[str]) -> dict[str, str]:
+        errors = {}
+        for start in range(0, len(public_ids), CLOUDINARY_DELETE_BATCH):
+            batch = public_ids[start:start + CLOUDINARY_DELETE_BATCH]
+            try:
+                result = await CloudImage.run_blocking(
+                    cloudinary.api.delete_resources, batch, resource_type="image"
+                )
+            except Exception as err:
+                errors.update((public_id, repr(err)) for public_id in batch)
+                continue
+            deleted = result.get("deleted", {})
+            for public_id in batch:
+                if deleted.get(public_id) not in ("deleted", "not_found"):
+                    errors[public_id] = str(deleted.get(public_id))
+        return errors
+
+    async def read(self, public_id: str) -> bytes:
+        def download() -> bytes:
+            with urllib.request.urlopen(self.build_url(public_id)) as response:
+                return response.read()
+
+        return await CloudImage.run_blocking(download)
+
+    async def transform(self, public_id: str, transformation: dict) -> dict:
+        op = transformation["op"]
+        if op == "resize":
+            crop = {"width": transformation["width"], "crop": "pad"}
+            if transformation.get("height"):
+                crop["height"] = transformation["height"]
+            options = {"transformation": [crop]}
+        elif op == "vignette":
+            options = {"effect": "vignette"}
+        elif op == "grayscale":
+            options = {"effect": "art:audrey"}
+        else:
+            raise ValueError(f"Unknown transformation: {op}")
+        url = cloudinary.CloudinaryImage(public_id).build_url(**options)
+        upload_file = await CloudImage.run_blocking(
+            cloudinary.uploader.upload, url, folder="photo_share"
+        )
+        return {**upload_file, "url": self.build_url(upload_file["public_id"], upload_file)}
+
+
+def get_storage() -> StorageBackend:
+    """
+    Create the storage backend selected by STORAGE_BACKEND.
+    """
+    if config.STORAGE_BACKEND == "local":
+        return LocalStorage(config.LOCAL_STORAGE_DIR, config.LOCAL_STORAGE_URL)
+    return CloudinaryStorage()
+
+
+storage = get_storage()
@@ -0,0 +1,159 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import time
+from typing import Iterable
+
+from redis.exceptions import RedisError
+from sqlalchemy import select
+
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.entity.models import Tag
+from src.services.redis_service import redis_client
+
+CHANNEL = "tags:changed"
+
+
+class TagDictionary:
+    """
+    Every tag of the database interned in this worker: name to ID, ID to name, and the
+    tag listing as ready-made JSON with its ETag.
+
+    The table is read from the primary on first use and again after an invalidation.
+    Creating, renaming or deleting a tag invalidates the dictionary of this worker at
+    once and publishes on ``tags:changed`` for the others. Should a message be lost while
+    Redis is unavailable, a dictionary older than TAG_DICTIONARY_TTL seconds is reloaded
+    anyway. Lookups that miss fall back to one query and never cache the absence, so a
+    tag created on another worker is found before its message arrives.
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+        self._by_name: dict[str, int] = {}
+        self._by_id: dict[int, str] = {}
+        self._listing: bytes = b"[]"
+        self._etag = ""
+        self._loaded_at: float | None = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self._listener: asyncio.Task | None = None
+        self._redis_retry_at = 0.0
+
+    @property
+    def _fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < config.TAG_DICTIONARY_TTL
+
+    async def _ensure(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        if self._fresh:
+            return
+        async with self._lock:
+            while not self._fresh:
+                await self._load()
+
+    async def _load(self) -> None:
+        generation = self._generation
+        async with sessionmanager.read_session(primary=True) as db:
+            rows = (await db.execute(select(Tag.id, Tag.tag_name).order_by(Tag.id))).all()
+        if generation != self._generation:
+            # Invalidated while loading; the rows may predate the change.
+            return
+        self._by_id = {tag_id: name for tag_id, name in rows}
+        self._by_name = {name: tag_id for tag_id, name in rows}
+        self._listing = json.dumps(
+            [{"id": tag_id, "tag_name": name} for tag_id, name in rows], separators=(",", ":")
+        ).encode()
+        self._etag = f'"{hashlib.sha256(self._listing).hexdigest()[:32]}"'
+        self._loaded_at = time.monotonic()
+
+    async def _lookup(self, query) -> tuple[int, str] | None:
+        async with sessionmanager.read_session(primary=True) as db:
+            row = (await db.execute(query)).first()
+        if row is None:
+            return None
+        self._by_id[row.id] = row.tag_name
+        self._by_name[row.tag_name] = row.id
+        return row.id, row.tag_name
+
+    async def get_id(self, name: str) -> int | None:
+        await self._ensure()
+        tag_id = self._by_name.get(name)
+        if tag_id is None:
+            found = await self._lookup(select(Tag.id, Tag.tag_name).filter(Tag.tag_name == name))
+            tag_id = found[0] if found else None
+        return tag_id
+
+    async def get_name(self, tag_id: int) -> str | None:
+        await self._ensure()
+        name = self._by_id.get(tag_id)
+        if name is None:
+            found = await self._lookup(select(Tag.id, Tag.tag_name).filter(Tag.id == tag_id))
+            name = found[1] if found else None
+        return name
+
+    async def known_ids(self, names: Iterable[str]) -> dict[str, int]:
+        """
+        :return: IDs of the names already interned; unknown names are missing.
+        """
+        await self._ensure()
+        return {name: self._by_name[name] for name in names if name in self._by_name}
+
+    async def listing(self) -> tuple[bytes, str]:
+        """
+        :return: All tags as a JSON array ordered by ID, and its ETag.
+        """
+        await self._ensure()
+        return self._listing, self._etag
+
+    def _clear(self) -> None:
+        self._generation += 1
+        self._loaded_at = None
+        self._by_name = {}
+        self._by_id = {}
+
+    async def invalidate(self) -> None:
+        """
+        Reload the dictionary on every worker. Call after committing a change to tags.
+        """
+        self._clear()
+        if time.monotonic() < self._redis_retry_at:
+            return
+        try:
+            await self.redis.publish(CHANNEL, "1")
+        except RedisError as err:
+            print(err)
+            self._redis_retry_at = time.monotonic() + config.REDIS_RETRY_SECONDS
+
+    async def _listen(self) -> None:
+        missed = False
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(CHANNEL)
+                if missed:
+                    # Changes made while unsubscribed were not heard of.
+                    self._clear()
+                    missed = False
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        self._clear()
+            except RedisError as err:
+                print(err)
+                missed = True
+                await asyncio.sleep(config.TAG_DICTIONARY_TTL)
+            finally:
+                with contextlib.suppress(RedisError):
+                    await pubsub.close()
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._listener
+
+
+tag_dictionary = TagDictionary(redis_client)
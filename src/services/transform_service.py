@@ -0,0 +1,147 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image as PILImage, ImageOps, UnidentifiedImageError
+
+from src.conf.config import config
+
+VIGNETTE_STRENGTH = 0.8
+VIGNETTE_INNER_RADIUS = 0.5
+# dHash compares HASH_SIZE + 1 columns per row: HASH_SIZE ** 2 = 64 bits.
+HASH_SIZE = 8
+
+
+def resize(image: PILImage.Image, width: int, height: int | None = None) -> PILImage.Image:
+    """
+    Scale to ``width`` keeping the aspect ratio, or pad into a ``width`` x ``height`` box.
+    """
+    if height:
+        return ImageOps.pad(image, (width, height), PILImage.LANCZOS, color=0)
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), PILImage.LANCZOS)
+
+
+def vignette(image: PILImage.Image) -> PILImage.Image:
+    """
+    Darken the edges of the image with a radial falloff.
+    """
+    if image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGB")
+    pixels = np.asarray(image, dtype=np.float32)
+    height, width = pixels.shape[:2]
+    y = np.linspace(-1.0, 1.0, height, dtype=np.float32)[:, None]
+    x = np.linspace(-1.0, 1.0, width, dtype=np.float32)[None, :]
+    radius = np.sqrt(x * x + y * y) / np.sqrt(2.0)
+    falloff = np.clip((radius - VIGNETTE_INNER_RADIUS) / (1.0 - VIGNETTE_INNER_RADIUS), 0.0, 1.0)
+    factor = 1.0 - VIGNETTE_STRENGTH * falloff * falloff
+    if pixels.ndim == 3:
+        factor = factor[:, :, None].repeat(pixels.shape[2], axis=2)
+        if image.mode == "RGBA":
+            factor[:, :, 3] = 1.0
+    return PILImage.fromarray((pixels * factor).astype(np.uint8), mode=image.mode)
+
+
+def grayscale(image: PILImage.Image) -> PILImage.Image:
+    return ImageOps.grayscale(image)
+
+
+def apply_transformation(image: PILImage.Image, transformation: dict) -> PILImage.Image:
+    op = transformation["op"]
+    if op == "resize":
+        return resize(image, transformation["width"], transformation.get("height"))
+    if op == "vignette":
+        return vignette(image)
+    if op == "grayscale":
+        return grayscale(image)
+    raise ValueError(f"Unknown transformation: {op}")
+
+
+def canonical_spec(transformation: dict, engine: str) -> str:
+    """
+    Serialize a transformation so that equal transformations give equal strings.
+
+    >>> canonical_spec({"width": 200, "op": "resize"}, "local")
+    'engine=local,op=resize,width=200'
+    """
+    items = {**transformation, "engine": engine}
+    return ",".join(f"{key}={items[key]}" for key in sorted(items) if items[key] is not None)
+
+
+def transform_bytes(data: bytes, transformation: dict) -> bytes:
+    """
+    Decode an image, transform it and encode it back in its original format.
+
+    Runs in the worker processes of :class:`TransformEngine`, so it only takes and
+    returns picklable values.
+    """
+    with PILImage.open(BytesIO(data)) as image:
+        image_format = image.format or "PNG"
+        image.load()
+        result = apply_transformation(image, transformation)
+    if image_format == "JPEG" and result.mode not in ("RGB", "L"):
+        result = result.convert("RGB")
+    buffer = BytesIO()
+    result.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def dhash(source: bytes | str) -> int | None:
+    """
+    Difference hash of an image: one bit per pair of horizontally adjacent pixels of a
+    9x8 grayscale thumbnail, set where brightness grows to the right.
+
+    Resized and re-encoded copies keep almost all bits, so the Hamming distance between
+    two hashes measures how alike the images look.
+
+    :param source: Encoded image bytes, or the path of an image file.
+    :return: The hash as a signed 64-bit integer, fit for a BIGINT column, or None if the
+        file is not an image.
+    """
+    try:
+        with PILImage.open(BytesIO(source) if isinstance(source, bytes) else source) as image:
+            # JPEG can decode straight to a fraction of its size.
+            image.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))
+            thumbnail = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), PILImage.LANCZOS)
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big", signed=True)
+
+
+class TransformEngine:
+    """
+    Runs image transformations on a pool of worker processes, so they use every core
+    and never block the event loop.
+    """
+
+    def __init__(self, workers: int | None = None):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor: ProcessPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def transform(self, data: bytes, transformation: dict) -> bytes:
+        return await self.run(transform_bytes, data, transformation)
+
+    async def dhash(self, source: bytes | str) -> int | None:
+        return await self.run(dhash, source)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+transform_engine = TransformEngine(config.TRANSFORM_WORKERS)
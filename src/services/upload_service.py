@@ -0,0 +1,290 @@
+import asyncio
+import hashlib
+import json
+import math
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator
+
+from fastapi import HTTPException, Request, status
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from src.conf import messages
+from src.conf.config import config
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class UploadSession:
+    """
+    A resumable upload staged on disk.
+
+    The file is preallocated as ``data`` and every part is written straight to its offset,
+    so completing the upload needs no assembly step. A received part leaves its SHA-256
+    in ``parts/<number>``, which makes concurrent parts safe without a shared manifest
+    update.
+    """
+
+    def __init__(self, directory: Path, manifest: dict):
+        self.directory = directory
+        self.manifest = manifest
+
+    @property
+    def id(self) -> str:
+        return self.manifest["upload_id"]
+
+    @property
+    def data_path(self) -> Path:
+        return self.directory / "data"
+
+    @property
+    def parts_total(self) -> int:
+        return math.ceil(self.manifest["size"] / self.manifest["chunk_size"])
+
+    def part_size(self, number: int) -> int:
+        chunk_size = self.manifest["chunk_size"]
+        return min(chunk_size, self.manifest["size"] - number * chunk_size)
+
+    def parts_received(self) -> list[int]:
+        return sorted(int(path.name) for path in (self.directory / "parts").iterdir())
+
+    def describe(self) -> dict:
+        return {
+            "upload_id": self.id,
+            "size": self.manifest["size"],
+            "chunk_size": self.manifest["chunk_size"],
+            "parts_total": self.parts_total,
+            "parts_received": self.parts_received(),
+        }
+
+
+class ChunkedUploads:
+    """
+    Init, upload part N, complete: chunked and resumable image uploads.
+
+    Sessions live in UPLOAD_STAGING_DIR. Every worker that may receive a part must see
+    that directory, which holds for all workers of one host.
+    """
+
+    def __init__(self, root: str, chunk_size: int, max_size: int, ttl: int):
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.ttl = ttl
+
+    def check_size(self, size: int | None) -> None:
+        if size is not None and size > self.max_size:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=messages.UPLOAD_TOO_LARGE
+            )
+
+    def _create(self, manifest: dict) -> UploadSession:
+        directory = self.root / manifest["upload_id"]
+        (directory / "parts").mkdir(parents=True)
+        with open(directory / "data", "wb") as data:
+            data.truncate(manifest["size"])
+        (directory / "manifest.json").write_text(json.dumps(manifest))
+        return UploadSession(directory, manifest)
+
+    async def init(self, user_id: int, filename: str, size: int, description: str | None,
+                   sha256: str | None = None) -> UploadSession:
+        """
+        Start an upload. Oversized files are rejected here, before any byte is sent.
+
+        :param user_id: Owner of the upload.
+        :param filename: Original file name.
+        :param size: Size of the whole file in bytes.
+        :param description: Description of the future image.
+        :param sha256: Optional checksum of the whole file, verified on completion.
+        :return: The new session.
+        """
+        self.check_size(size)
+        await asyncio.to_thread(self.remove_expired)
+        manifest = {
+            "upload_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "filename": filename,
+            "size": size,
+            "chunk_size": self.chunk_size,
+            "description": description,
+            "sha256": sha256,
+            "created_at": time.time(),
+        }
+        return await asyncio.to_thread(self._create, manifest)
+
+    def _load(self, upload_id: str) -> UploadSession | None:
+        directory = self.root / upload_id
+        try:
+            manifest = json.loads((directory / "manifest.json").read_text())
+        except (OSError, ValueError):
+            return None
+        return UploadSession(directory, manifest)
+
+    async def get(self, upload_id: str, user_id: int) -> UploadSession:
+        session = None
+        if upload_id.isalnum():
+            session = await asyncio.to_thread(self._load, upload_id)
+        if session is None or session.manifest["user_id"] != user_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.UPLOAD_NOT_FOUND)
+        return session
+
+    @staticmethod
+    def _write(path: Path, offset: int, data: bytes) -> None:
+        with open(path, "r+b") as file:
+            file.seek(offset)
+            file.write(data)
+
+    async def write_part(self, session: UploadSession, number: int, content_length: int | None,
+                         checksum: str, chunks: AsyncIterator[bytes]) -> None:
+        """
+        Stream one part to its place in the staged file, holding at most
+        WRITE_BUFFER_SIZE bytes in memory.
+
+        :param session: The upload.
+        :param number: Zero-based part number.
+        :param content_length: Content-Length of the request, checked before reading the body.
+        :param checksum: Expected SHA-256 of the part, hex encoded.
+        :param chunks: The request body.
+        """
+        if not 0 <= number < session.parts_total:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.INVALID_PART)
+        expected = session.part_size(number)
+        if content_length is not None and content_length != expected:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.CHUNK_SIZE_MISMATCH)
+
+        # A resent part is not received until its new bytes check out.
+        (session.directory / "parts" / str(number)).unlink(missing_ok=True)
+        offset = number * session.manifest["chunk_size"]
+        digest = hashlib.sha256()
+        received = 0
+        buffer = bytearray()
+        async for chunk in chunks:
+            received += len(chunk)
+            if received > expected:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.CHUNK_SIZE_MISMATCH)
+            digest.update(chunk)
+            buffer += chunk
+            if len(buffer) >= WRITE_BUFFER_SIZE:
+                await asyncio.to_thread(self._write, session.data_path, offset, bytes(buffer))
+                offset += len(buffer)
+                buffer.clear()
+        if buffer:
+            await asyncio.to_thread(self._write, session.data_path, offset, bytes(buffer))
+        if received != expected:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.CHUNK_SIZE_MISMATCH)
+        if digest.hexdigest() != checksum.lower():
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.CHUNK_CHECKSUM_MISMATCH)
+        (session.directory / "parts" / str(number)).write_text(digest.hexdigest())
+
+    @staticmethod
+    def _file_sha256(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(WRITE_BUFFER_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    async def check_complete(self, session: UploadSession) -> str | None:
+        """
+        Check that every part has arrived and, if given at init, the checksum of the whole file.
+
+        :return: SHA-256 of the whole file when it was checked, else None.
+        """
+        if len(session.parts_received()) != session.parts_total:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=messages.UPLOAD_INCOMPLETE)
+        expected = session.manifest.get("sha256")
+        if not expected:
+            return None
+        if await asyncio.to_thread(self._file_sha256, session.data_path) != expected.lower():
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.CHUNK_CHECKSUM_MISMATCH)
+        return expected.lower()
+
+    async def discard(self, session: UploadSession) -> None:
+        await asyncio.to_thread(shutil.rmtree, session.directory, True)
+
+    def remove_expired(self) -> None:
+        if not self.root.exists():
+            return
+        deadline = time.time() - self.ttl
+        for directory in self.root.iterdir():
+            try:
+                # Receiving a part touches parts/, so its mtime is the last activity.
+                last_activity = max(directory.stat().st_mtime, (directory / "parts").stat().st_mtime)
+            except OSError:
+                last_activity = 0
+            if last_activity < deadline:
+                shutil.rmtree(directory, ignore_errors=True)
+
+
+class UploadLimitExceeded(MultiPartException):
+    pass
+
+
+class BatchFormParser(MultiPartParser):
+    """
+    Multipart parser enforcing the batch upload limits while the body streams in: at most
+    BATCH_UPLOAD_MAX_FILES files of at most MAX_UPLOAD_SIZE bytes each. Parsing stops at
+    the first file over a limit, before the rest of the body is spooled.
+    """
+
+    def __init__(self, headers, stream):
+        super().__init__(headers, stream, max_files=math.inf)
+        self._current_size = 0
+
+    def on_headers_finished(self) -> None:
+        super().on_headers_finished()
+        self._current_size = 0
+        if self._current_part.file is not None and self._current_files > config.BATCH_UPLOAD_MAX_FILES:
+            raise UploadLimitExceeded(messages.TOO_MANY_FILES)
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._current_part.file is not None:
+            self._current_size += end - start
+            if self._current_size > config.MAX_UPLOAD_SIZE:
+                raise UploadLimitExceeded(messages.UPLOAD_TOO_LARGE)
+        super().on_part_data(data, start, end)
+
+
+async def read_batch_files(request: Request, field: str = "files") -> list[UploadFile]:
+    """
+    Parse the files of a batch upload, see :class:`BatchFormParser`.
+
+    :param request: The multipart request.
+    :param field: Name of the form field holding the files.
+    :return: The uploaded files, spooled like those of ``File()``.
+    """
+    try:
+        form = await BatchFormParser(request.headers, request.stream()).parse()
+    except UploadLimitExceeded as err:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=err.message)
+    except (MultiPartException, KeyError) as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=getattr(err, "message", str(err)))
+    files = [file for file in form.getlist(field) if isinstance(file, UploadFile)]
+    if not files:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=messages.NO_FILES)
+    return files
+
+
+# Multipart framing and form fields around the file of a single-request upload.
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def request_size_limit(path: str) -> int | None:
+    """
+    Largest Content-Length accepted on an upload path, so oversized bodies are refused
+    from the headers before they are read. Bodies without Content-Length are refused
+    on these paths.
+    """
+    if path == "/api/images/upload":
+        return config.MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD
+    if path == "/api/images/upload/batch":
+        return config.BATCH_UPLOAD_MAX_BYTES
+    return None
+
+
+chunked_uploads = ChunkedUploads(
+    config.UPLOAD_STAGING_DIR, config.UPLOAD_CHUNK_SIZE, config.MAX_UPLOAD_SIZE, config.UPLOAD_SESSION_TTL
+)
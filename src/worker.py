@@ -0,0 +1,42 @@
+"""
+Background job worker, which also drains the storage outbox every OUTBOX_POLL_SECONDS:
+
+    python -m src.worker
+"""
+import asyncio
+import signal
+
+from src.conf.config import config
+from src.services.jobs import drain_storage_outbox
+from src.services.job_queue import RedisJobQueue, job_queue
+from src.services.transform_service import transform_engine
+
+
+async def poll_outbox(stop: asyncio.Event) -> None:
+    # Catches retries that are due and deletes scheduled while Redis was down.
+    while not stop.is_set():
+        try:
+            await drain_storage_outbox()
+        except Exception as err:
+            print(err)
+        try:
+            await asyncio.wait_for(stop.wait(), config.OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main() -> None:
+    if not isinstance(job_queue, RedisJobQueue):
+        raise SystemExit("The worker needs JOB_QUEUE_BACKEND=redis")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await asyncio.gather(job_queue.work(config.JOB_WORKER_CONCURRENCY, stop), poll_outbox(stop))
+    finally:
+        transform_engine.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
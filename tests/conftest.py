@@ -0,0 +1,9 @@
+import asyncio
+import os
+import tempfile
+
+os.environ["DB_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db"
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
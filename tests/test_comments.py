@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.database.db import sessionmanager
+from src.entity.models import Base, Comment, Image, Role, User
+from src.repository.comments import get_comments
+from tests.conftest import run
+
+NOON = datetime(2026, 10, 17, 12)
+
+
+async def _reset():
+    async with sessionmanager._engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with sessionmanager.session(reraise=True) as db:
+        user = User(username="alice", email="alice@example.com", password="x", confirmed=True, role=Role.admin)
+        db.add(user)
+        await db.flush()
+        db.add(Image(id=1, url="u1", public_id="p1", description="harbour", user_id=user.id))
+        await db.commit()
+
+
+@pytest.fixture(autouse=True)
+def database():
+    run(_reset())
+    yield
+    run(sessionmanager._engine.dispose())
+
+
+async def _add(*offsets):
+    async with sessionmanager.session(reraise=True) as db:
+        comments = [
+            Comment(comment=f"c{offset}", image_id=1, user_id=1, created_at=NOON + timedelta(seconds=offset))
+            for offset in offsets
+        ]
+        db.add_all(comments)
+        await db.flush()
+        ids = [comment.id for comment in comments]
+        await db.commit()
+        return ids
+
+
+async def _page(cursor=None, limit=50):
+    async with sessionmanager.session(reraise=True) as db:
+        return await get_comments(db, 1, cursor, limit)
+
+
+def _ids(page):
+    return [comment.id for comment in page.comments]
+
+
+def test_pages_cover_thread_once():
+    async def scenario():
+        ids = await _add(0, 0, 0, 1, 2, 2, 30)
+        pages, cursor = [], None
+        while True:
+            page = await _page(cursor, limit=2)
+            pages += _ids(page)
+            cursor = page.next_cursor
+            if not page.has_more:
+                break
+        assert pages == ids
+        assert _ids(await _page(cursor)) == []
+
+    run(scenario())
+
+
+def test_late_commit_behind_cursor_is_returned_once():
+    async def scenario():
+        await _add(0, 10)
+        page = await _page()
+        late, = await _add(8)
+        page = await _page(page.next_cursor)
+        assert _ids(page) == [late]
+        assert _ids(await _page(page.next_cursor)) == []
+
+    run(scenario())
+
+
+def test_image_without_comments():
+    page = run(_page())
+    assert page.comments == [] and page.next_cursor is None
+    assert run(_page_of(2)) is None
+
+
+async def _page_of(image_id):
+    async with sessionmanager.session(reraise=True) as db:
+        return await get_comments(db, image_id)
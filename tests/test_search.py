@@ -0,0 +1,112 @@
+from datetime import datetime
+
+import pytest
+
+from src.database.db import sessionmanager
+from src.entity.models import Base, Comment, Image, Role, Tag, User
+from src.repository import comments as repository_comments
+from src.repository.photos import _search_images
+from src.services.search_service import search_index
+from src.services.tag_dictionary import tag_dictionary
+from tests.conftest import run
+
+
+async def _reset():
+    async with sessionmanager._engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with sessionmanager.session(reraise=True) as db:
+        user = User(username="alice", email="alice@example.com", password="x", confirmed=True, role=Role.admin)
+        db.add(user)
+        await db.flush()
+        sunset = Tag(tag_name="sunset")
+        noon, evening = datetime(2026, 10, 17, 12), datetime(2026, 10, 17, 18)
+        db.add_all([
+            Image(id=1, url="u1", public_id="p1", description="harbour at night", user_id=user.id, tags=[sunset],
+                  created_at=noon),
+            Image(id=2, url="u2", public_id="p2", description="mountain lake", user_id=user.id, tags=[sunset],
+                  created_at=evening),
+            Image(id=3, url="u3", public_id="p3", description="city street", user_id=user.id, created_at=evening),
+        ])
+        await db.flush()
+        db.add_all([
+            Comment(comment="lovely harbour", image_id=3, user_id=user.id),
+            Comment(comment="the lake", image_id=3, user_id=user.id),
+            Comment(comment="at night", image_id=3, user_id=user.id),
+        ])
+        await db.commit()
+    search_index.invalidate()
+    await tag_dictionary.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def database():
+    run(_reset())
+    yield
+    search_index.invalidate()
+    run(sessionmanager._engine.dispose())
+
+
+async def _search(keyword=None, tag=None, cursor=None, limit=20):
+    async with sessionmanager.session(reraise=True) as db:
+        return await _search_images(db, keyword, tag, cursor, limit)
+
+
+def _ids(page):
+    return [image.id for image in page.images]
+
+
+def test_description_ranks_above_comment():
+    page = run(_search("harbour"))
+    assert _ids(page) == [1, 3]
+    assert page.images[0].rank > page.images[1].rank
+
+
+def test_tag_name_is_searched():
+    assert sorted(_ids(run(_search("sunset")))) == [1, 2]
+
+
+def test_all_tokens_must_be_in_one_comment():
+    assert _ids(run(_search("lake night"))) == []
+    assert _ids(run(_search("lovely harbour"))) == [3]
+
+
+def test_keyword_with_tag_filter():
+    assert _ids(run(_search("harbour", tag="sunset"))) == [1]
+    assert _ids(run(_search("harbour", tag="missing"))) == []
+
+
+def test_keyword_pages_follow_cursor():
+    first = run(_search("harbour", limit=1))
+    assert _ids(first) == [1]
+    second = run(_search("harbour", cursor=first.next_cursor, limit=1))
+    assert _ids(second) == [3]
+    assert second.next_cursor is None
+
+
+def test_pages_without_keyword():
+    first = run(_search(limit=2))
+    assert _ids(first) == [3, 2]
+    second = run(_search(cursor=first.next_cursor, limit=2))
+    assert _ids(second) == [1]
+    assert second.next_cursor is None
+
+
+def test_comment_writes_update_index():
+    async def scenario():
+        assert _ids(await _search("waves")) == []
+        async with sessionmanager.session(reraise=True) as db:
+            user = await db.get(User, 1)
+            comment = await repository_comments.create_comment(db, 2, "waves", user)
+        assert _ids(await _search("waves")) == [2]
+        async with sessionmanager.session(reraise=True) as db:
+            user = await db.get(User, 1)
+            await repository_comments.update_comment(db, comment.id, "calm water", user)
+        assert _ids(await _search("waves")) == []
+        assert _ids(await _search("calm")) == [2]
+        async with sessionmanager.session(reraise=True) as db:
+            user = await db.get(User, 1)
+            await repository_comments.delete_comment(db, comment.id, user)
+        assert _ids(await _search("calm")) == []
+
+    run(scenario())